@@ -3,6 +3,7 @@ namespace PB_LTI\Controllers;
 
 use Firebase\JWT\JWT;
 use PB_LTI\Services\ContentService;
+use PB_LTI\Services\LineItemCache;
 
 class DeepLinkController {
 
@@ -46,12 +47,13 @@ class DeepLinkController {
             wp_die('Invalid Deep Linking request: missing required parameters');
         }
 
-        // Get all books
-        $books = ContentService::get_all_books();
+        // First page of books; the picker loads more and searches via AJAX
+        $catalog = ContentService::search_books();
 
         // Prepare data for picker view
         $data = [
-            'books' => $books,
+            'books' => $catalog['books'],
+            'books_total' => $catalog['total'],
             'return_url' => $return_url,
             'client_id' => $client_id,
             'deployment_id' => $deployment_id
@@ -72,12 +74,13 @@ class DeepLinkController {
      * Show content picker interface
      */
     private static function show_content_picker($request) {
-        // Get all books in the network
-        $books = ContentService::get_all_books();
+        // First page of books; the picker loads more and searches via AJAX
+        $catalog = ContentService::search_books();
 
         // Prepare data for view
         $data = [
-            'books' => $books,
+            'books' => $catalog['books'],
+            'books_total' => $catalog['total'],
             'return_url' => $request->get_param('deep_link_return_url'),
             'client_id' => $request->get_param('client_id'),
             'deployment_id' => $request->get_param('deployment_id')
@@ -143,12 +146,7 @@ class DeepLinkController {
             $chapter_ids = array_map('intval', explode(',', $selected_chapter_ids));
             error_log('[PB-LTI Deep Link] Selected chapters (IDs: ' . implode(', ', $chapter_ids) . ') from book ' . $book_id);
 
-            foreach ($chapter_ids as $chapter_id) {
-                $chapter_item = ContentService::get_content_item($book_id, $chapter_id);
-                if ($chapter_item) {
-                    $content_items[] = $chapter_item;
-                }
-            }
+            $content_items = ContentService::get_content_items($book_id, $chapter_ids);
 
             error_log('[PB-LTI Deep Link] Created ' . count($content_items) . ' activities for selected chapters');
         } elseif (empty($content_id)) {
@@ -160,32 +158,14 @@ class DeepLinkController {
                 return new \WP_Error('no_chapters', 'No chapters found in selected book', ['status' => 404]);
             }
 
-            // Create content item for each chapter
-            foreach ($book_structure['chapters'] as $chapter) {
-                $chapter_item = ContentService::get_content_item($book_id, $chapter['id']);
-                if ($chapter_item) {
-                    $content_items[] = $chapter_item;
-                }
-            }
-
-            // Also include front matter and back matter if they exist
-            if (!empty($book_structure['front_matter'])) {
-                foreach ($book_structure['front_matter'] as $item) {
-                    $front_item = ContentService::get_content_item($book_id, $item['id']);
-                    if ($front_item) {
-                        array_unshift($content_items, $front_item);  // Add to beginning
-                    }
-                }
-            }
+            // Front matter, chapters, then back matter, in book order (IDs from the cached tree)
+            $post_ids = array_column(array_merge(
+                $book_structure['front_matter'] ?? [],
+                $book_structure['chapters'],
+                $book_structure['back_matter'] ?? []
+            ), 'id');
 
-            if (!empty($book_structure['back_matter'])) {
-                foreach ($book_structure['back_matter'] as $item) {
-                    $back_item = ContentService::get_content_item($book_id, $item['id']);
-                    if ($back_item) {
-                        $content_items[] = $back_item;  // Add to end
-                    }
-                }
-            }
+            $content_items = ContentService::get_content_items($book_id, $post_ids);
 
             error_log('[PB-LTI Deep Link] Created ' . count($content_items) . ' activities for whole book');
         } else {
@@ -207,6 +187,13 @@ class DeepLinkController {
             return new \WP_Error('no_content', 'No valid content items found', ['status' => 404]);
         }
 
+        // Remember declared lineItems so the first launch can seed LineItemCache
+        foreach ($content_items as $item) {
+            if (!empty($item['lineItem'])) {
+                LineItemCache::remember_declared($item['lineItem']);
+            }
+        }
+
         // Build Deep Linking JWT response
         // CRITICAL: For Moodle compatibility:
         // - iss MUST be the client_id (tool's identifier in the platform)
@@ -3,8 +3,12 @@ namespace PB_LTI\Controllers;
 
 use PB_LTI\Services\JwtValidator;
 use PB_LTI\Services\NonceService;
+use PB_LTI\Services\OidcState;
+use PB_LTI\Services\UrlResolutionCache;
 use PB_LTI\Services\DeploymentRegistry;
 use PB_LTI\Services\RoleMapper;
+use PB_LTI\Services\LineItemCache;
+use PB_LTI\Services\LaunchContext;
 
 class LaunchController {
     public static function handle($request) {
@@ -15,12 +19,19 @@ class LaunchController {
 
         $claims = JwtValidator::validate($jwt);
 
+        try {
+            OidcState::verify($request->get_param('state'), $claims);
+        } catch (\Exception $e) {
+            error_log('[PB-LTI] State verification failed: ' . $e->getMessage());
+            return new \WP_Error('invalid_state', $e->getMessage(), ['status'=>401]);
+        }
+
         DeploymentRegistry::validate(
             $claims->iss,
             $claims->{'https://purl.imsglobal.org/spec/lti/claim/deployment_id'}
         );
 
-        NonceService::consume($claims->nonce);
+        NonceService::consume($claims->nonce, isset($claims->exp) ? (int)$claims->exp : null);
 
         // Check message type - handle Deep Linking requests differently
         $message_type = $claims->{'https://purl.imsglobal.org/spec/lti/claim/message_type'} ?? 'LtiResourceLinkRequest';
@@ -52,28 +63,20 @@ class LaunchController {
             update_user_meta($user_id, '_lti_platform_issuer', $claims->iss);
             update_user_meta($user_id, '_lti_user_id', $claims->sub); // LTI user ID for grade posting
 
-            // Store chapter-specific AGS context (user + post level)
+            // Store chapter-specific AGS context (user + post level) - one row, no blog switch
             if ($post_id) {
-                // Switch to target blog to update post meta
-                if (is_multisite() && $blog_id != get_current_blog_id()) {
-                    switch_to_blog($blog_id);
-                }
-
-                // Use post meta to store per-user, per-chapter lineitem
-                $lineitem_key = '_lti_ags_lineitem_user_' . $user_id;
-                update_post_meta($post_id, $lineitem_key, $ags_claim->lineitem);
-
-                // Also store scope and resource link for this specific chapter
-                $scope_key = '_lti_ags_scope_user_' . $user_id;
-                update_post_meta($post_id, $scope_key, $ags_claim->scope ?? []);
-
-                $resource_link_key = '_lti_resource_link_id_user_' . $user_id;
-                $resource_link_id = $claims->{'https://purl.imsglobal.org/spec/lti/claim/resource_link'}->id ?? '';
-                update_post_meta($post_id, $resource_link_key, $resource_link_id);
-
-                if (is_multisite()) {
-                    restore_current_blog();
-                }
+                LaunchContext::save(
+                    $blog_id,
+                    $post_id,
+                    $user_id,
+                    $claims->iss,
+                    $ags_claim->lineitem,
+                    (array)($ags_claim->scope ?? []),
+                    $claims->{'https://purl.imsglobal.org/spec/lti/claim/resource_link'}->id ?? ''
+                );
+
+                // Warm lineitem metadata so grade sync can skip the lineitem GET
+                LineItemCache::prime_from_launch($claims->iss, $ags_claim->lineitem, 'pb_chapter_' . $blog_id . '_' . $post_id);
             } else {
                 // Fall back to old behavior (store in user meta) for non-post launches
                 update_user_meta($user_id, '_lti_ags_lineitem', $ags_claim->lineitem);
@@ -93,10 +96,27 @@ class LaunchController {
     /**
      * Resolve URL to post_id and blog_id (handles WordPress multisite)
      *
+     * Resolved chapter URLs are cached (UrlResolutionCache), so repeat
+     * launches skip blog lookup and rewrite matching.
+     *
      * @param string $url The URL to resolve
      * @return array Array with post_id and blog_id
      */
     public static function resolve_url($url) {
+        $cached = UrlResolutionCache::get($url);
+        if ($cached) {
+            return $cached;
+        }
+
+        $result = self::resolve_url_uncached($url);
+        if ($result['post_id']) {
+            UrlResolutionCache::set($url, $result['blog_id'], $result['post_id']);
+        }
+
+        return $result;
+    }
+
+    private static function resolve_url_uncached($url) {
         $result = [
             'post_id' => null,
             'blog_id' => get_current_blog_id(),
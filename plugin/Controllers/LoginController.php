@@ -1,6 +1,7 @@
 <?php
 namespace PB_LTI\Controllers;
 
+use PB_LTI\Services\OidcState;
 use PB_LTI\Services\PlatformRegistry;
 
 class LoginController {
@@ -19,9 +20,10 @@ class LoginController {
             return new \WP_Error('unknown_platform', 'Platform not registered', ['status'=>403]);
         }
 
-        $state = wp_generate_password(32, false);
-        $nonce = wp_generate_password(32, false);
-        set_transient('pb_lti_state_' . $state, $nonce, 60);
+        // Transient-backed by default; signed and cookie-bound (no DB write) in stateless mode
+        $oidc = OidcState::issue($platform->issuer);
+        $state = $oidc['state'];
+        $nonce = $oidc['nonce'];
 
         // Build auth URL manually to properly encode lti_message_hint
         $auth_params = array(
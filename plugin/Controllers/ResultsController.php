@@ -124,7 +124,7 @@ class ResultsController {
                                 <label for="chapter-select">Select Chapter:</label>
                                 <select id="chapter-select">
                                     <?php foreach ($chapters as $index => $chapter): ?>
-                                        <option value="<?php echo $chapter['id']; ?>" data-title="<?php echo esc_attr($chapter['title']); ?>" <?php selected($index, 0); ?>>
+                                        <option value="<?php echo $chapter['id']; ?>" data-blog="<?php echo (int)$chapter['blog_id']; ?>" data-title="<?php echo esc_attr($chapter['title']); ?>" <?php selected($index, 0); ?>>
                                             <?php echo esc_html($chapter['title']); ?> (<?php echo $chapter['h5p_count']; ?> activities)
                                         </option>
                                     <?php endforeach; ?>
@@ -139,6 +139,13 @@ class ResultsController {
                             </div>
 
                             <span id="loading-indicator" style="display:none;"><span class="spinner is-active"></span></span>
+
+                            <div id="export-links" style="display:none; margin-left:auto; gap:8px; align-items:center;">
+                                <span style="font-weight:600; color:#334155;">Export:</span>
+                                <a class="button button-small export-link" data-scope="chapter" data-format="csv" href="#">Chapter CSV</a>
+                                <a class="button button-small export-link" data-scope="chapter" data-format="jsonl" href="#">Chapter JSONL</a>
+                                <a class="button button-small export-link" data-scope="book" data-format="csv" href="#">Book CSV</a>
+                            </div>
                         </div>
 
                         <div class="results-display-area">
@@ -149,6 +156,14 @@ class ResultsController {
                                     <div style="margin-bottom:15px; display:flex; justify-content:space-between; align-items:center; background:#f9fafb; padding:15px; border-radius:6px; border:1px solid #e5e7eb;">
                                         <input type="text" id="search-input" placeholder="🔍 Search students by name or email...">
                                         <div style="display:flex; gap:10px; align-items:center;">
+                                            <select id="activity-filter" style="max-width:180px;"><option value="0">All activities</option></select>
+                                            <select id="sort-select">
+                                                <option value="name:asc">Name A–Z</option>
+                                                <option value="name:desc">Name Z–A</option>
+                                                <option value="email:asc">Email</option>
+                                                <option value="score:desc">Highest grade</option>
+                                                <option value="score:asc">Lowest grade</option>
+                                            </select>
                                             <button type="button" class="button button-secondary prev-page">&larr;</button>
                                             <span id="page-info" style="font-weight:600;"></span>
                                             <button type="button" class="button button-secondary next-page">&rarr;</button>
@@ -181,10 +196,82 @@ class ResultsController {
 
             <script>
             jQuery(document).ready(function($) {
-                let allResults = [], page = 1, limit = 10, search = '', selectedActivityId = null, instructorMode = false;
+                // Rows are paged on the server (keyset cursors); attempt details load when a student is opened
+                const ajaxUrl = '<?php echo admin_url('admin-ajax.php'); ?>';
+                const nonce = '<?php echo wp_create_nonce('pb_lti_h5p_results_nonce'); ?>';
+                // JSON-encoded so the query keeps literal '&' (esc_js would turn them into &amp;)
+                const exportUrl = <?php echo wp_json_encode(esc_url_raw(add_query_arg(['action' => 'pb_lti_export_gradebook', 'nonce' => wp_create_nonce('pb_lti_export_gradebook')], admin_url('admin-ajax.php')))); ?>;
+                let postId = null, blogId = null, cursors = [''], nextCursor = null, total = 0, limit = 10, search = '', sort = 'name', order = 'asc';
+                let activityFilter = 0, selectedActivityId = null, instructorMode = false, request = null, searchTimer = null;
+
+                function escapeHtml(text) {
+                    return $('<div>').text(text === null || text === undefined ? '' : String(text)).html();
+                }
+
+                function loadPage() {
+                    if (request) request.abort();
+                    $('#loading-indicator').show();
+
+                    request = $.post(ajaxUrl, {
+                        action: 'pb_lti_get_results_page',
+                        post_id: postId,
+                        blog_id: blogId,
+                        nonce: nonce,
+                        search: search,
+                        sort: sort,
+                        order: order,
+                        activity: activityFilter,
+                        per_page: limit,
+                        cursor: cursors[cursors.length - 1]
+                    }, function(r) {
+                        $('#loading-indicator').hide();
+                        if (!r.success) {
+                            $('#results-error').text(r.data.message || 'Error').show();
+                            $('#results-data').hide();
+                            return;
+                        }
+
+                        instructorMode = r.data.is_instructor || false;
+                        nextCursor = r.data.next_cursor;
+                        total = r.data.total;
+                        populateActivities(r.data.activities || []);
+                        render(r.data.rows || []);
+                        $('#results-data').fadeIn();
+
+                        // STUDENT AUTO-REDIRECTION:
+                        // If not an instructor, auto-show their specific detail view
+                        if (!instructorMode && r.data.rows && r.data.rows.length === 1) {
+                            $('.back-to-list').hide(); // Don't let students go back to empty list view
+                            showDetails(r.data.rows[0].user_id, 'Your Progress: ' + r.data.rows[0].display_name);
+                        } else {
+                            $('.back-to-list').show(); // Re-show for instructors
+                        }
+                    }).fail(function(xhr, status) {
+                        if (status === 'abort') return;
+                        $('#loading-indicator').hide();
+                        $('#results-error').text('Error loading results').show();
+                    });
+                }
+
+                function populateActivities(activities) {
+                    // Global activity selector (detail view) and list filter share the chapter's activity list
+                    const $gas = $('#global-activity-select');
+                    if ($gas.data('post') === postId) return;
+                    $gas.data('post', postId).empty();
+                    const $filter = $('#activity-filter');
+                    $filter.find('option:not([value="0"])').remove();
+
+                    activities.forEach(act => {
+                        $gas.append(`<option value="act-${act.id}">${escapeHtml(act.title)}</option>`);
+                        $filter.append(`<option value="${act.id}">${escapeHtml(act.title)}</option>`);
+                    });
+                    selectedActivityId = activities.length ? $gas.val() : null;
+                }
 
                 $('#chapter-select').on('change', function() {
-                    const postId = $(this).val();
+                    postId = $(this).val();
+                    // Post IDs are per book; the chapter's blog goes with every request
+                    blogId = $(this).find('option:selected').data('blog') || null;
                     if (!postId) {
                         $('#results-data').hide();
                         $('#activity-selector-container').hide();
@@ -192,63 +279,16 @@ class ResultsController {
                         return;
                     }
 
-                    $('#loading-indicator').show();
                     $('#results-error').hide();
                     $('#empty-results-state').hide();
                     $('#detail-view').hide();
+                    $('#activity-selector-container').hide();
                     $('#list-view').show();
 
-                    $.post('<?php echo admin_url('admin-ajax.php'); ?>', {
-                        action: 'qb_lti_get_h5p_results',
-                        post_id: postId,
-                        nonce: '<?php echo wp_create_nonce('pb_lti_h5p_results_nonce'); ?>'
-                    }, function(r) {
-                        $('#loading-indicator').hide();
-                        if(r.success) {
-                            allResults = r.data.results || [];
-                            instructorMode = r.data.is_instructor || false;
-                            
-                            // Populate Global Activity Selector
-                            const activities = {};
-                            allResults.forEach(u => {
-                                Object.values(u.activities || {}).forEach(act => {
-                                    activities[act.id] = act.title;
-                                });
-                            });
-
-                            const $gas = $('#global-activity-select').empty();
-                            if (Object.keys(activities).length > 0) {
-                                Object.entries(activities).forEach(([id, title]) => {
-                                    $gas.append(`<option value="act-${id}">${title}</option>`);
-                                });
-                                selectedActivityId = $gas.val();
-                            }
-
-                            page = 1; 
-                            render();
-                            $('#results-data').fadeIn();
-
-                            // STUDENT AUTO-REDIRECTION:
-                            // If not an instructor, auto-show their specific detail view
-                            if (!instructorMode && allResults.length === 1) {
-                                $('#list-view').hide();
-                                const user = allResults[0];
-                                $('#detail-student-name').text('Your Progress: ' + user.display_name);
-                                $('#detail-content').html($('.details-store').first().html());
-                                $('#activity-selector-container').css('display', 'flex');
-                                if (selectedActivityId) {
-                                    $('#detail-content').find('.' + selectedActivityId).show();
-                                }
-                                $('#detail-view').fadeIn();
-                                $('.back-to-list').hide(); // Don't let students go back to empty list view
-                            } else {
-                                $('.back-to-list').show(); // Re-show for instructors
-                            }
-                        } else {
-                            $('#results-error').text(r.data.message || 'Error').show();
-                            $('#results-data').hide();
-                        }
-                    });
+                    activityFilter = 0;
+                    $('#activity-filter').val('0');
+                    cursors = [''];
+                    loadPage();
                 });
 
                 $('#global-activity-select').on('change', function() {
@@ -260,111 +300,140 @@ class ResultsController {
                             $('#detail-view').find('.' + selectedActivityId).fadeIn();
                         }
                     }
-                    render(); // Re-render to update the display if needed
                 });
 
-                function render() {
-                    let filtered = allResults.filter(u => !search || (u.display_name && u.display_name.toLowerCase().includes(search.toLowerCase())) || (u.user_email && u.user_email.toLowerCase().includes(search.toLowerCase())));
-                    let total = Math.ceil(filtered.length / limit) || 1;
-                    if (page > total) page = total;
-                    const data = filtered.slice((page-1)*limit, page*limit);
-                    
+                function render(rows) {
+                    const pages = Math.ceil(total / limit) || 1;
+                    const page = cursors.length;
+
                     if (instructorMode) {
+                        $('#export-links').css('display', 'flex').find('.export-link').each(function() {
+                            // The selected chapter identifies the book for book-scope exports too
+                            const chapter = '&post_id=' + encodeURIComponent(postId) + '&blog_id=' + encodeURIComponent(blogId);
+                            const scope = $(this).data('scope') === 'book' ? '&scope=book' : '';
+                            $(this).attr('href', exportUrl + chapter + scope + '&format=' + $(this).data('format'));
+                        });
                         $('#search-input').closest('div').show();
-                        $('#page-info').text(`Page ${page} of ${total}`);
+                        $('#page-info').text(`Page ${page} of ${pages}`);
                         $('.prev-page').prop('disabled', page === 1).show();
-                        $('.next-page').prop('disabled', page === total).show();
+                        $('.next-page').prop('disabled', !nextCursor).show();
                         $('#per-page').show();
                     } else {
+                        $('#export-links').hide();
                         $('#search-input').closest('div').hide();
                         $('.prev-page, .next-page, #page-info, #per-page').hide();
                     }
 
                     const $tbody = $('#results-table-body').empty();
-                    if(data.length === 0) { $tbody.append('<tr><td colspan="5" style="text-align:center;">No students found.</td></tr>'); return; }
-
-                    data.forEach(user => {
-                        let detailsHtml = '<div class="pb-lti-student-details">';
-                        detailsHtml += '<h4>📊 Individual Activity Attempts</h4>';
-                        
-                        if (Object.keys(user.activities).length === 0) {
-                            detailsHtml += '<p style="color:#64748b; padding:10px;">No H5P activities found for this student.</p>';
-                        } else {
-                            Object.values(user.activities).forEach(act => {
-                                detailsHtml += `<div class="activity-attempts-group act-${act.id}" style="display:none; margin-bottom:25px;">`;
-                                detailsHtml += `<div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:10px; border-bottom:2px solid #e2e8f0; padding-bottom:5px;">`;
-                                detailsHtml += `<span style="font-weight:600; color:#1e40af;">${act.title}</span>`;
-                                detailsHtml += `<span style="background:#dbeafe; color:#1e40af; padding:2px 8px; border-radius:12px; font-size:11px; text-transform:uppercase; font-weight:bold;">${act.grading_scheme}</span>`;
-                                detailsHtml += `</div>`;
-                                
-                                // Retrieve historical attempts from the sync log that matches this result_id
-                                const activityHistory = (user.history || []).filter(h => h.result_id == act.result_id);
-                                
-                                if (activityHistory.length > 0) {
-                                    detailsHtml += '<table class="wp-list-table widefat striped" style="border:1px solid #e2e8f0;"><thead><tr><th>Finished At</th><th>Status</th><th style="text-align:right;">Aggregated Sync</th></tr></thead><tbody>';
-                                    activityHistory.forEach(att => {
-                                        const scoreDisplay = (att.score !== null && att.max_score !== null) ? `<strong>${att.score}/${att.max_score}</strong>` : '(No Score)';
-                                        const statusIcon = att.status === 'failed' ? '❌' : '✅';
-                                        detailsHtml += `<tr><td>${att.finished}</td><td><span title="${att.status}">${statusIcon}</span></td><td style="text-align:right;">${scoreDisplay}</td></tr>`;
-                                        if (att.error_message) {
-                                            detailsHtml += `<tr><td colspan="3" style="color:#dc2626; font-size:11px; padding-top:0;">Error: ${att.error_message}</td></tr>`;
-                                        }
-                                    });
-                                    detailsHtml += '</tbody></table>';
-                                } else if (act.attempts && act.attempts.length > 0) {
-                                    // Fallback if no sync history exists yet (showing latest H5P result)
-                                    detailsHtml += '<table class="wp-list-table widefat striped" style="border:1px solid #e2e8f0;"><thead><tr><th>Last Finished</th><th style="text-align:right;">Current Score</th></tr></thead><tbody>';
-                                    act.attempts.forEach(att => {
-                                        detailsHtml += `<tr><td>${att.finished}</td><td style="text-align:right;"><strong>${att.score} / ${att.max_score}</strong></td></tr>`;
-                                    });
-                                    detailsHtml += '</tbody></table>';
-                                } else {
-                                    detailsHtml += '<div style="text-align:center; padding:20px; color:#64748b; background:#fff; border:1px solid #e2e8f0; border-radius:4px;">No attempts recorded.</div>';
-                                }
-                                detailsHtml += '</div>';
-                            });
-                        }
-                        detailsHtml += '</div>';
+                    if (rows.length === 0) { $tbody.append('<tr><td colspan="5" style="text-align:center;">No students found.</td></tr>'); return; }
 
+                    rows.forEach(user => {
                         $tbody.append(`<tr>
-                            <td><strong>${user.display_name}</strong></td>
-                            <td>${user.user_email}</td>
+                            <td><strong>${escapeHtml(user.display_name)}</strong></td>
+                            <td>${escapeHtml(user.user_email)}</td>
                             <td>${user.total_calculated_score}/${user.total_max}</td>
                             <td><strong>${Math.round(user.total_percentage)}%</strong></td>
-                            <td style="text-align:center;"><button class="button v-details" data-name="${user.display_name}">👁️</button><div class="details-store" style="display:none;">${detailsHtml}</div></td>
+                            <td style="text-align:center;"><button class="button v-details" data-user="${user.user_id}" data-name="${escapeHtml(user.display_name)}">👁️</button></td>
                         </tr>`);
                     });
                 }
 
-                $(document).on('click', '.v-details', function() { 
-                    $('#detail-student-name').text($(this).data('name')); 
-                    const $content = $(this).siblings('.details-store').html();
-                    $('#detail-content').html($content); 
-                    $('#list-view').hide(); 
+                function renderDetails(user) {
+                    let detailsHtml = '<div class="pb-lti-student-details">';
+                    detailsHtml += '<h4>📊 Individual Activity Attempts</h4>';
+
+                    if (Object.keys(user.activities || {}).length === 0) {
+                        detailsHtml += '<p style="color:#64748b; padding:10px;">No H5P activities found for this student.</p>';
+                    } else {
+                        Object.values(user.activities).forEach(act => {
+                            detailsHtml += `<div class="activity-attempts-group act-${act.id}" style="display:none; margin-bottom:25px;">`;
+                            detailsHtml += `<div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:10px; border-bottom:2px solid #e2e8f0; padding-bottom:5px;">`;
+                            detailsHtml += `<span style="font-weight:600; color:#1e40af;">${escapeHtml(act.title)}</span>`;
+                            detailsHtml += `<span style="background:#dbeafe; color:#1e40af; padding:2px 8px; border-radius:12px; font-size:11px; text-transform:uppercase; font-weight:bold;">${escapeHtml(act.grading_scheme)}</span>`;
+                            detailsHtml += `</div>`;
+
+                            // Retrieve historical attempts from the sync log that matches this result_id
+                            const activityHistory = (user.history || []).filter(h => h.result_id == act.result_id);
+
+                            if (activityHistory.length > 0) {
+                                detailsHtml += '<table class="wp-list-table widefat striped" style="border:1px solid #e2e8f0;"><thead><tr><th>Finished At</th><th>Status</th><th style="text-align:right;">Aggregated Sync</th></tr></thead><tbody>';
+                                activityHistory.forEach(att => {
+                                    const scoreDisplay = (att.score !== null && att.max_score !== null) ? `<strong>${att.score}/${att.max_score}</strong>` : '(No Score)';
+                                    const statusIcon = att.status === 'failed' ? '❌' : '✅';
+                                    detailsHtml += `<tr><td>${escapeHtml(att.finished)}</td><td><span title="${escapeHtml(att.status)}">${statusIcon}</span></td><td style="text-align:right;">${scoreDisplay}</td></tr>`;
+                                    if (att.error_message) {
+                                        detailsHtml += `<tr><td colspan="3" style="color:#dc2626; font-size:11px; padding-top:0;">Error: ${escapeHtml(att.error_message)}</td></tr>`;
+                                    }
+                                });
+                                detailsHtml += '</tbody></table>';
+                            } else if (act.attempts && act.attempts.length > 0) {
+                                // Fallback if no sync history exists yet (showing latest H5P result)
+                                detailsHtml += '<table class="wp-list-table widefat striped" style="border:1px solid #e2e8f0;"><thead><tr><th>Last Finished</th><th style="text-align:right;">Current Score</th></tr></thead><tbody>';
+                                act.attempts.forEach(att => {
+                                    detailsHtml += `<tr><td>${escapeHtml(att.finished)}</td><td style="text-align:right;"><strong>${att.score} / ${att.max_score}</strong></td></tr>`;
+                                });
+                                detailsHtml += '</tbody></table>';
+                            } else {
+                                detailsHtml += '<div style="text-align:center; padding:20px; color:#64748b; background:#fff; border:1px solid #e2e8f0; border-radius:4px;">No attempts recorded.</div>';
+                            }
+                            detailsHtml += '</div>';
+                        });
+                    }
+                    return detailsHtml + '</div>';
+                }
+
+                function showDetails(userId, heading) {
+                    $('#detail-student-name').text(heading);
+                    $('#detail-content').html('<span class="spinner is-active"></span>');
+                    $('#list-view').hide();
                     $('#detail-view').fadeIn();
-                    
+
                     // Show global activity selector when entering detail view
                     if ($('#global-activity-select option').length > 0) {
                         $('#activity-selector-container').css('display', 'flex');
                     }
-                    
-                    // Show the globally selected activity in the detail view
-                    if (selectedActivityId) {
-                        $('#detail-content').find('.' + selectedActivityId).show();
-                    }
+
+                    $.post(ajaxUrl, {
+                        action: 'pb_lti_get_result_details',
+                        post_id: postId,
+                        blog_id: blogId,
+                        user_id: userId,
+                        nonce: nonce
+                    }, function(r) {
+                        if (!r.success) {
+                            $('#detail-content').html(`<p style="color:#dc2626;">${escapeHtml(r.data.message || 'Error')}</p>`);
+                            return;
+                        }
+                        $('#detail-content').html(renderDetails(r.data));
+                        // Show the globally selected activity in the detail view
+                        if (selectedActivityId) {
+                            $('#detail-content').find('.' + selectedActivityId).show();
+                        }
+                    });
+                }
+
+                $(document).on('click', '.v-details', function() {
+                    showDetails($(this).data('user'), $(this).data('name'));
                 });
-                
-                $('.back-to-list').click(() => { 
-                    $('#detail-view').hide(); 
-                    $('#activity-selector-container').hide(); 
-                    $('#list-view').fadeIn(); 
+
+                $('.back-to-list').click(() => {
+                    $('#detail-view').hide();
+                    $('#activity-selector-container').hide();
+                    $('#list-view').fadeIn();
                 });
 
+                function reload() { cursors = ['']; loadPage(); }
+
                 $('#search-input').on('keydown', e => { if(e.which===13) e.preventDefault(); });
-                $('#search-input').on('input', function() { search = $(this).val(); page = 1; render(); });
-                $('#per-page').change(function() { limit = parseInt($(this).val()); page = 1; render(); });
-                $('.prev-page').click(() => { if(page>1){page--; render();} });
-                $('.next-page').click(() => { page++; render(); });
+                $('#search-input').on('input', function() {
+                    clearTimeout(searchTimer);
+                    searchTimer = setTimeout(() => { search = $(this).val().trim(); reload(); }, 300);
+                });
+                $('#per-page').change(function() { limit = parseInt($(this).val()); reload(); });
+                $('#sort-select').change(function() { [sort, order] = $(this).val().split(':'); reload(); });
+                $('#activity-filter').change(function() { activityFilter = parseInt($(this).val()) || 0; reload(); });
+                $('.prev-page').click(() => { if (cursors.length > 1) { cursors.pop(); loadPage(); } });
+                $('.next-page').click(() => { if (nextCursor) { cursors.push(nextCursor); loadPage(); } });
 
                 // Auto-load first chapter on page load
                 if ($('#chapter-select').val()) {
@@ -378,13 +447,18 @@ class ResultsController {
         <?php
     }
 
+    /**
+     * Grading-enabled chapters with activity counts from the stored H5P inventory
+     * (one posts query, one meta query and one h5p_contents freshness query per blog)
+     */
     private static function get_grading_chapters($blog_id) {
         switch_to_blog($blog_id);
         $posts = get_posts(['post_type'=>['chapter','front-matter','back-matter'], 'posts_per_page'=>-1, 'meta_key'=>'_lti_h5p_grading_enabled', 'meta_value'=>'1']);
+        H5PActivityDetector::prime_inventories(wp_list_pluck($posts, 'ID'));
         $res = [];
         foreach($posts as $p) {
             $acts = H5PActivityDetector::find_h5p_activities($p->ID);
-            $res[] = ['id'=>$p->ID, 'title'=>$p->post_title, 'h5p_count'=>count($acts)];
+            $res[] = ['id'=>$p->ID, 'blog_id'=>(int)$blog_id, 'title'=>$p->post_title, 'h5p_count'=>count($acts)];
         }
         restore_current_blog();
 
@@ -396,9 +470,10 @@ class ResultsController {
                 if ($blog->blog_id == $blog_id) continue;
                 switch_to_blog($blog->blog_id);
                 $other_posts = get_posts(['post_type'=>['chapter','front-matter','back-matter'], 'posts_per_page'=>-1, 'meta_key'=>'_lti_h5p_grading_enabled', 'meta_value'=>'1']);
+                H5PActivityDetector::prime_inventories(wp_list_pluck($other_posts, 'ID'));
                 foreach($other_posts as $p) {
                     $acts = H5PActivityDetector::find_h5p_activities($p->ID);
-                    $res[] = ['id'=>$p->ID, 'title' => '[' . get_bloginfo('name') . '] ' . $p->post_title, 'h5p_count'=>count($acts)];
+                    $res[] = ['id'=>$p->ID, 'blog_id'=>(int)$blog->blog_id, 'title' => '[' . get_bloginfo('name') . '] ' . $p->post_title, 'h5p_count'=>count($acts)];
                 }
                 restore_current_blog();
                 if (count($res) > 50) break; // Limit the global selector size
@@ -1,11 +1,21 @@
 <?php
 namespace PB_LTI\Services;
 
-use GuzzleHttp\Client;
+use GuzzleHttp\Exception\RequestException;
 use Firebase\JWT\JWT;
 
 class AGSClient {
 
+    const DEFAULT_SCOPES = [
+        'https://purl.imsglobal.org/spec/lti-ags/scope/lineitem.readonly',
+        'https://purl.imsglobal.org/spec/lti-ags/scope/score'
+    ];
+
+    /**
+     * @var mixed Tool signing key, parsed once per process
+     */
+    private static $signing_key = null;
+
     /**
      * Post score to Moodle gradebook via AGS
      *
@@ -21,40 +31,26 @@ class AGSClient {
     public static function post_score($platform, $lineitem_url, $user_id, $score, $max_score = 100, $activity_progress = 'Completed', $grading_progress = 'FullyGraded') {
         try {
             // Get OAuth2 token
-            $token = TokenCache::get($platform->issuer);
-            if (!$token) {
-                $token = self::fetch_token($platform);
-            }
-
-            // Parse URL and add /scores to path (before query string)
-            $url_parts = parse_url($lineitem_url);
-            $scores_url = $url_parts['scheme'] . '://' . $url_parts['host'];
-            if (isset($url_parts['port'])) {
-                $scores_url .= ':' . $url_parts['port'];
-            }
-            $scores_url .= $url_parts['path'] . '/scores';
-            if (isset($url_parts['query'])) {
-                $scores_url .= '?' . $url_parts['query'];
-            }
-
-            // Post score to AGS endpoint
-            $client = new Client();
-            $response = $client->post($scores_url, [
+            $token = self::get_token($platform);
+
+            // Post score to AGS endpoint (shared keep-alive transport)
+            $client = LmsHttp::for_platform($platform);
+            $response = $client->post(self::scores_url($lineitem_url), [
                 'headers' => [
                     'Authorization' => 'Bearer ' . $token,
                     'Content-Type' => 'application/vnd.ims.lis.v1.score+json'
                 ],
-                'json' => [
-                    'userId' => (string)$user_id,
-                    'scoreGiven' => (float)$score,
-                    'scoreMaximum' => (float)$max_score,
-                    'activityProgress' => $activity_progress,
-                    'gradingProgress' => $grading_progress,
-                    'timestamp' => date('c')
-                ]
+                'json' => self::score_payload($user_id, $score, $max_score, $activity_progress, $grading_progress)
             ]);
 
             return ['success' => true, 'status' => $response->getStatusCode()];
+        } catch (RequestException $e) {
+            // Surface the HTTP status so callers can tell permanent from transient failures
+            return [
+                'success' => false,
+                'error' => $e->getMessage(),
+                'status' => $e->hasResponse() ? $e->getResponse()->getStatusCode() : null
+            ];
         } catch (\Exception $e) {
             return ['success' => false, 'error' => $e->getMessage()];
         }
@@ -63,12 +59,9 @@ class AGSClient {
     public static function send_score(string $lineitem_url, float $score, string $user_id, $platform, array $allowed_scopes) {
         self::enforce_scope($allowed_scopes, 'https://purl.imsglobal.org/spec/lti-ags/scope/score');
 
-        $token = TokenCache::get($platform->issuer);
-        if (!$token) {
-            $token = self::fetch_token($platform);
-        }
+        $token = self::get_token($platform);
 
-        $client = new Client();
+        $client = LmsHttp::for_platform($platform);
         $client->post($lineitem_url . '/scores', [
             'headers' => [
                 'Authorization' => 'Bearer ' . $token,
@@ -85,22 +78,62 @@ class AGSClient {
     }
 
     /**
-     * Fetch OAuth2 access token using JWT client assertion (RFC 7523)
-     * Required for LTI 1.3 Advantage token endpoint
+     * Get a cached OAuth2 token for the platform, fetching a new one if needed
+     *
+     * Concurrent workers share one refresh (see TokenCache::acquire).
+     *
+     * @param object $platform Platform configuration
+     * @param array $scopes Scopes to request
+     * @return string Access token
      */
-    private static function fetch_token($platform): string {
-        global $wpdb;
-
-        // Get tool's private key for signing JWT client assertion
-        $key_row = $wpdb->get_row($wpdb->prepare(
-            "SELECT private_key FROM {$wpdb->base_prefix}lti_keys WHERE kid = %s",
-            'pb-lti-2024'
-        ));
+    public static function get_token($platform, array $scopes = self::DEFAULT_SCOPES): string {
+        return TokenCache::acquire($platform->issuer, $scopes, function () use ($platform, $scopes) {
+            return self::request_token($platform, $scopes);
+        });
+    }
 
-        if (!$key_row) {
-            throw new \Exception('Private key not found for JWT signing');
+    /**
+     * Build the AGS scores endpoint for a lineitem (adds /scores before the query string)
+     *
+     * @param string $lineitem_url AGS lineitem URL
+     * @return string Scores URL
+     */
+    public static function scores_url($lineitem_url): string {
+        $url_parts = parse_url($lineitem_url);
+        $scores_url = $url_parts['scheme'] . '://' . $url_parts['host'];
+        if (isset($url_parts['port'])) {
+            $scores_url .= ':' . $url_parts['port'];
         }
+        $scores_url .= $url_parts['path'] . '/scores';
+        if (isset($url_parts['query'])) {
+            $scores_url .= '?' . $url_parts['query'];
+        }
+        return $scores_url;
+    }
+
+    /**
+     * Build an AGS score payload
+     *
+     * @return array Score JSON body
+     */
+    public static function score_payload($user_id, $score, $max_score = 100, $activity_progress = 'Completed', $grading_progress = 'FullyGraded'): array {
+        return [
+            'userId' => (string)$user_id,
+            'scoreGiven' => (float)$score,
+            'scoreMaximum' => (float)$max_score,
+            'activityProgress' => $activity_progress,
+            'gradingProgress' => $grading_progress,
+            'timestamp' => date('c')
+        ];
+    }
 
+    /**
+     * Request an OAuth2 access token using JWT client assertion (RFC 7523)
+     * Required for LTI 1.3 Advantage token endpoint. Caching is up to the caller.
+     *
+     * @return array Token response (access_token, expires_in, ...)
+     */
+    private static function request_token($platform, array $scopes): array {
         // Create JWT client assertion
         // Per RFC 7523 and LTI 1.3 Security spec
         $jwt_payload = [
@@ -113,21 +146,23 @@ class AGSClient {
         ];
 
         // Sign JWT with tool's private key
-        $client_assertion = \Firebase\JWT\JWT::encode(
+        $client_assertion = JWT::encode(
             $jwt_payload,
-            $key_row->private_key,
+            self::signing_key(),
             'RS256',
             'pb-lti-2024'
         );
 
         // Request access token using JWT client assertion
-        $client = new Client();
+        $client = LmsHttp::for_platform($platform);
         $res = $client->post($platform->token_url, [
+            // Re-sending the same assertion (same jti) is rejected by platforms that enforce jti uniqueness
+            'pb_lti_retry' => false,
             'form_params' => [
                 'grant_type' => 'client_credentials',
                 'client_assertion_type' => 'urn:ietf:params:oauth:client-assertion-type:jwt-bearer',
                 'client_assertion' => $client_assertion,
-                'scope' => 'https://purl.imsglobal.org/spec/lti-ags/scope/lineitem.readonly https://purl.imsglobal.org/spec/lti-ags/scope/score'
+                'scope' => implode(' ', $scopes)
             ]
         ]);
 
@@ -137,10 +172,35 @@ class AGSClient {
             throw new \Exception('No access token in response');
         }
 
-        // Cache the token
-        TokenCache::set($platform->issuer, $data['access_token'], $data['expires_in'] ?? 3600);
+        return $data;
+    }
+
+    /**
+     * Tool's private key for signing client assertions, loaded and parsed once per process
+     */
+    private static function signing_key() {
+        if (self::$signing_key !== null) {
+            return self::$signing_key;
+        }
+
+        global $wpdb;
+
+        $key_row = $wpdb->get_row($wpdb->prepare(
+            "SELECT private_key FROM {$wpdb->base_prefix}lti_keys WHERE kid = %s",
+            'pb-lti-2024'
+        ));
+
+        if (!$key_row) {
+            throw new \Exception('Private key not found for JWT signing');
+        }
+
+        $key = openssl_pkey_get_private($key_row->private_key);
+        if ($key === false) {
+            throw new \Exception('Private key for JWT signing could not be parsed');
+        }
 
-        return $data['access_token'];
+        self::$signing_key = $key;
+        return $key;
     }
 
     /**
@@ -153,13 +213,10 @@ class AGSClient {
     public static function fetch_lineitem($platform, $lineitem_url) {
         try {
             // Get OAuth2 token
-            $token = TokenCache::get($platform->issuer);
-            if (!$token) {
-                $token = self::fetch_token($platform);
-            }
+            $token = self::get_token($platform);
 
             // Fetch lineitem details
-            $client = new Client();
+            $client = LmsHttp::for_platform($platform);
             $response = $client->get($lineitem_url, [
                 'headers' => [
                     'Authorization' => 'Bearer ' . $token,
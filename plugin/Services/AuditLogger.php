@@ -1,16 +1,232 @@
 <?php
 namespace PB_LTI\Services;
 
+/**
+ * AuditLogger
+ *
+ * Buffers audit events for the request and writes them at shutdown with one
+ * multi-row insert into lti_audit, bumping the per-day counters in
+ * lti_audit_daily in the same pass so dashboards don't scan the log. Events
+ * can also be appended to a JSONL file (PB_LTI_AUDIT_JSONL constant or the
+ * pb_lti_audit_jsonl_path filter). A daily cron job deletes rows older than
+ * the retention period; daily counts are kept.
+ */
 class AuditLogger {
-  public static function log(string $event, array $context = []): void {
-    global $wpdb;
-    $wpdb->insert(
-      $wpdb->prefix.'lti_audit',
-      [
-        'event' => $event,
-        'context' => wp_json_encode($context),
-        'created_at' => current_time('mysql')
-      ]
-    );
-  }
+
+    const MAX_BUFFER = 200;            // Flush early in long-running requests (cron, WP-CLI)
+    const RETENTION_DAYS = 365;
+    const RETENTION_OPTION = 'pb_lti_audit_retention_days';
+    const PRUNE_HOOK = 'pb_lti_prune_audit';
+    const PRUNE_BATCH = 5000;
+    const PRUNE_MAX_BATCHES = 20;
+    const ROLLUP_BACKFILL_OPTION = 'pb_lti_audit_daily_backfilled';
+
+    /**
+     * @var array Events waiting to be written
+     */
+    private static $buffer = [];
+
+    /**
+     * Initialize shutdown flush and retention schedule
+     */
+    public static function init() {
+        add_action('shutdown', [__CLASS__, 'flush']);
+        add_action(self::PRUNE_HOOK, [__CLASS__, 'prune']);
+
+        // The log is network-wide, so one site's cron is enough
+        if (is_main_site() && !wp_next_scheduled(self::PRUNE_HOOK)) {
+            wp_schedule_event(time(), 'daily', self::PRUNE_HOOK);
+        }
+    }
+
+    /**
+     * Record an audit event (written at shutdown)
+     *
+     * @param string $event Event name
+     * @param array $context Event details
+     */
+    public static function log(string $event, array $context = []): void {
+        self::$buffer[] = [
+            'event' => $event,
+            'context' => wp_json_encode($context),
+            'created_at' => current_time('mysql')
+        ];
+
+        if (count(self::$buffer) >= self::MAX_BUFFER) {
+            self::flush();
+        }
+    }
+
+    /**
+     * Write buffered events to the table, daily counts and JSONL sink
+     *
+     * @return int Events written
+     */
+    public static function flush() {
+        global $wpdb;
+
+        if (empty(self::$buffer)) {
+            return 0;
+        }
+
+        $events = self::$buffer;
+        self::$buffer = [];
+
+        $rows = [];
+        $daily = [];
+        foreach ($events as $event) {
+            $rows[] = $wpdb->prepare('(%s, %s, %s)', $event['event'], $event['context'], $event['created_at']);
+
+            $key = substr($event['created_at'], 0, 10) . '|' . substr($event['event'], 0, 191);
+            $daily[$key] = ($daily[$key] ?? 0) + 1;
+        }
+
+        $written = $wpdb->query(
+            "INSERT INTO " . self::table() . " (event, context, created_at) VALUES " . implode(', ', $rows)
+        );
+
+        if ($written === false) {
+            error_log('[PB-LTI Audit] Failed to write ' . count($events) . ' events: ' . $wpdb->last_error);
+        } else {
+            self::bump_daily($daily);
+        }
+
+        self::write_jsonl($events);
+
+        return (int)$written;
+    }
+
+    /**
+     * Delete events older than the retention period, oldest day first (cron handler)
+     *
+     * @return int Rows deleted
+     */
+    public static function prune() {
+        global $wpdb;
+
+        // Cut at a day boundary so whole days leave the log together
+        $cutoff = gmdate('Y-m-d 00:00:00', current_time('timestamp') - self::retention_days() * DAY_IN_SECONDS);
+        $deleted = 0;
+
+        for ($i = 0; $i < self::PRUNE_MAX_BATCHES; $i++) {
+            $count = (int)$wpdb->query($wpdb->prepare(
+                "DELETE FROM " . self::table() . " WHERE created_at < %s ORDER BY created_at LIMIT %d",
+                $cutoff,
+                self::PRUNE_BATCH
+            ));
+            $deleted += $count;
+
+            if ($count < self::PRUNE_BATCH) {
+                break;
+            }
+        }
+
+        if ($deleted) {
+            error_log('[PB-LTI Audit] Pruned ' . $deleted . ' events older than ' . $cutoff);
+        }
+
+        return $deleted;
+    }
+
+    /**
+     * Seed lti_audit_daily from events logged before the rollups existed
+     *
+     * @return int Day/event rows written
+     */
+    public static function backfill_daily() {
+        global $wpdb;
+
+        $written = $wpdb->query(
+            "INSERT INTO " . self::daily_table() . " (day, event, count)
+             SELECT DATE(created_at), LEFT(event, 191), COUNT(*) FROM " . self::table() . "
+             GROUP BY DATE(created_at), LEFT(event, 191)
+             ON DUPLICATE KEY UPDATE count = VALUES(count)"
+        );
+
+        if ($written === false) {
+            error_log('[PB-LTI Audit] Rollup backfill failed: ' . $wpdb->last_error);
+            return 0;
+        }
+
+        update_site_option(self::ROLLUP_BACKFILL_OPTION, time());
+
+        return (int)$written;
+    }
+
+    /**
+     * Per-day event counts for dashboards
+     *
+     * @param int $days Number of days back from today
+     * @param string|null $event Limit to one event
+     * @return array Rows with day, event, count (newest day first)
+     */
+    public static function daily_counts($days = 30, $event = null) {
+        global $wpdb;
+
+        $since = gmdate('Y-m-d', current_time('timestamp') - ((int)$days - 1) * DAY_IN_SECONDS);
+        $sql = $wpdb->prepare("SELECT day, event, count FROM " . self::daily_table() . " WHERE day >= %s", $since);
+        if ($event !== null) {
+            $sql .= $wpdb->prepare(" AND event = %s", $event);
+        }
+
+        return $wpdb->get_results($sql . " ORDER BY day DESC, event ASC");
+    }
+
+    /**
+     * Retention period in days (site option, then pb_lti_audit_retention_days filter)
+     *
+     * @return int
+     */
+    public static function retention_days() {
+        $days = (int)get_site_option(self::RETENTION_OPTION, self::RETENTION_DAYS);
+        return max(1, (int)apply_filters('pb_lti_audit_retention_days', $days ?: self::RETENTION_DAYS));
+    }
+
+    private static function bump_daily(array $daily) {
+        global $wpdb;
+
+        $values = [];
+        foreach ($daily as $key => $count) {
+            list($day, $event) = explode('|', $key, 2);
+            $values[] = $wpdb->prepare('(%s, %s, %d)', $day, $event, $count);
+        }
+
+        $wpdb->query(
+            "INSERT INTO " . self::daily_table() . " (day, event, count) VALUES " . implode(', ', $values) . "
+             ON DUPLICATE KEY UPDATE count = count + VALUES(count)"
+        );
+    }
+
+    /**
+     * Append events to the JSONL file sink, if configured
+     */
+    private static function write_jsonl(array $events) {
+        $path = apply_filters('pb_lti_audit_jsonl_path', defined('PB_LTI_AUDIT_JSONL') ? PB_LTI_AUDIT_JSONL : null);
+        if (!$path) {
+            return;
+        }
+
+        $lines = '';
+        foreach ($events as $event) {
+            $lines .= wp_json_encode([
+                'event' => $event['event'],
+                'context' => json_decode($event['context'], true),
+                'created_at' => $event['created_at']
+            ]) . "\n";
+        }
+
+        if (file_put_contents($path, $lines, FILE_APPEND | LOCK_EX) === false) {
+            error_log('[PB-LTI Audit] Could not append to JSONL sink ' . $path);
+        }
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_audit';
+    }
+
+    private static function daily_table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_audit_daily';
+    }
 }
@@ -0,0 +1,221 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * BookCatalog
+ *
+ * Network-wide index of books (title, URL, path, description) in the
+ * lti_book_catalog table, so the Deep Linking picker can list and search
+ * every book with one paginated query instead of switch_to_blog() and
+ * get_bloginfo() per site. Rows are refreshed when a book is created,
+ * renamed or moved, and removed when it is deleted. Result pages are cached
+ * in the object cache until the catalog next changes.
+ */
+class BookCatalog {
+
+    const BUILT_OPTION = 'pb_lti_book_catalog_built';
+    const CACHE_GROUP = 'pb_lti_book_catalog';
+    const PAGE_SIZE = 20;
+    const MAX_PAGE_SIZE = 100;
+
+    /**
+     * Initialize cache group and invalidation hooks
+     */
+    public static function init() {
+        wp_cache_add_global_groups([self::CACHE_GROUP]);
+
+        // Late so the new site's options are in place
+        add_action('wp_initialize_site', [__CLASS__, 'on_site_changed'], 100);
+        add_action('wp_update_site', [__CLASS__, 'on_site_changed']);
+        add_action('wp_uninitialize_site', [__CLASS__, 'on_site_deleted']);
+        add_action('wp_delete_site', [__CLASS__, 'on_site_deleted']);
+
+        foreach (['blogname', 'blogdescription', 'siteurl'] as $option) {
+            add_action('update_option_' . $option, [__CLASS__, 'refresh_current_blog']);
+        }
+    }
+
+    /**
+     * Search the catalog, newest books first
+     *
+     * @param string $query Matched against title and path (empty = all books)
+     * @param int $page 1-based page number
+     * @param int $per_page Books per page (capped at MAX_PAGE_SIZE)
+     * @return array ['books' => array, 'total' => int, 'page' => int, 'per_page' => int, 'has_more' => bool]
+     */
+    public static function search($query = '', $page = 1, $per_page = self::PAGE_SIZE) {
+        global $wpdb;
+
+        $query = trim((string)$query);
+        $page = max(1, (int)$page);
+        $per_page = min(self::MAX_PAGE_SIZE, max(1, (int)$per_page));
+
+        $cache_key = md5($query . '|' . $page . '|' . $per_page) . ':' . wp_cache_get_last_changed(self::CACHE_GROUP);
+        $cached = wp_cache_get($cache_key, self::CACHE_GROUP);
+        if (is_array($cached)) {
+            return $cached;
+        }
+
+        $where = '1=1';
+        if ($query !== '') {
+            $like = '%' . $wpdb->esc_like($query) . '%';
+            $where = $wpdb->prepare('(title LIKE %s OR path LIKE %s)', $like, $like);
+        }
+
+        $total = (int)$wpdb->get_var("SELECT COUNT(*) FROM " . self::table() . " WHERE {$where}");
+
+        $rows = $total ? $wpdb->get_results($wpdb->prepare(
+            "SELECT blog_id, title, url, path, description FROM " . self::table() . "
+             WHERE {$where}
+             ORDER BY registered DESC, blog_id DESC
+             LIMIT %d OFFSET %d",
+            $per_page,
+            ($page - 1) * $per_page
+        ), ARRAY_A) : [];
+
+        $result = [
+            'books' => array_map([__CLASS__, 'to_book'], $rows),
+            'total' => $total,
+            'page' => $page,
+            'per_page' => $per_page,
+            'has_more' => $page * $per_page < $total
+        ];
+
+        wp_cache_set($cache_key, $result, self::CACHE_GROUP);
+
+        return $result;
+    }
+
+    /**
+     * Every book in the catalog, newest first
+     *
+     * @return array Books with id, title, url, path, description
+     */
+    public static function all() {
+        global $wpdb;
+
+        $rows = $wpdb->get_results(
+            "SELECT blog_id, title, url, path, description FROM " . self::table() . " ORDER BY registered DESC, blog_id DESC",
+            ARRAY_A
+        );
+
+        return array_map([__CLASS__, 'to_book'], $rows);
+    }
+
+    /**
+     * Re-read one book's details into the catalog
+     *
+     * @param int $blog_id Book blog ID
+     */
+    public static function refresh($blog_id) {
+        global $wpdb;
+
+        $site = get_site($blog_id);
+        if (!$site || is_main_site($site->blog_id)) {
+            return;
+        }
+
+        $options = self::read_options($site->blog_id);
+
+        $wpdb->query($wpdb->prepare(
+            "REPLACE INTO " . self::table() . " (blog_id, title, url, path, description, registered, updated_at)
+             VALUES (%d, %s, %s, %s, %s, %s, %s)",
+            $site->blog_id,
+            $options['blogname'] ?? '',
+            set_url_scheme($options['siteurl'] ?? ('http://' . $site->domain . $site->path)),
+            trim($site->path, '/'),
+            $options['blogdescription'] ?? '',
+            $site->registered,
+            current_time('mysql', true)
+        ));
+
+        self::flush();
+    }
+
+    /**
+     * Rebuild the whole catalog from the network's sites
+     *
+     * @return int Books indexed
+     */
+    public static function rebuild() {
+        global $wpdb;
+
+        $blog_ids = array_map('intval', get_sites(['fields' => 'ids', 'number' => 0, 'orderby' => 'id']));
+
+        $count = 0;
+        foreach ($blog_ids as $blog_id) {
+            if (is_main_site($blog_id)) {
+                continue;
+            }
+            self::refresh($blog_id);
+            $count++;
+        }
+
+        // Drop books whose site no longer exists
+        if ($blog_ids) {
+            $wpdb->query("DELETE FROM " . self::table() . " WHERE blog_id NOT IN (" . implode(',', $blog_ids) . ")");
+        }
+
+        update_site_option(self::BUILT_OPTION, time());
+        self::flush();
+        error_log('[PB-LTI Book Catalog] Indexed ' . $count . ' books');
+
+        return $count;
+    }
+
+    public static function on_site_changed($site) {
+        self::refresh((int)$site->blog_id);
+    }
+
+    public static function on_site_deleted($site) {
+        global $wpdb;
+
+        $wpdb->delete(self::table(), ['blog_id' => (int)$site->blog_id], ['%d']);
+        self::flush();
+    }
+
+    public static function refresh_current_blog() {
+        self::refresh(get_current_blog_id());
+    }
+
+    /**
+     * Read a book's name, description and URL straight from its options table
+     */
+    private static function read_options($blog_id) {
+        global $wpdb;
+
+        $rows = $wpdb->get_results(
+            "SELECT option_name, option_value FROM " . $wpdb->get_blog_prefix($blog_id) . "options
+             WHERE option_name IN ('blogname', 'blogdescription', 'siteurl')"
+        );
+
+        $options = [];
+        foreach ($rows as $row) {
+            $options[$row->option_name] = $row->option_value;
+        }
+
+        return $options;
+    }
+
+    private static function to_book(array $row) {
+        return [
+            'id' => (int)$row['blog_id'],
+            'title' => $row['title'],
+            'url' => $row['url'],
+            'path' => $row['path'],
+            'description' => $row['description']
+        ];
+    }
+
+    /**
+     * Invalidate cached result pages
+     */
+    private static function flush() {
+        wp_cache_set('last_changed', microtime(), self::CACHE_GROUP);
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_book_catalog';
+    }
+}
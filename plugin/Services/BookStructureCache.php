@@ -0,0 +1,110 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * BookStructureCache
+ *
+ * Caches each book's front matter / parts / chapters / back matter tree (as
+ * returned by ContentService::get_book_structure) in a site transient keyed
+ * by blog ID, so the picker's chapter lists and whole-book Deep Linking
+ * selections don't re-run the structure queries. A book's entry is dropped
+ * when any of its front matter, parts, chapters or back matter change, when
+ * web visibility or part assignment changes, and when its name or permalinks
+ * change.
+ */
+class BookStructureCache {
+
+    const TTL = DAY_IN_SECONDS;
+    const POST_TYPES = ['front-matter', 'part', 'chapter', 'back-matter'];
+    const META_KEYS = ['_pb_show_web', 'pb_part'];
+
+    /**
+     * @var array Per-request memo: blog_id => structure
+     */
+    private static $memo = [];
+
+    /**
+     * Initialize invalidation hooks
+     */
+    public static function init() {
+        // Fires for inserts, updates, status changes, trash and delete (and Pressbooks reordering)
+        add_action('clean_post_cache', [__CLASS__, 'on_post_changed'], 10, 2);
+
+        foreach (['added_post_meta', 'updated_post_meta', 'deleted_post_meta'] as $hook) {
+            add_action($hook, [__CLASS__, 'on_meta_changed'], 10, 3);
+        }
+
+        foreach (['blogname', 'permalink_structure', 'home', 'siteurl'] as $option) {
+            add_action('update_option_' . $option, [__CLASS__, 'forget_current_blog']);
+        }
+
+        add_action('wp_update_site', [__CLASS__, 'on_site_changed']);
+        add_action('wp_uninitialize_site', [__CLASS__, 'on_site_changed']);
+    }
+
+    /**
+     * Get a cached structure
+     *
+     * @param int $blog_id Book blog ID
+     * @return array|null Structure or null on miss
+     */
+    public static function get($blog_id) {
+        $blog_id = (int)$blog_id;
+        if (isset(self::$memo[$blog_id])) {
+            return self::$memo[$blog_id];
+        }
+
+        $cached = get_site_transient(self::cache_key($blog_id));
+        if (!is_array($cached)) {
+            return null;
+        }
+
+        self::$memo[$blog_id] = $cached;
+        return $cached;
+    }
+
+    /**
+     * Store a book's structure
+     *
+     * @param int $blog_id Book blog ID
+     * @param array $structure Structure from ContentService::get_book_structure()
+     */
+    public static function set($blog_id, array $structure) {
+        self::$memo[(int)$blog_id] = $structure;
+        set_site_transient(self::cache_key($blog_id), $structure, self::TTL);
+    }
+
+    /**
+     * Drop a book's cached structure
+     *
+     * @param int $blog_id Book blog ID
+     */
+    public static function forget($blog_id) {
+        unset(self::$memo[(int)$blog_id]);
+        delete_site_transient(self::cache_key($blog_id));
+    }
+
+    public static function on_post_changed($post_id, $post) {
+        if ($post && in_array($post->post_type, self::POST_TYPES, true)) {
+            self::forget_current_blog();
+        }
+    }
+
+    public static function on_meta_changed($meta_id, $post_id, $meta_key) {
+        if (in_array($meta_key, self::META_KEYS, true)) {
+            self::forget_current_blog();
+        }
+    }
+
+    public static function on_site_changed($site) {
+        self::forget((int)$site->blog_id);
+    }
+
+    public static function forget_current_blog() {
+        self::forget(get_current_blog_id());
+    }
+
+    private static function cache_key($blog_id) {
+        return 'pb_lti_book_structure_' . (int)$blog_id;
+    }
+}
@@ -0,0 +1,514 @@
+<?php
+namespace PB_LTI\Services;
+
+use GuzzleHttp\Pool;
+use GuzzleHttp\Promise\Utils;
+use GuzzleHttp\Psr7\Request;
+
+/**
+ * BulkGradeSync
+ *
+ * Retroactive grade sync for a whole chapter. Work is split into batches;
+ * each batch posts scores concurrently through a Guzzle pool (capped per
+ * platform) and saves progress, so the admin UI can poll, and a timed-out
+ * request simply resumes from the last completed batch. A per-chapter MySQL
+ * named lock keeps two requests (two tabs, a retried AJAX call) from running
+ * the same batch at once.
+ */
+class BulkGradeSync {
+
+    const BATCH_SIZE = 100;
+    const CONCURRENCY = 8;          // Max in-flight AGS requests per platform
+    const STATE_TTL = DAY_IN_SECONDS;
+    const MAX_ERRORS = 200;         // Error messages kept in run state
+
+    const STATUS_RUNNING = 'running';
+    const STATUS_COMPLETE = 'complete';
+
+    /** @var array Platform rows loaded in this request, by issuer */
+    private static $platforms = [];
+
+    /**
+     * Start (or restart) a bulk sync run for a chapter
+     *
+     * @param int $post_id Chapter post ID
+     * @param int|null $user_id Optional: specific user ID to sync (null = all users)
+     * @return array Progress summary
+     */
+    public static function start($post_id, $user_id = null) {
+        if (!self::try_lock($post_id)) {
+            return self::busy($post_id);
+        }
+
+        try {
+            return self::begin($post_id, $user_id);
+        } finally {
+            self::unlock($post_id);
+        }
+    }
+
+    private static function begin($post_id, $user_id) {
+        global $wpdb;
+
+        $state = [
+            'post_id' => (int)$post_id,
+            'status' => self::STATUS_RUNNING,
+            'total' => 0,
+            'pending' => [],
+            'success' => 0,
+            'skipped' => 0,
+            'failed' => 0,
+            'errors' => [],
+            'issuers' => [],
+            'lineitems' => [],
+            'started_at' => current_time('mysql'),
+            'updated_at' => current_time('mysql')
+        ];
+
+        // Check if grading is enabled for this chapter
+        if (!H5PResultsManager::is_grading_enabled($post_id)) {
+            $state['errors'][] = 'Grading not enabled for this chapter';
+            return self::finish($state);
+        }
+
+        // Get configured H5P activities for this chapter
+        $configured = H5PResultsManager::get_configured_activities($post_id);
+        if (empty($configured)) {
+            $state['errors'][] = 'No H5P activities configured for grading';
+            return self::finish($state);
+        }
+
+        $h5p_ids = array_map('intval', array_column($configured, 'h5p_id'));
+        $where_user = $user_id ? $wpdb->prepare(" AND user_id = %d", $user_id) : "";
+
+        // Find all users who have completed these H5P activities
+        $user_ids = $wpdb->get_col(
+            "SELECT DISTINCT user_id FROM {$wpdb->prefix}h5p_results
+             WHERE content_id IN (" . implode(',', $h5p_ids) . ")
+             {$where_user}
+             ORDER BY user_id"
+        );
+
+        $state['pending'] = array_map('intval', $user_ids);
+        $state['total'] = count($state['pending']);
+
+        error_log('[PB-LTI Bulk Sync] Starting run for post ' . $post_id . ': ' . $state['total'] . ' users');
+
+        if (empty($state['pending'])) {
+            return self::finish($state);
+        }
+
+        self::save($state);
+
+        return self::summarize($state);
+    }
+
+    /**
+     * Process the next batch of a running sync
+     *
+     * @param int $post_id Chapter post ID
+     * @param int $limit Users per batch
+     * @return array|null Progress summary ('busy' => true while another request holds the run)
+     */
+    public static function run_batch($post_id, $limit = self::BATCH_SIZE) {
+        if (!self::try_lock($post_id)) {
+            return self::busy($post_id);
+        }
+
+        try {
+            return self::process_batch($post_id, $limit);
+        } finally {
+            self::unlock($post_id);
+        }
+    }
+
+    private static function process_batch($post_id, $limit) {
+        $state = get_transient(self::state_key($post_id));
+
+        if (!$state || $state['status'] !== self::STATUS_RUNNING) {
+            return $state ? self::summarize($state) : null;
+        }
+
+        $batch = array_splice($state['pending'], 0, $limit);
+
+        // One usermeta query for the whole batch instead of one per user
+        update_meta_cache('user', $batch);
+
+        // Materialized chapter scores for the whole batch in one lookup
+        $scores = ChapterScores::for_post($post_id, $batch);
+
+        // Launch contexts (chapter lineitems) for the whole batch in one query
+        $contexts = LaunchContext::for_post(get_current_blog_id(), $post_id, $batch);
+
+        $jobs = [];
+        foreach ($batch as $wp_user_id) {
+            $job = self::prepare_job(
+                $state,
+                $post_id,
+                $wp_user_id,
+                $scores[(int)$wp_user_id] ?? null,
+                $contexts[(int)$wp_user_id]['lineitem_url'] ?? null
+            );
+            if ($job) {
+                $jobs[] = $job;
+            }
+        }
+
+        if (!empty($jobs)) {
+            self::load_lineitems($state, $jobs);
+            self::post_scores($state, $post_id, $jobs);
+        }
+
+        if (empty($state['pending'])) {
+            return self::finish($state);
+        }
+
+        $state['updated_at'] = current_time('mysql');
+        self::save($state);
+
+        return self::summarize($state);
+    }
+
+    /**
+     * Run a sync to completion in the current request
+     *
+     * @param int $post_id Chapter post ID
+     * @param int|null $user_id Optional: specific user ID
+     * @return array Progress summary
+     */
+    public static function run_all($post_id, $user_id = null) {
+        $progress = self::start($post_id, $user_id);
+        while ($progress && $progress['status'] === self::STATUS_RUNNING && empty($progress['busy'])) {
+            $progress = self::run_batch($post_id);
+        }
+
+        if (!empty($progress['busy'])) {
+            // Leave the run to the request that holds it
+            $progress['errors'][] = 'Another grade sync is already running for this chapter';
+        }
+        return $progress;
+    }
+
+    /**
+     * Get progress of the current or last run for a chapter
+     *
+     * @param int $post_id Chapter post ID
+     * @return array|null Progress summary, or null if no run exists
+     */
+    public static function get_progress($post_id) {
+        $state = get_transient(self::state_key($post_id));
+        return $state ? self::summarize($state) : null;
+    }
+
+    /**
+     * Resolve LTI context and chapter score for one user
+     *
+     * @return array|null Job data, or null if the user was skipped/failed
+     */
+    private static function prepare_job(&$state, $post_id, $wp_user_id, $chapter_score, $lineitem_url) {
+        // Check if user has LTI context (global)
+        $platform_issuer = get_user_meta($wp_user_id, '_lti_platform_issuer', true);
+        $lti_user_id = get_user_meta($wp_user_id, '_lti_user_id', true);
+
+        if (empty($platform_issuer) || empty($lti_user_id)) {
+            $state['skipped']++;
+            return null;
+        }
+
+        // Chapter-specific lineitem for this user, falling back to user meta
+        if (empty($lineitem_url)) {
+            $lineitem_url = get_user_meta($wp_user_id, '_lti_ags_lineitem', true);
+        }
+
+        if (empty($lineitem_url)) {
+            $state['skipped']++;
+            return null;
+        }
+
+        if (!$chapter_score || $chapter_score['max_score'] == 0) {
+            $state['skipped']++;
+            return null;
+        }
+
+        // Issuers are checked once per run; rows stay in memory, not in the saved state
+        if (!array_key_exists($platform_issuer, $state['issuers'])) {
+            $state['issuers'][$platform_issuer] = (bool)self::platform($platform_issuer);
+        }
+
+        if (!$state['issuers'][$platform_issuer] || !self::platform($platform_issuer)) {
+            self::record_failure($state, $wp_user_id, 'Platform not found for issuer ' . $platform_issuer);
+            return null;
+        }
+
+        return [
+            'user_id' => $wp_user_id,
+            'issuer' => $platform_issuer,
+            'lti_user_id' => $lti_user_id,
+            'lineitem_url' => $lineitem_url,
+            'score' => [
+                'score' => (float)$chapter_score['score'],
+                'max_score' => (float)$chapter_score['max_score'],
+                'percentage' => (float)$chapter_score['percentage']
+            ]
+        ];
+    }
+
+    /**
+     * Load each distinct lineitem once per run (for scale detection), from LineItemCache when possible
+     */
+    private static function load_lineitems(&$state, array $jobs) {
+        $missing = [];
+        foreach ($jobs as $job) {
+            $url = $job['lineitem_url'];
+            if (array_key_exists($url, $state['lineitems'])) {
+                continue;
+            }
+
+            $cached = LineItemCache::get($url);
+            if ($cached !== null) {
+                $state['lineitems'][$url] = $cached;
+                continue;
+            }
+
+            $missing[$job['issuer']][$url] = true;
+        }
+
+        $promises = [];
+
+        foreach ($missing as $issuer => $urls) {
+            $platform = self::platform($issuer);
+            $urls = array_keys($urls);
+
+            try {
+                $token = AGSClient::get_token($platform);
+            } catch (\Exception $e) {
+                foreach ($urls as $url) {
+                    $state['lineitems'][$url] = null;
+                }
+                continue;
+            }
+
+            $requests = [];
+            foreach ($urls as $url) {
+                $requests[] = new Request('GET', $url, [
+                    'Authorization' => 'Bearer ' . $token,
+                    'Accept' => 'application/vnd.ims.lis.v2.lineitem+json'
+                ]);
+            }
+
+            $pool = new Pool(LmsHttp::for_platform($platform), $requests, [
+                'concurrency' => self::concurrency($platform),
+                'fulfilled' => function ($response, $index) use (&$state, $urls) {
+                    $lineitem = json_decode((string)$response->getBody(), true);
+                    $state['lineitems'][$urls[$index]] = $lineitem;
+                    if (is_array($lineitem)) {
+                        LineItemCache::set($urls[$index], $lineitem);
+                    }
+                },
+                'rejected' => function ($reason, $index) use (&$state, $urls) {
+                    // Fall back to point grading for this lineitem
+                    $state['lineitems'][$urls[$index]] = null;
+                }
+            ]);
+            $promises[] = $pool->promise();
+        }
+
+        Utils::settle($promises)->wait();
+    }
+
+    /**
+     * Post scores concurrently, one pool per platform so each has its own cap
+     */
+    private static function post_scores(&$state, $post_id, array $jobs) {
+        $by_issuer = [];
+        foreach ($jobs as $job) {
+            $by_issuer[$job['issuer']][] = $job;
+        }
+
+        $promises = [];
+
+        foreach ($by_issuer as $issuer => $issuer_jobs) {
+            $platform = self::platform($issuer);
+
+            try {
+                $token = AGSClient::get_token($platform);
+            } catch (\Exception $e) {
+                foreach ($issuer_jobs as $job) {
+                    self::record_failure($state, $job['user_id'], $e->getMessage(), $post_id, $job);
+                }
+                continue;
+            }
+
+            $requests = [];
+            foreach ($issuer_jobs as $index => &$job) {
+                list($job['final_score'], $job['final_max']) = self::map_score($state, $job);
+
+                $requests[$index] = new Request(
+                    'POST',
+                    AGSClient::scores_url($job['lineitem_url']),
+                    [
+                        'Authorization' => 'Bearer ' . $token,
+                        'Content-Type' => 'application/vnd.ims.lis.v1.score+json'
+                    ],
+                    wp_json_encode(AGSClient::score_payload($job['lti_user_id'], $job['final_score'], $job['final_max']))
+                );
+            }
+            unset($job);
+
+            $pool = new Pool(LmsHttp::for_platform($platform), $requests, [
+                'concurrency' => self::concurrency($platform),
+                'fulfilled' => function ($response, $index) use (&$state, $issuer_jobs, $post_id) {
+                    $job = $issuer_jobs[$index];
+                    H5PGradeSyncEnhanced::update_sync_timestamp($job['user_id'], $post_id, 0, $job['final_score'], $job['final_max'], 'success');
+                    ChapterScores::mark_synced($job['user_id'], $post_id, $job['score']['percentage']);
+                    $state['success']++;
+                },
+                'rejected' => function ($reason, $index) use (&$state, $issuer_jobs, $post_id) {
+                    $job = $issuer_jobs[$index];
+                    $error = $reason instanceof \Exception ? $reason->getMessage() : 'Unknown error';
+                    self::record_failure($state, $job['user_id'], $error, $post_id, $job);
+                }
+            ]);
+
+            $promises[] = $pool->promise();
+        }
+
+        // Pools for different platforms share LmsHttp's curl multi handle and run side by side
+        Utils::settle($promises)->wait();
+    }
+
+    /**
+     * Apply scale mapping from the cached lineitem
+     *
+     * @return array [score, max]
+     */
+    private static function map_score($state, $job) {
+        $lineitem = $state['lineitems'][$job['lineitem_url']] ?? null;
+
+        if ($lineitem) {
+            $scale_type = ScaleMapper::detect_scale($lineitem);
+            if ($scale_type && $scale_type !== 'unknown') {
+                $mapped = ScaleMapper::map_to_scale($job['score']['percentage'], $scale_type);
+                return [$mapped['score'], $mapped['max']];
+            }
+        }
+
+        return [$job['score']['score'], $job['score']['max_score']];
+    }
+
+    /**
+     * Platform row for an issuer, loaded once per request
+     */
+    private static function platform($issuer) {
+        if (!array_key_exists($issuer, self::$platforms)) {
+            self::$platforms[$issuer] = PlatformRegistry::find($issuer) ?: null;
+        }
+        return self::$platforms[$issuer];
+    }
+
+    /**
+     * Max in-flight requests for a platform
+     */
+    private static function concurrency($platform) {
+        return max(1, (int)apply_filters('pb_lti_bulk_sync_concurrency', self::CONCURRENCY, $platform));
+    }
+
+    private static function record_failure(&$state, $wp_user_id, $error, $post_id = null, $job = null) {
+        $state['failed']++;
+        if (count($state['errors']) < self::MAX_ERRORS) {
+            $state['errors'][] = 'User ' . $wp_user_id . ': ' . $error;
+        }
+
+        if ($post_id && $job) {
+            H5PGradeSyncEnhanced::update_sync_timestamp(
+                $wp_user_id,
+                $post_id,
+                0,
+                $job['final_score'] ?? $job['score']['score'],
+                $job['final_max'] ?? $job['score']['max_score'],
+                'failed',
+                $error
+            );
+        }
+
+        error_log('[PB-LTI Bulk Sync] ❌ Failed for user ' . $wp_user_id . ': ' . $error);
+    }
+
+    private static function finish($state) {
+        $state['status'] = self::STATUS_COMPLETE;
+        $state['updated_at'] = current_time('mysql');
+        self::save($state);
+
+        update_post_meta($state['post_id'], '_lti_last_grade_sync', current_time('mysql'));
+
+        error_log(sprintf(
+            '[PB-LTI Bulk Sync] Run complete for post %d: %d succeeded, %d skipped, %d failed',
+            $state['post_id'],
+            $state['success'],
+            $state['skipped'],
+            $state['failed']
+        ));
+
+        return self::summarize($state);
+    }
+
+    private static function summarize($state) {
+        return [
+            'status' => $state['status'],
+            'total' => $state['total'],
+            'done' => $state['success'] + $state['skipped'] + $state['failed'],
+            'remaining' => count($state['pending']),
+            'success' => $state['success'],
+            'skipped' => $state['skipped'],
+            'failed' => $state['failed'],
+            'errors' => $state['errors'],
+            'started_at' => $state['started_at'],
+            'updated_at' => $state['updated_at']
+        ];
+    }
+
+    /**
+     * Progress of the run another request is processing
+     */
+    private static function busy($post_id) {
+        $progress = self::get_progress($post_id) ?: [
+            'status' => self::STATUS_RUNNING,
+            'total' => 0,
+            'done' => 0,
+            'remaining' => 0,
+            'success' => 0,
+            'skipped' => 0,
+            'failed' => 0,
+            'errors' => [],
+            'started_at' => null,
+            'updated_at' => null
+        ];
+        $progress['busy'] = true;
+        return $progress;
+    }
+
+    /**
+     * MySQL named lock per chapter, same pattern as TokenCache
+     */
+    private static function try_lock($post_id) {
+        global $wpdb;
+        return (int)$wpdb->get_var($wpdb->prepare("SELECT GET_LOCK(%s, 0)", self::lock_name($post_id))) === 1;
+    }
+
+    private static function unlock($post_id) {
+        global $wpdb;
+        $wpdb->query($wpdb->prepare("SELECT RELEASE_LOCK(%s)", self::lock_name($post_id)));
+    }
+
+    private static function lock_name($post_id) {
+        return 'pb_lti_bulk_' . get_current_blog_id() . '_' . (int)$post_id;
+    }
+
+    private static function save($state) {
+        set_transient(self::state_key($state['post_id']), $state, self::STATE_TTL);
+    }
+
+    private static function state_key($post_id) {
+        return 'pb_lti_bulk_sync_' . (int)$post_id;
+    }
+}
@@ -0,0 +1,212 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * ChapterScores
+ *
+ * Materialized per-(user, chapter) scores in lti_chapter_scores. Rows are
+ * updated incrementally as H5P results come in and rebuilt when a chapter's
+ * grading configuration changes, so viewers read a primary-key lookup
+ * instead of recomputing from h5p_results. Each row also records the
+ * percentage last delivered to the LMS; needs_sync flags rows where the two
+ * differ.
+ */
+class ChapterScores {
+
+    const BUILT_META = '_lti_chapter_scores_built';
+    const INSERT_CHUNK = 500;
+
+    /**
+     * Store a user's current chapter score
+     *
+     * @param int $user_id WordPress user ID
+     * @param int $post_id Chapter post ID
+     * @param array $score ['score' => float, 'max_score' => float, 'percentage' => float]
+     */
+    public static function store($user_id, $post_id, array $score) {
+        self::upsert($post_id, [(int)$user_id => $score], current_time('mysql'));
+    }
+
+    /**
+     * Get a user's materialized chapter score
+     *
+     * @param int $user_id WordPress user ID
+     * @param int $post_id Chapter post ID
+     * @return array|null Row or null if not materialized
+     */
+    public static function get($user_id, $post_id) {
+        global $wpdb;
+
+        return $wpdb->get_row($wpdb->prepare(
+            "SELECT * FROM " . self::table() . " WHERE post_id = %d AND user_id = %d",
+            $post_id,
+            $user_id
+        ), ARRAY_A);
+    }
+
+    /**
+     * Get materialized scores for a chapter, building them on first use
+     *
+     * @param int $post_id Chapter post ID
+     * @param array|null $user_ids Limit to these users (null = all)
+     * @return array user_id => row
+     */
+    public static function for_post($post_id, $user_ids = null) {
+        global $wpdb;
+
+        self::ensure_built($post_id);
+
+        $sql = $wpdb->prepare("SELECT * FROM " . self::table() . " WHERE post_id = %d", $post_id);
+        if ($user_ids !== null) {
+            if (empty($user_ids)) {
+                return [];
+            }
+            $sql .= ' AND user_id IN (' . implode(',', array_map('intval', $user_ids)) . ')';
+        }
+
+        $rows = [];
+        foreach ($wpdb->get_results($sql, ARRAY_A) as $row) {
+            $rows[(int)$row['user_id']] = $row;
+        }
+
+        return $rows;
+    }
+
+    /**
+     * Users whose calculated score differs from what the LMS last received
+     *
+     * @param int $post_id Chapter post ID
+     * @return int[] WordPress user IDs
+     */
+    public static function needs_sync($post_id) {
+        global $wpdb;
+
+        self::ensure_built($post_id);
+
+        return array_map('intval', $wpdb->get_col($wpdb->prepare(
+            "SELECT user_id FROM " . self::table() . " WHERE post_id = %d AND needs_sync = 1",
+            $post_id
+        )));
+    }
+
+    /**
+     * Record the percentage delivered to the LMS for a user's chapter grade
+     *
+     * @param int $user_id WordPress user ID
+     * @param int $post_id Chapter post ID
+     * @param float $percentage Percentage that was sent
+     */
+    public static function mark_synced($user_id, $post_id, $percentage) {
+        global $wpdb;
+
+        $wpdb->query($wpdb->prepare(
+            "UPDATE " . self::table() . "
+             SET synced_percentage = %f,
+                 synced_at = %s,
+                 needs_sync = " . self::needs_sync_expr() . "
+             WHERE post_id = %d AND user_id = %d",
+            $percentage,
+            current_time('mysql'),
+            $post_id,
+            $user_id
+        ));
+    }
+
+    /**
+     * Recalculate every user's score for a chapter (after a grading configuration change)
+     *
+     * Last-synced values are kept, so needs_sync reflects the new scores.
+     *
+     * @param int $post_id Chapter post ID
+     * @return int Number of users scored
+     */
+    public static function rebuild($post_id) {
+        global $wpdb;
+
+        $started = current_time('mysql');
+        $scores = H5PResultsManager::calculate_chapter_scores($post_id);
+
+        foreach (array_chunk($scores, self::INSERT_CHUNK, true) as $chunk) {
+            self::upsert($post_id, $chunk, $started);
+        }
+
+        // Users with no results left in the configured activities now score nothing
+        $wpdb->query($wpdb->prepare(
+            "UPDATE " . self::table() . "
+             SET score = 0, max_score = 0, percentage = 0, updated_at = %s,
+                 needs_sync = " . self::needs_sync_expr() . "
+             WHERE post_id = %d AND updated_at < %s",
+            $started,
+            $post_id,
+            $started
+        ));
+
+        update_post_meta($post_id, self::BUILT_META, time());
+
+        return count($scores);
+    }
+
+    /**
+     * Build a chapter's rows the first time they are needed
+     */
+    private static function ensure_built($post_id) {
+        if (!get_post_meta($post_id, self::BUILT_META, true)) {
+            self::rebuild($post_id);
+        }
+    }
+
+    /**
+     * Multi-row upsert of calculated scores
+     *
+     * @param int $post_id Chapter post ID
+     * @param array $scores user_id => score array
+     * @param string $now Timestamp for updated_at
+     */
+    private static function upsert($post_id, array $scores, $now) {
+        global $wpdb;
+
+        if (empty($scores)) {
+            return;
+        }
+
+        $values = [];
+        foreach ($scores as $user_id => $score) {
+            $values[] = $wpdb->prepare(
+                "(%d, %d, %f, %f, %f, %d, %s)",
+                $user_id,
+                $post_id,
+                $score['score'],
+                $score['max_score'],
+                $score['percentage'],
+                $score['max_score'] > 0 ? 1 : 0,   // New rows have never been synced
+                $now
+            );
+        }
+
+        // Assignments run left to right, so needs_sync sees the new percentage
+        $result = $wpdb->query(
+            "INSERT INTO " . self::table() . "
+                (user_id, post_id, score, max_score, percentage, needs_sync, updated_at)
+             VALUES " . implode(', ', $values) . "
+             ON DUPLICATE KEY UPDATE
+                score = VALUES(score),
+                max_score = VALUES(max_score),
+                percentage = VALUES(percentage),
+                updated_at = VALUES(updated_at),
+                needs_sync = " . self::needs_sync_expr()
+        );
+
+        if ($result === false) {
+            error_log('[PB-LTI Scores] Failed to store chapter scores for post ' . $post_id . ': ' . $wpdb->last_error);
+        }
+    }
+
+    private static function needs_sync_expr() {
+        return "(max_score > 0 AND (synced_percentage IS NULL OR ABS(percentage - synced_percentage) >= 0.01))";
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->prefix . 'lti_chapter_scores';
+    }
+}
@@ -13,45 +13,39 @@ class ContentService {
     /**
      * Get all books in the Pressbooks network
      *
-     * @return array Array of book objects with id, name, url
+     * Reads the precomputed BookCatalog; use search_books() for pages.
+     *
+     * @return array Array of book objects with id, title, url, path, description
      */
     public static function get_all_books() {
         if (!is_multisite()) {
             return [];
         }
 
-        $sites = get_sites([
-            'number' => 100,
-            'orderby' => 'registered',
-            'order' => 'DESC'
-        ]);
-
-        $books = [];
-        foreach ($sites as $site) {
-            // Skip main site (network root)
-            if ($site->blog_id == 1) {
-                continue;
-            }
-
-            switch_to_blog($site->blog_id);
-
-            $books[] = [
-                'id' => $site->blog_id,
-                'title' => get_bloginfo('name'),
-                'url' => get_site_url($site->blog_id),
-                'path' => trim($site->path, '/'),
-                'description' => get_bloginfo('description')
-            ];
+        return BookCatalog::all();
+    }
 
-            restore_current_blog();
+    /**
+     * Get one page of books matching a search
+     *
+     * @param string $query Title or path search (empty = all books)
+     * @param int $page 1-based page number
+     * @param int $per_page Books per page
+     * @return array ['books' => array, 'total' => int, 'page' => int, 'per_page' => int, 'has_more' => bool]
+     */
+    public static function search_books($query = '', $page = 1, $per_page = BookCatalog::PAGE_SIZE) {
+        if (!is_multisite()) {
+            return ['books' => [], 'total' => 0, 'page' => 1, 'per_page' => $per_page, 'has_more' => false];
         }
 
-        return $books;
+        return BookCatalog::search($query, $page, $per_page);
     }
 
     /**
      * Get book structure (parts, chapters, front/back matter)
      *
+     * Served from BookStructureCache; built and cached on a miss.
+     *
      * @param int $blog_id Book ID (site ID)
      * @return array Book structure with chapters organized by parts
      */
@@ -60,6 +54,21 @@ class ContentService {
             return [];
         }
 
+        $structure = BookStructureCache::get($blog_id);
+        if ($structure !== null) {
+            return $structure;
+        }
+
+        $structure = self::build_book_structure($blog_id);
+        BookStructureCache::set($blog_id, $structure);
+
+        return $structure;
+    }
+
+    /**
+     * Query a book's structure
+     */
+    private static function build_book_structure($blog_id) {
         switch_to_blog($blog_id);
 
         $structure = [
@@ -113,7 +122,9 @@ class ContentService {
             'post_type' => 'part'
         ]));
 
+        $part_index = [];
         foreach ($parts as $part) {
+            $part_index[$part->ID] = count($structure['parts']);
             $structure['parts'][] = [
                 'id' => $part->ID,
                 'title' => $part->post_title,
@@ -134,15 +145,11 @@ class ContentService {
                 'type' => 'chapter'
             ];
 
-            // Try to organize chapters by part
-            $part_id = get_post_meta($chapter->ID, 'pb_part', true);
-            if ($part_id && isset($structure['parts'])) {
-                foreach ($structure['parts'] as &$part) {
-                    if ($part['id'] == $part_id) {
-                        $part['chapters'][] = $chapter_data;
-                        continue 2;
-                    }
-                }
+            // Try to organize chapters by part (meta is primed by get_posts)
+            $part_id = (int)get_post_meta($chapter->ID, 'pb_part', true);
+            if ($part_id && isset($part_index[$part_id])) {
+                $structure['parts'][$part_index[$part_id]]['chapters'][] = $chapter_data;
+                continue;
             }
 
             // If no part, add to root chapters
@@ -209,35 +216,7 @@ class ContentService {
 
         if ($post_id) {
             $post = get_post($post_id);
-            if (!$post) {
-                restore_current_blog();
-                return null;
-            }
-
-            $item = [
-                'type' => 'ltiResourceLink',
-                'title' => $post->post_title,
-                'url' => get_permalink($post->ID),
-                'text' => wp_trim_words($post->post_content, 30)
-            ];
-
-            // Explicit Grading Control: Only request a lineItem if grading is enabled AND H5P exists
-            $grading_enabled = get_post_meta($post_id, '_lti_h5p_grading_enabled', true);
-            $has_h5p = false;
-            
-            if ($grading_enabled) {
-                $activities = H5PActivityDetector::find_h5p_activities($post_id);
-                $has_h5p = !empty($activities);
-            }
-
-            if ($grading_enabled && $has_h5p) {
-                $item['lineItem'] = [
-                    'scoreMaximum' => 100,
-                    'label' => $post->post_title,
-                    'resourceId' => 'pb_chapter_' . $blog_id . '_' . $post_id,
-                    'tag' => 'pressbooks-lti'
-                ];
-            }
+            $item = $post ? self::build_content_item($blog_id, $post) : null;
         } else {
             // Whole book
             $item = [
@@ -252,4 +231,71 @@ class ContentService {
 
         return $item;
     }
+
+    /**
+     * Get content items for several posts of one book
+     *
+     * Switches blog once and primes post and meta caches for the whole set.
+     *
+     * @param int $blog_id Book ID
+     * @param array $post_ids Content IDs, in the order items should be returned
+     * @return array Content items (missing posts are skipped)
+     */
+    public static function get_content_items($blog_id, array $post_ids) {
+        if (!is_multisite() || !$blog_id || empty($post_ids)) {
+            return [];
+        }
+
+        switch_to_blog($blog_id);
+
+        $post_ids = array_map('intval', $post_ids);
+        _prime_post_caches($post_ids, false, true);
+
+        $items = [];
+        foreach ($post_ids as $post_id) {
+            $post = get_post($post_id);
+            if ($post) {
+                $items[] = self::build_content_item($blog_id, $post);
+            }
+        }
+
+        restore_current_blog();
+
+        return $items;
+    }
+
+    /**
+     * Build one post's content item (current blog must be the book)
+     */
+    private static function build_content_item($blog_id, $post) {
+        $item = [
+            'type' => 'ltiResourceLink',
+            'title' => $post->post_title,
+            'url' => get_permalink($post->ID),
+            'text' => wp_trim_words($post->post_content, 30)
+        ];
+
+        // Launches of this item can then resolve without rewrite matching
+        UrlResolutionCache::set($item['url'], $blog_id, $post->ID);
+
+        // Explicit Grading Control: Only request a lineItem if grading is enabled AND H5P exists
+        $grading_enabled = get_post_meta($post->ID, '_lti_h5p_grading_enabled', true);
+        $has_h5p = false;
+
+        if ($grading_enabled) {
+            $activities = H5PActivityDetector::find_h5p_activities($post->ID);
+            $has_h5p = !empty($activities);
+        }
+
+        if ($grading_enabled && $has_h5p) {
+            $item['lineItem'] = [
+                'scoreMaximum' => 100,
+                'label' => $post->post_title,
+                'resourceId' => 'pb_chapter_' . $blog_id . '_' . $post->ID,
+                'tag' => 'pressbooks-lti'
+            ];
+        }
+
+        return $item;
+    }
 }
@@ -0,0 +1,379 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * GradeOutbox
+ *
+ * Durable queue for AGS score delivery. The h5p_alter_user_result hook only
+ * enqueues the calculated score; a WP-Cron (or WP-CLI) worker drains the
+ * queue, posts scores to the LMS and records the outcome in
+ * lti_h5p_grade_sync_log. Repeated writes for the same (user, lineitem)
+ * collapse into one row so only the latest score is sent.
+ */
+class GradeOutbox {
+
+    const CRON_HOOK = 'pb_lti_drain_grade_outbox';
+
+    const STATUS_PENDING = 'pending';
+    const STATUS_PROCESSING = 'processing';
+    const STATUS_FAILED = 'failed';
+
+    const BATCH_SIZE = 50;
+    const MAX_ATTEMPTS = 8;
+    const LEASE_SECONDS = 120;      // A crashed worker's claim expires after this
+    const BACKOFF_BASE = 30;        // Seconds; doubles on each failed attempt
+    const BACKOFF_MAX = 3600;
+
+    /**
+     * Initialize worker hook
+     */
+    public static function init() {
+        add_action(self::CRON_HOOK, [__CLASS__, 'drain']);
+    }
+
+    /**
+     * Queue a score for delivery, replacing any undelivered score for the same lineitem
+     *
+     * @param array $item Keys: user_id, post_id, result_id, platform_issuer, lti_user_id,
+     *                    lineitem_url, score, max_score, percentage, chapter_score (true when
+     *                    the score is the chapter's aggregate rather than a single activity's)
+     * @return bool True if queued
+     */
+    public static function enqueue(array $item) {
+        global $wpdb;
+
+        $table = self::table();
+        $now = current_time('mysql', true);
+
+        $queued = $wpdb->query($wpdb->prepare(
+            "INSERT INTO {$table}
+                (blog_id, user_id, post_id, result_id, platform_issuer, lti_user_id, lineitem_url, lineitem_hash,
+                 score, max_score, percentage, chapter_score, status, attempts, version, next_attempt_at, created_at, updated_at)
+             VALUES (%d, %d, %d, %d, %s, %s, %s, %s, %f, %f, %f, %d, %s, 0, 1, %s, %s, %s)
+             ON DUPLICATE KEY UPDATE
+                blog_id = VALUES(blog_id),
+                post_id = VALUES(post_id),
+                result_id = VALUES(result_id),
+                platform_issuer = VALUES(platform_issuer),
+                lti_user_id = VALUES(lti_user_id),
+                score = VALUES(score),
+                max_score = VALUES(max_score),
+                percentage = VALUES(percentage),
+                chapter_score = VALUES(chapter_score),
+                status = VALUES(status),
+                attempts = 0,
+                version = version + 1,
+                last_error = NULL,
+                next_attempt_at = VALUES(next_attempt_at),
+                updated_at = VALUES(updated_at)",
+            $item['blog_id'] ?? get_current_blog_id(),
+            $item['user_id'],
+            $item['post_id'],
+            $item['result_id'] ?? 0,
+            $item['platform_issuer'],
+            $item['lti_user_id'],
+            $item['lineitem_url'],
+            md5($item['lineitem_url']),
+            $item['score'],
+            $item['max_score'],
+            $item['percentage'],
+            empty($item['chapter_score']) ? 0 : 1,
+            self::STATUS_PENDING,
+            $now,
+            $now,
+            $now
+        ));
+
+        if ($queued === false) {
+            error_log('[PB-LTI Outbox] Failed to queue score for user ' . $item['user_id'] . ': ' . $wpdb->last_error);
+            return false;
+        }
+
+        self::schedule(time());
+
+        return true;
+    }
+
+    /**
+     * Deliver due scores (WP-Cron / WP-CLI entry point)
+     *
+     * @param int $limit Maximum rows to process in this run
+     * @return array ['sent' => int, 'retrying' => int, 'failed' => int]
+     */
+    public static function drain($limit = self::BATCH_SIZE) {
+        global $wpdb;
+
+        $table = self::table();
+        $stats = ['sent' => 0, 'retrying' => 0, 'failed' => 0];
+
+        // Pending rows that are due, plus processing rows whose lease has expired
+        $rows = $wpdb->get_results($wpdb->prepare(
+            "SELECT * FROM {$table}
+             WHERE status IN (%s, %s) AND next_attempt_at <= %s
+             ORDER BY next_attempt_at ASC
+             LIMIT %d",
+            self::STATUS_PENDING,
+            self::STATUS_PROCESSING,
+            current_time('mysql', true),
+            (int)$limit
+        ));
+
+        foreach ($rows as $row) {
+            if (!self::claim($row)) {
+                continue; // Another worker took it, or it was re-queued meanwhile
+            }
+
+            $outcome = self::deliver($row);
+            $stats[$outcome]++;
+        }
+
+        self::schedule_next();
+
+        if ($stats['sent'] || $stats['retrying'] || $stats['failed']) {
+            error_log(sprintf(
+                '[PB-LTI Outbox] Drain complete: %d sent, %d retrying, %d failed',
+                $stats['sent'],
+                $stats['retrying'],
+                $stats['failed']
+            ));
+        }
+
+        return $stats;
+    }
+
+    /**
+     * Count queued rows by status
+     *
+     * @return array status => count
+     */
+    public static function stats() {
+        global $wpdb;
+
+        $table = self::table();
+        $rows = $wpdb->get_results("SELECT status, COUNT(*) AS total FROM {$table} GROUP BY status", ARRAY_A);
+
+        $counts = [self::STATUS_PENDING => 0, self::STATUS_PROCESSING => 0, self::STATUS_FAILED => 0];
+        foreach ($rows as $row) {
+            $counts[$row['status']] = (int)$row['total'];
+        }
+
+        return $counts;
+    }
+
+    /**
+     * Move given-up rows back to pending so the worker tries them again
+     *
+     * @return int Number of rows re-queued
+     */
+    public static function retry_failed() {
+        global $wpdb;
+
+        $table = self::table();
+        $count = $wpdb->query($wpdb->prepare(
+            "UPDATE {$table} SET status = %s, attempts = 0, next_attempt_at = %s WHERE status = %s",
+            self::STATUS_PENDING,
+            current_time('mysql', true),
+            self::STATUS_FAILED
+        ));
+
+        if ($count) {
+            self::schedule(time());
+        }
+
+        return (int)$count;
+    }
+
+    /**
+     * Atomically claim a row for this worker
+     */
+    private static function claim($row) {
+        global $wpdb;
+
+        $table = self::table();
+        $claimed = $wpdb->query($wpdb->prepare(
+            "UPDATE {$table} SET status = %s, next_attempt_at = %s
+             WHERE id = %d AND version = %d AND next_attempt_at <= %s",
+            self::STATUS_PROCESSING,
+            gmdate('Y-m-d H:i:s', time() + self::LEASE_SECONDS),
+            $row->id,
+            $row->version,
+            current_time('mysql', true)
+        ));
+
+        return $claimed === 1;
+    }
+
+    /**
+     * Post a claimed row's score and record the outcome
+     *
+     * @return string 'sent', 'retrying' or 'failed'
+     */
+    private static function deliver($row) {
+        $platform = PlatformRegistry::find($row->platform_issuer);
+
+        if (!$platform) {
+            return self::give_up($row, (float)$row->score, (float)$row->max_score, 'Platform not found for issuer: ' . $row->platform_issuer);
+        }
+
+        $final_score = (float)$row->score;
+        $final_max = (float)$row->max_score;
+
+        // Lineitem details (cached) to detect scale vs points
+        $lineitem = LineItemCache::resolve($platform, $row->lineitem_url);
+        if ($lineitem) {
+            $scale_type = ScaleMapper::detect_scale($lineitem);
+            if ($scale_type && $scale_type !== 'unknown') {
+                $mapped = ScaleMapper::map_to_scale((float)$row->percentage, $scale_type);
+                $final_score = $mapped['score'];
+                $final_max = $mapped['max'];
+            }
+        }
+
+        $result = AGSClient::post_score(
+            $platform,
+            $row->lineitem_url,
+            $row->lti_user_id,
+            $final_score,
+            $final_max,
+            'Completed',
+            'FullyGraded'
+        );
+
+        if ($result['success']) {
+            self::log_sync($row, $final_score, $final_max, 'success', null);
+            self::remove($row);
+            return 'sent';
+        }
+
+        $error = $result['error'] ?? 'Unknown error';
+        $attempts = (int)$row->attempts + 1;
+
+        // Client errors other than auth/throttling will not succeed on retry
+        $status = $result['status'] ?? null;
+        $permanent = $status && $status >= 400 && $status < 500 && !in_array($status, [401, 408, 429], true);
+
+        if ($permanent) {
+            // The lineitem may have changed (deleted, rescaled) - don't trust cached metadata
+            LineItemCache::invalidate($row->lineitem_url);
+        }
+
+        if ($permanent || $attempts >= self::MAX_ATTEMPTS) {
+            return self::give_up($row, $final_score, $final_max, $error);
+        }
+
+        global $wpdb;
+        $table = self::table();
+        $delay = min(self::BACKOFF_MAX, self::BACKOFF_BASE * (2 ** ($attempts - 1)));
+        $delay += wp_rand(0, (int)($delay / 4)); // Jitter so retries don't stampede the LMS
+
+        $wpdb->query($wpdb->prepare(
+            "UPDATE {$table} SET status = %s, attempts = %d, last_error = %s, next_attempt_at = %s, updated_at = %s
+             WHERE id = %d AND version = %d",
+            self::STATUS_PENDING,
+            $attempts,
+            $error,
+            gmdate('Y-m-d H:i:s', time() + $delay),
+            current_time('mysql', true),
+            $row->id,
+            $row->version
+        ));
+
+        error_log('[PB-LTI Outbox] Attempt ' . $attempts . ' failed for user ' . $row->user_id . ', retrying in ' . $delay . 's: ' . $error);
+
+        return 'retrying';
+    }
+
+    private static function give_up($row, $score, $max_score, $error) {
+        global $wpdb;
+
+        $table = self::table();
+        $wpdb->query($wpdb->prepare(
+            "UPDATE {$table} SET status = %s, attempts = attempts + 1, last_error = %s, updated_at = %s
+             WHERE id = %d AND version = %d",
+            self::STATUS_FAILED,
+            $error,
+            current_time('mysql', true),
+            $row->id,
+            $row->version
+        ));
+
+        self::log_sync($row, $score, $max_score, 'failed', $error);
+        error_log('[PB-LTI Outbox] ❌ Giving up on score for user ' . $row->user_id . ', post ' . $row->post_id . ': ' . $error);
+
+        return 'failed';
+    }
+
+    /**
+     * Delete a delivered row unless a newer score was queued meanwhile
+     */
+    private static function remove($row) {
+        global $wpdb;
+        $wpdb->query($wpdb->prepare(
+            "DELETE FROM " . self::table() . " WHERE id = %d AND version = %d",
+            $row->id,
+            $row->version
+        ));
+    }
+
+    /**
+     * Write the outcome to the book blog's sync log
+     */
+    private static function log_sync($row, $score, $max_score, $status, $error) {
+        $switched = is_multisite() && (int)$row->blog_id !== get_current_blog_id();
+        if ($switched) {
+            switch_to_blog((int)$row->blog_id);
+        }
+
+        H5PGradeSyncEnhanced::update_sync_timestamp(
+            (int)$row->user_id,
+            (int)$row->post_id,
+            (int)$row->result_id,
+            $score,
+            $max_score,
+            $status,
+            $error
+        );
+
+        // Individual-activity fallbacks share the lineitem but aren't the chapter's score
+        if ($status === 'success' && (int)$row->chapter_score === 1) {
+            ChapterScores::mark_synced((int)$row->user_id, (int)$row->post_id, (float)$row->percentage);
+        }
+
+        if ($switched) {
+            restore_current_blog();
+        }
+    }
+
+    /**
+     * Schedule the worker for the earliest pending row, if any
+     */
+    private static function schedule_next() {
+        global $wpdb;
+
+        $next = $wpdb->get_var($wpdb->prepare(
+            "SELECT MIN(next_attempt_at) FROM " . self::table() . " WHERE status IN (%s, %s)",
+            self::STATUS_PENDING,
+            self::STATUS_PROCESSING
+        ));
+
+        if ($next) {
+            self::schedule(max(time(), strtotime($next . ' UTC')));
+        }
+    }
+
+    private static function schedule($timestamp) {
+        $scheduled = wp_next_scheduled(self::CRON_HOOK);
+        if ($scheduled && $scheduled <= $timestamp) {
+            return;
+        }
+        if ($scheduled) {
+            wp_unschedule_event($scheduled, self::CRON_HOOK);
+        }
+        wp_schedule_single_event($timestamp, self::CRON_HOOK);
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_grade_outbox';
+    }
+}
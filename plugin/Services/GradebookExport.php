@@ -0,0 +1,207 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * GradebookExport
+ *
+ * Streams per-student chapter scores, per-activity calculated scores and
+ * LMS sync status as CSV (one row per student and activity) or JSONL (one
+ * object per student and chapter). Students are read in user-ID keyset
+ * chunks and each chunk is written and flushed before the next is loaded,
+ * so memory stays flat however large the class or book is.
+ */
+class GradebookExport {
+
+    const FORMAT_CSV = 'csv';
+    const FORMAT_JSONL = 'jsonl';
+    const CHUNK = 500;
+
+    const CSV_COLUMNS = [
+        'chapter_id', 'chapter_title', 'user_id', 'display_name', 'user_email',
+        'activity_id', 'activity_title', 'grading_scheme', 'activity_score', 'activity_max_score', 'attempts',
+        'chapter_score', 'chapter_max_score', 'chapter_percentage',
+        'synced_percentage', 'synced_at', 'sync_status'
+    ];
+
+    /**
+     * Grading-enabled chapters of the current book, in book order
+     *
+     * @return int[] Post IDs
+     */
+    public static function grading_chapters() {
+        return array_map('intval', get_posts([
+            'post_type' => H5PContentIndex::POST_TYPES,
+            'posts_per_page' => -1,
+            'fields' => 'ids',
+            'orderby' => 'menu_order',
+            'order' => 'ASC',
+            'meta_key' => '_lti_h5p_grading_enabled',
+            'meta_value' => '1'
+        ]));
+    }
+
+    /**
+     * Stream an export of the current book's chapters
+     *
+     * @param int[] $post_ids Chapters to export
+     * @param string $format FORMAT_CSV or FORMAT_JSONL
+     * @param resource $handle Writable stream (e.g. php://output)
+     * @return int Student-chapter records written
+     */
+    public static function stream(array $post_ids, $format, $handle) {
+        if ($format === self::FORMAT_CSV) {
+            fputcsv($handle, self::CSV_COLUMNS);
+        }
+
+        // Check every chapter's H5P inventory in one query instead of one per chapter
+        H5PActivityDetector::prime_inventories($post_ids);
+
+        $written = 0;
+        foreach ($post_ids as $post_id) {
+            $written += self::stream_chapter((int)$post_id, $format, $handle);
+        }
+
+        return $written;
+    }
+
+    /**
+     * Write one chapter, chunk by chunk
+     */
+    private static function stream_chapter($post_id, $format, $handle) {
+        global $wpdb;
+
+        $post = get_post($post_id);
+        if (!$post) {
+            return 0;
+        }
+
+        $configured = H5PResultsManager::get_configured_activities($post_id);
+        $activities = H5PResultsManager::get_result_activities($post_id, $configured);
+        if (empty($activities)) {
+            return 0;
+        }
+
+        $config = H5PResultsManager::get_configuration($post_id);
+        $titles = array_column(H5PActivityDetector::find_h5p_activities($post_id), 'title', 'id');
+        $h5p_ids = array_map('intval', array_column($activities, 'h5p_id'));
+        $id_list = implode(',', $h5p_ids);
+
+        $written = 0;
+        $last_user_id = 0;
+
+        do {
+            // Next chunk of students with results in this chapter
+            $user_ids = array_map('intval', $wpdb->get_col($wpdb->prepare(
+                "SELECT DISTINCT user_id FROM {$wpdb->prefix}h5p_results
+                 WHERE content_id IN ({$id_list}) AND user_id > %d
+                 ORDER BY user_id ASC
+                 LIMIT %d",
+                $last_user_id,
+                self::CHUNK
+            )));
+            if (empty($user_ids)) {
+                break;
+            }
+            $last_user_id = end($user_ids);
+
+            $users = $wpdb->get_results(
+                "SELECT ID, display_name, user_email FROM {$wpdb->users}
+                 WHERE ID IN (" . implode(',', $user_ids) . ")
+                 ORDER BY ID ASC"
+            );
+            $attempts = H5PResultsManager::load_attempts($h5p_ids, $user_ids);
+            $scores = empty($configured) ? [] : ChapterScores::for_post($post_id, $user_ids);
+
+            foreach ($users as $user) {
+                $record = self::build_record($post, $user, $activities, $config, $titles, $attempts[(int)$user->ID] ?? [], $scores[(int)$user->ID] ?? null);
+                self::write($record, $format, $handle);
+                $written++;
+            }
+
+            unset($users, $attempts, $scores);
+            fflush($handle);
+            flush();
+        } while (count($user_ids) === self::CHUNK);
+
+        return $written;
+    }
+
+    /**
+     * One student's chapter record
+     */
+    private static function build_record($post, $user, array $activities, array $config, array $titles, array $user_attempts, $score) {
+        $record = [
+            'chapter_id' => (int)$post->ID,
+            'chapter_title' => $post->post_title,
+            'user_id' => (int)$user->ID,
+            'display_name' => $user->display_name,
+            'user_email' => $user->user_email,
+            'chapter_score' => $score ? (float)$score['score'] : 0.0,
+            'chapter_max_score' => $score ? (float)$score['max_score'] : 0.0,
+            'chapter_percentage' => $score ? (float)$score['percentage'] : 0.0,
+            'synced_percentage' => $score && $score['synced_percentage'] !== null ? (float)$score['synced_percentage'] : null,
+            'synced_at' => $score ? $score['synced_at'] : null,
+            'sync_status' => self::sync_status($score),
+            'activities' => []
+        ];
+
+        foreach ($activities as $activity) {
+            $h5p_id = (int)$activity['h5p_id'];
+            $scheme = $config['activities'][$h5p_id]['scheme'] ?? $activity['grading_scheme'];
+            $calculated = H5PResultsManager::score_attempts($user_attempts[$h5p_id] ?? [], $scheme);
+
+            $record['activities'][] = [
+                'activity_id' => $h5p_id,
+                'activity_title' => $titles[$h5p_id] ?? 'H5P #' . $h5p_id,
+                'grading_scheme' => $scheme,
+                'activity_score' => (float)$calculated['score'],
+                'activity_max_score' => (float)$calculated['max_score'],
+                'attempts' => count($user_attempts[$h5p_id] ?? [])
+            ];
+        }
+
+        return $record;
+    }
+
+    /**
+     * never (no grade delivered), pending (delivered grade is out of date), synced, or ungraded
+     */
+    private static function sync_status($score) {
+        if (!$score) {
+            return 'ungraded';
+        }
+        if ($score['synced_percentage'] === null) {
+            return 'never';
+        }
+        return $score['needs_sync'] ? 'pending' : 'synced';
+    }
+
+    private static function write(array $record, $format, $handle) {
+        if ($format === self::FORMAT_JSONL) {
+            fwrite($handle, wp_json_encode($record) . "\n");
+            return;
+        }
+
+        $chapter = $record;
+        unset($chapter['activities']);
+
+        foreach ($record['activities'] as $activity) {
+            $row = array_merge($chapter, $activity);
+            $line = [];
+            foreach (self::CSV_COLUMNS as $column) {
+                $line[] = self::csv_cell($row[$column] ?? '');
+            }
+            fputcsv($handle, $line);
+        }
+    }
+
+    /**
+     * Neutralize spreadsheet formulas in user-controlled text
+     */
+    private static function csv_cell($value) {
+        if (is_string($value) && $value !== '' && strpos('=+-@', $value[0]) !== false) {
+            return "'" . $value;
+        }
+        return $value;
+    }
+}
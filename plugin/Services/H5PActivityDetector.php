@@ -4,10 +4,29 @@ namespace PB_LTI\Services;
 /**
  * H5PActivityDetector
  *
- * Detects and extracts H5P activities from chapter content
+ * Detects and extracts H5P activities from chapter content. Each post's
+ * activity inventory (ID, title, library, position, max score) is computed
+ * when the post is saved and stored in the _lti_h5p_inventory post meta, so
+ * chapter lists read it with the rest of the post's meta instead of querying
+ * the H5P tables per activity. Entries keep the H5P content's updated_at;
+ * when an item is edited or deleted in the H5P admin the stored value no
+ * longer matches and the inventory is rebuilt on the next read. Chapter lists
+ * call prime_inventories() first so that check is one query for all of them.
  */
 class H5PActivityDetector {
 
+    const INVENTORY_META = '_lti_h5p_inventory';
+
+    /** @var array "blog:post" keys whose inventory was checked against h5p_contents in this request */
+    private static $checked = [];
+
+    /**
+     * Initialize inventory maintenance hook
+     */
+    public static function init() {
+        add_action('save_post', [__CLASS__, 'refresh_inventory'], 10, 2);
+    }
+
     /**
      * Find all H5P shortcodes in post content
      *
@@ -15,119 +34,218 @@ class H5PActivityDetector {
      * @return array Array of H5P activities with metadata
      */
     public static function find_h5p_activities($post_id) {
-        $post = get_post($post_id);
-        if (!$post) {
-            return [];
+        if (!isset(self::$checked[get_current_blog_id() . ':' . $post_id])) {
+            self::prime_inventories([$post_id]);
         }
 
-        $content = $post->post_content;
-        $activities = [];
+        $inventory = get_post_meta($post_id, self::INVENTORY_META, true);
+        return is_array($inventory) ? $inventory : [];
+    }
 
-        // Pattern 1: [h5p id="123"]
-        if (preg_match_all('/\[h5p\s+id=["\']?(\d+)["\']?\]/i', $content, $matches)) {
-            foreach ($matches[1] as $index => $h5p_id) {
-                $activities[] = self::get_h5p_activity_data($h5p_id, $index);
+    /**
+     * Bring the stored inventories of several posts (current blog) up to date
+     *
+     * Loads their meta in one query and checks every activity against
+     * h5p_contents.updated_at in one more; only posts with missing or stale
+     * inventories are rebuilt. Each post is checked once per request.
+     *
+     * @param int[] $post_ids Post IDs
+     */
+    public static function prime_inventories(array $post_ids) {
+        global $wpdb;
+
+        $blog_id = get_current_blog_id();
+        $post_ids = array_values(array_filter(array_map('intval', $post_ids), function ($post_id) use ($blog_id) {
+            return !isset(self::$checked[$blog_id . ':' . $post_id]);
+        }));
+        if (empty($post_ids)) {
+            return;
+        }
+
+        update_meta_cache('post', $post_ids);
+
+        $inventories = [];
+        $rebuild = [];
+        foreach ($post_ids as $post_id) {
+            $inventory = get_post_meta($post_id, self::INVENTORY_META, true);
+            if (is_array($inventory)) {
+                $inventories[$post_id] = $inventory;
+            } else {
+                $rebuild[] = $post_id; // Saved before the inventory existed
             }
         }
 
-        // Pattern 2: [h5p-iframe id="123"]
-        if (preg_match_all('/\[h5p-iframe\s+id=["\']?(\d+)["\']?\]/i', $content, $matches)) {
-            foreach ($matches[1] as $index => $h5p_id) {
-                if (!self::activity_exists($activities, $h5p_id)) {
-                    $activities[] = self::get_h5p_activity_data($h5p_id, $index);
-                }
+        $h5p_ids = [];
+        foreach ($inventories as $inventory) {
+            $h5p_ids = array_merge($h5p_ids, array_map('intval', array_column($inventory, 'id')));
+        }
+        $h5p_ids = array_unique($h5p_ids);
+
+        $current = empty($h5p_ids) ? [] : $wpdb->get_results(
+            "SELECT id, updated_at FROM {$wpdb->prefix}h5p_contents WHERE id IN (" . implode(',', $h5p_ids) . ")",
+            OBJECT_K
+        );
+
+        foreach ($inventories as $post_id => $inventory) {
+            if (self::is_stale($inventory, $current)) {
+                $rebuild[] = $post_id;
             }
         }
 
-        return $activities;
+        foreach ($rebuild as $post_id) {
+            $post = get_post($post_id);
+            if ($post) {
+                update_post_meta($post_id, self::INVENTORY_META, self::build_inventory($post->post_content));
+            }
+        }
+
+        foreach ($post_ids as $post_id) {
+            self::$checked[$blog_id . ':' . $post_id] = true;
+        }
     }
 
     /**
-     * Get H5P activity metadata
+     * Whether any activity was edited or deleted in H5P since the inventory was built
      *
-     * @param int $h5p_id H5P content ID
-     * @param int $position Position in chapter
-     * @return array Activity data
+     * Inventories stored before updated_at was recorded count as stale, so
+     * they are rebuilt once.
+     *
+     * @param array $inventory Stored inventory
+     * @param array $current h5p_contents rows (id, updated_at) keyed by ID
+     * @return bool
      */
-    private static function get_h5p_activity_data($h5p_id, $position) {
-        global $wpdb;
+    private static function is_stale(array $inventory, array $current) {
+        foreach ($inventory as $activity) {
+            $updated_at = isset($current[$activity['id']]) ? $current[$activity['id']]->updated_at : null;
+            if (!array_key_exists('updated_at', $activity) || $activity['updated_at'] !== $updated_at) {
+                return true;
+            }
+        }
 
-        // Get H5P content from database
-        $h5p_table = $wpdb->prefix . 'h5p_contents';
-        $h5p_content = $wpdb->get_row($wpdb->prepare(
-            "SELECT * FROM {$h5p_table} WHERE id = %d",
-            $h5p_id
-        ));
-
-        $title = $h5p_content ? $h5p_content->title : 'H5P Activity #' . $h5p_id;
-        $library = $h5p_content ? self::get_h5p_library_name($h5p_content->library_id) : 'Unknown';
-
-        return [
-            'id' => (int)$h5p_id,
-            'title' => $title,
-            'library' => $library,
-            'position' => $position + 1,
-            'max_score' => self::get_h5p_max_score($h5p_id)
-        ];
+        return false;
     }
 
     /**
-     * Get H5P library name
+     * Recompute a post's inventory (save_post handler)
      *
-     * @param int $library_id Library ID
-     * @return string Library name
+     * @param int $post_id Post ID
+     * @param \WP_Post $post Post object
      */
-    private static function get_h5p_library_name($library_id) {
-        global $wpdb;
-
-        $library_table = $wpdb->prefix . 'h5p_libraries';
-        $library = $wpdb->get_row($wpdb->prepare(
-            "SELECT title FROM {$library_table} WHERE id = %d",
-            $library_id
-        ));
+    public static function refresh_inventory($post_id, $post) {
+        if (wp_is_post_revision($post_id) || wp_is_post_autosave($post_id)) {
+            return;
+        }
+        if (!in_array($post->post_type, H5PContentIndex::POST_TYPES, true)) {
+            return;
+        }
 
-        return $library ? $library->title : 'Unknown';
+        update_post_meta($post_id, self::INVENTORY_META, self::build_inventory($post->post_content));
+        self::$checked[get_current_blog_id() . ':' . $post_id] = true;
     }
 
     /**
-     * Get maximum possible score for H5P content
-     * Note: H5P stores max_score in wp_h5p_results, not wp_h5p_contents
+     * Record an activity's max score from a newly saved result
+     *
+     * The inventory takes max scores from the latest result, so activities
+     * with no results yet start at 0.
      *
+     * @param int $post_id Post ID
      * @param int $h5p_id H5P content ID
-     * @return int Maximum score
+     * @param int $max_score Max score from the result
      */
-    private static function get_h5p_max_score($h5p_id) {
-        global $wpdb;
+    public static function update_max_score($post_id, $h5p_id, $max_score) {
+        $inventory = get_post_meta($post_id, self::INVENTORY_META, true);
+        if (!is_array($inventory)) {
+            return;
+        }
+
+        foreach ($inventory as &$activity) {
+            if ($activity['id'] === (int)$h5p_id) {
+                if ($activity['max_score'] === (int)$max_score) {
+                    return;
+                }
+                $activity['max_score'] = (int)$max_score;
+                update_post_meta($post_id, self::INVENTORY_META, $inventory);
+                return;
+            }
+        }
+    }
+
+    /**
+     * Extract H5P content IDs from shortcodes, in order of first appearance
+     *
+     * @param string $content Post content
+     * @return int[] Unique H5P content IDs
+     */
+    public static function extract_h5p_ids($content) {
+        $ids = [];
 
-        // Try to get max_score from recent results
-        $results_table = $wpdb->prefix . 'h5p_results';
-        $result = $wpdb->get_row($wpdb->prepare(
-            "SELECT max_score FROM {$results_table} WHERE content_id = %d ORDER BY id DESC LIMIT 1",
-            $h5p_id
-        ));
+        // Pattern 1: [h5p id="123"]
+        if (preg_match_all('/\[h5p\s+id=["\']?(\d+)["\']?\]/i', $content, $matches)) {
+            $ids = array_map('intval', $matches[1]);
+        }
 
-        if ($result && isset($result->max_score)) {
-            return (int)$result->max_score;
+        // Pattern 2: [h5p-iframe id="123"]
+        if (preg_match_all('/\[h5p-iframe\s+id=["\']?(\d+)["\']?\]/i', $content, $matches)) {
+            $ids = array_merge($ids, array_map('intval', $matches[1]));
         }
 
-        // If no results yet, return 0 (will be updated when first result is saved)
-        return 0;
+        return array_values(array_unique($ids));
     }
 
     /**
-     * Check if activity already exists in array
+     * Build the activity inventory for some content
      *
-     * @param array $activities Activity array
-     * @param int $h5p_id H5P ID to check
-     * @return bool
+     * Titles and libraries come from one h5p_contents/h5p_libraries join and
+     * max scores from one query for each activity's latest result
+     * (H5P stores max_score in wp_h5p_results, not wp_h5p_contents).
+     *
+     * @param string $content Post content
+     * @return array Activities with id, title, library, position, max_score, updated_at
      */
-    private static function activity_exists($activities, $h5p_id) {
-        foreach ($activities as $activity) {
-            if ($activity['id'] == $h5p_id) {
-                return true;
-            }
+    private static function build_inventory($content) {
+        global $wpdb;
+
+        $h5p_ids = self::extract_h5p_ids($content);
+        if (empty($h5p_ids)) {
+            return [];
         }
-        return false;
+
+        $id_list = implode(',', $h5p_ids);
+
+        $contents = $wpdb->get_results(
+            "SELECT c.id, c.title, c.updated_at, l.title AS library
+             FROM {$wpdb->prefix}h5p_contents c
+             LEFT JOIN {$wpdb->prefix}h5p_libraries l ON l.id = c.library_id
+             WHERE c.id IN ({$id_list})",
+            OBJECT_K
+        );
+
+        $max_scores = $wpdb->get_results(
+            "SELECT content_id, max_score FROM {$wpdb->prefix}h5p_results
+             WHERE id IN (
+                 SELECT MAX(id) FROM {$wpdb->prefix}h5p_results WHERE content_id IN ({$id_list}) GROUP BY content_id
+             )",
+            OBJECT_K
+        );
+
+        $activities = [];
+        foreach ($h5p_ids as $index => $h5p_id) {
+            $h5p_content = $contents[$h5p_id] ?? null;
+
+            $activities[] = [
+                'id' => (int)$h5p_id,
+                'title' => $h5p_content ? $h5p_content->title : 'H5P Activity #' . $h5p_id,
+                'library' => $h5p_content && $h5p_content->library ? $h5p_content->library : 'Unknown',
+                'position' => $index + 1,
+                // If no results yet, 0 (updated when the first result is saved)
+                'max_score' => isset($max_scores[$h5p_id]) ? (int)$max_scores[$h5p_id]->max_score : 0,
+                // h5p_contents.updated_at when built (null if the content doesn't exist)
+                'updated_at' => $h5p_content ? $h5p_content->updated_at : null
+            ];
+        }
+
+        return $activities;
     }
 
     /**
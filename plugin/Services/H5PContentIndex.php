@@ -0,0 +1,179 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * H5PContentIndex
+ *
+ * Reverse index from H5P content ID to the published chapter that embeds it
+ * (lti_h5p_index, keyed by blog). Maintained on save_post using the same
+ * shortcode parsing as H5PActivityDetector, so grade sync can find a
+ * result's chapter with a primary-key lookup instead of scanning post_content.
+ */
+class H5PContentIndex {
+
+    const POST_TYPES = ['chapter', 'front-matter', 'back-matter'];
+    const BUILT_OPTION = 'pb_lti_h5p_index_built';
+    const BACKFILL_CHUNK = 200;
+    const BACKFILL_HOOK = 'pb_lti_backfill_h5p_index';
+
+    /**
+     * @var array Per-request memo: "blog:h5p" => post_id|null
+     */
+    private static $memo = [];
+
+    /**
+     * Initialize index maintenance hooks
+     */
+    public static function init() {
+        add_action('save_post', [__CLASS__, 'index_post'], 10, 2);
+        add_action('deleted_post', [__CLASS__, 'remove_post']);
+        add_action(self::BACKFILL_HOOK, [__CLASS__, 'backfill']);
+    }
+
+    /**
+     * Re-index one post's H5P shortcodes (save_post handler)
+     *
+     * @param int $post_id Post ID
+     * @param \WP_Post $post Post object
+     */
+    public static function index_post($post_id, $post) {
+        if (wp_is_post_revision($post_id) || wp_is_post_autosave($post_id)) {
+            return;
+        }
+
+        $h5p_ids = self::is_indexable($post)
+            ? H5PActivityDetector::extract_h5p_ids($post->post_content)
+            : [];
+
+        self::replace(get_current_blog_id(), (int)$post_id, $h5p_ids);
+    }
+
+    /**
+     * Drop a deleted post from the index
+     *
+     * @param int $post_id Post ID
+     */
+    public static function remove_post($post_id) {
+        self::replace(get_current_blog_id(), (int)$post_id, []);
+    }
+
+    /**
+     * Find the chapter that embeds an H5P activity
+     *
+     * @param int $h5p_id H5P content ID
+     * @param int|null $blog_id Book blog ID (default: current blog)
+     * @return int|null Post ID, or null if no published chapter embeds it
+     */
+    public static function find_post($h5p_id, $blog_id = null) {
+        global $wpdb;
+
+        $blog_id = $blog_id ?: get_current_blog_id();
+        $memo_key = $blog_id . ':' . (int)$h5p_id;
+
+        if (array_key_exists($memo_key, self::$memo)) {
+            return self::$memo[$memo_key];
+        }
+
+        $post_id = $wpdb->get_var($wpdb->prepare(
+            "SELECT MIN(post_id) FROM " . self::table() . " WHERE blog_id = %d AND h5p_id = %d",
+            $blog_id,
+            $h5p_id
+        ));
+
+        self::$memo[$memo_key] = $post_id ? (int)$post_id : null;
+        return self::$memo[$memo_key];
+    }
+
+    /**
+     * Whether the current book has been backfilled
+     *
+     * @return bool
+     */
+    public static function is_built() {
+        return (bool)get_option(self::BUILT_OPTION);
+    }
+
+    /**
+     * Queue a background backfill of the current book
+     */
+    public static function schedule_backfill() {
+        if (!wp_next_scheduled(self::BACKFILL_HOOK)) {
+            wp_schedule_single_event(time(), self::BACKFILL_HOOK);
+        }
+    }
+
+    /**
+     * Index every published chapter in the current book
+     *
+     * @return int Number of posts indexed
+     */
+    public static function backfill() {
+        global $wpdb;
+
+        $blog_id = get_current_blog_id();
+        $placeholders = implode(',', array_fill(0, count(self::POST_TYPES), '%s'));
+        $last_id = 0;
+        $indexed = 0;
+
+        $wpdb->query($wpdb->prepare("DELETE FROM " . self::table() . " WHERE blog_id = %d", $blog_id));
+
+        do {
+            $posts = $wpdb->get_results($wpdb->prepare(
+                "SELECT ID, post_content FROM {$wpdb->posts}
+                 WHERE post_type IN ($placeholders) AND post_status = 'publish' AND ID > %d
+                 ORDER BY ID ASC
+                 LIMIT %d",
+                ...array_merge(self::POST_TYPES, [$last_id, self::BACKFILL_CHUNK])
+            ));
+
+            $values = [];
+            foreach ($posts as $post) {
+                $last_id = (int)$post->ID;
+                foreach (H5PActivityDetector::extract_h5p_ids($post->post_content) as $h5p_id) {
+                    $values[] = $wpdb->prepare("(%d, %d, %d)", $blog_id, $h5p_id, $post->ID);
+                }
+                $indexed++;
+            }
+
+            if ($values) {
+                $wpdb->query("INSERT IGNORE INTO " . self::table() . " (blog_id, h5p_id, post_id) VALUES " . implode(', ', $values));
+            }
+        } while (count($posts) === self::BACKFILL_CHUNK);
+
+        update_option(self::BUILT_OPTION, time());
+        self::$memo = [];
+
+        return $indexed;
+    }
+
+    /**
+     * Replace a post's index entries
+     */
+    private static function replace($blog_id, $post_id, array $h5p_ids) {
+        global $wpdb;
+
+        $table = self::table();
+        $wpdb->query($wpdb->prepare("DELETE FROM {$table} WHERE blog_id = %d AND post_id = %d", $blog_id, $post_id));
+
+        if ($h5p_ids) {
+            $values = [];
+            foreach ($h5p_ids as $h5p_id) {
+                $values[] = $wpdb->prepare("(%d, %d, %d)", $blog_id, $h5p_id, $post_id);
+            }
+            $wpdb->query("INSERT IGNORE INTO {$table} (blog_id, h5p_id, post_id) VALUES " . implode(', ', $values));
+        }
+
+        self::$memo = [];
+    }
+
+    private static function is_indexable($post) {
+        return $post
+            && $post->post_status === 'publish'
+            && in_array($post->post_type, self::POST_TYPES, true);
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_h5p_index';
+    }
+}
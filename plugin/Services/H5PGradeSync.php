@@ -65,7 +65,7 @@ class H5PGradeSync {
         }
 
         // Fetch lineitem details to detect if it's a scale or points
-        $lineitem = AGSClient::fetch_lineitem($platform, $lineitem_url);
+        $lineitem = LineItemCache::resolve($platform, $lineitem_url);
 
         $final_score = $score;
         $final_max = $max_score;
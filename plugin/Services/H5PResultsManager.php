@@ -22,6 +22,7 @@ class H5PResultsManager {
     public static function save_configuration($post_id, $config) {
         global $wpdb;
         $table = $wpdb->prefix . 'lti_h5p_grading_config';
+        $previous = self::get_configuration($post_id);
 
         // Delete existing configuration
         $wpdb->delete($table, ['post_id' => $post_id]);
@@ -45,6 +46,15 @@ class H5PResultsManager {
         // Save overall chapter settings
         update_post_meta($post_id, '_lti_h5p_grading_enabled', !empty($config['enabled']));
         update_post_meta($post_id, '_lti_h5p_grading_aggregate', $config['aggregate'] ?? 'sum');
+
+        // Activities, schemes, weights, aggregation or the enabled flag changed: rebuild materialized
+        // scores (rows written while grading was off by older versions may be stale)
+        $current = self::get_configuration($post_id);
+        if ($current['activities'] != $previous['activities']
+            || $current['aggregate'] !== $previous['aggregate']
+            || (bool)$current['enabled'] !== (bool)$previous['enabled']) {
+            ChapterScores::rebuild($post_id);
+        }
     }
 
     /**
@@ -109,31 +119,30 @@ class H5PResultsManager {
      * @return array ['score' => float, 'max_score' => float]
      */
     public static function calculate_score($user_id, $post_id, $h5p_id, $grading_scheme, $current_data = null) {
-        global $wpdb;
-
-        // Get all attempts for this user and H5P content
-        $results_table = $wpdb->prefix . 'h5p_results';
-        $attempts = $wpdb->get_results($wpdb->prepare(
-            "SELECT score, max_score, finished FROM {$results_table}
-             WHERE user_id = %d AND content_id = %d
-             ORDER BY finished ASC",
-            $user_id,
-            $h5p_id
-        ), ARRAY_A);
+        $attempts = self::load_attempts([$h5p_id], [$user_id]);
+        $attempts = $attempts[(int)$user_id][(int)$h5p_id] ?? [];
 
         // Include the current result being saved via the H5P hook (prevents 0/0 on first attempt)
         if ($current_data) {
-            $attempts[] = [
-                'score' => $current_data['score'],
-                'max_score' => $current_data['max_score'] ?? 100,
-                'finished' => time() // Assume finished now
-            ];
+            $attempts[] = self::current_attempt($current_data);
         }
 
+        return self::score_attempts($attempts, $grading_scheme);
+    }
+
+    /**
+     * Apply a grading scheme to a list of attempts
+     *
+     * @param array $attempts Attempts oldest first, each with 'score' and 'max_score'
+     * @param string $grading_scheme Grading scheme (best, average, first, last)
+     * @return array ['score' => float, 'max_score' => float]
+     */
+    public static function score_attempts(array $attempts, $grading_scheme) {
         if (empty($attempts)) {
             return ['score' => 0, 'max_score' => 0];
         }
 
+        $attempts = array_values($attempts);
         $max_score = $attempts[0]['max_score'];
 
         switch ($grading_scheme) {
@@ -147,13 +156,7 @@ class H5PResultsManager {
                 return ['score' => $best_score, 'max_score' => $max_score];
 
             case self::GRADING_AVERAGE:
-                $total = 0;
-                $count = 0;
-                foreach ($attempts as $attempt) {
-                    $total += $attempt['score'];
-                    $count++;
-                }
-                $average = ($count > 0) ? ($total / $count) : 0;
+                $average = array_sum(array_column($attempts, 'score')) / count($attempts);
                 return ['score' => $average, 'max_score' => $max_score];
 
             case self::GRADING_FIRST:
@@ -184,28 +187,70 @@ class H5PResultsManager {
      * @return array ['score' => float, 'max_score' => float, 'percentage' => float]
      */
     public static function calculate_chapter_score($user_id, $post_id, $current_h5p_id = null, $current_data = null) {
-        $config = self::get_configuration($post_id);
         $configured_activities = self::get_configured_activities($post_id);
 
         if (empty($configured_activities)) {
             return ['score' => 0, 'max_score' => 0, 'percentage' => 0];
         }
 
+        $attempts = self::load_attempts(array_column($configured_activities, 'h5p_id'), [$user_id]);
+        $user_attempts = $attempts[(int)$user_id] ?? [];
+
+        if ($current_h5p_id && $current_data) {
+            $user_attempts[(int)$current_h5p_id][] = self::current_attempt($current_data);
+        }
+
+        return self::aggregate_chapter($configured_activities, $user_attempts, self::get_aggregate($post_id));
+    }
+
+    /**
+     * Calculate chapter scores for many users with a fixed number of queries
+     *
+     * @param int $post_id Chapter post ID
+     * @param array|null $user_ids Users to score (null = every user with results)
+     * @return array user_id => ['score' => float, 'max_score' => float, 'percentage' => float]
+     */
+    public static function calculate_chapter_scores($post_id, $user_ids = null) {
+        $configured_activities = self::get_configured_activities($post_id);
+        $empty = ['score' => 0, 'max_score' => 0, 'percentage' => 0];
+
+        if (empty($configured_activities)) {
+            return $user_ids === null ? [] : array_fill_keys(array_map('intval', $user_ids), $empty);
+        }
+
+        $attempts = self::load_attempts(array_column($configured_activities, 'h5p_id'), $user_ids);
+        $aggregate = self::get_aggregate($post_id);
+
+        $scores = [];
+        foreach ($user_ids === null ? array_keys($attempts) : $user_ids as $user_id) {
+            $scores[(int)$user_id] = self::aggregate_chapter($configured_activities, $attempts[(int)$user_id] ?? [], $aggregate);
+        }
+
+        return $scores;
+    }
+
+    /**
+     * Combine one user's per-activity attempts into a chapter score
+     *
+     * @param array $activities Configured activities (h5p_id, grading_scheme, weight)
+     * @param array $user_attempts h5p_id => attempts, oldest first
+     * @param string $aggregate sum, average or weighted
+     * @return array ['score' => float, 'max_score' => float, 'percentage' => float]
+     */
+    public static function aggregate_chapter(array $activities, array $user_attempts, $aggregate) {
+        if (empty($activities)) {
+            return ['score' => 0, 'max_score' => 0, 'percentage' => 0];
+        }
+
         $total_score = 0;
         $total_max = 0;
         $weighted_score = 0;
         $total_weight = 0;
 
-        foreach ($configured_activities as $activity) {
-            // Check if this activity is the one currently being saved
-            $activity_current_data = ($current_h5p_id == $activity['h5p_id']) ? $current_data : null;
-
-            $result = self::calculate_score(
-                $user_id,
-                $post_id,
-                $activity['h5p_id'],
-                $activity['grading_scheme'],
-                $activity_current_data
+        foreach ($activities as $activity) {
+            $result = self::score_attempts(
+                $user_attempts[(int)$activity['h5p_id']] ?? [],
+                $activity['grading_scheme']
             );
 
             if ($result['max_score'] <= 0) {
@@ -213,7 +258,7 @@ class H5PResultsManager {
                 continue;
             }
 
-            if ($config['aggregate'] === 'weighted') {
+            if ($aggregate === 'weighted') {
                 $weight = $activity['weight'];
                 $weighted_score += ($result['score'] / $result['max_score']) * $weight;
                 $total_weight += $weight;
@@ -224,7 +269,7 @@ class H5PResultsManager {
             }
         }
 
-        if ($config['aggregate'] === 'weighted' && $total_weight > 0) {
+        if ($aggregate === 'weighted' && $total_weight > 0) {
             $percentage = ($weighted_score / $total_weight) * 100;
             return [
                 'score' => $weighted_score,
@@ -233,9 +278,9 @@ class H5PResultsManager {
             ];
         }
 
-        if ($config['aggregate'] === 'average' && !empty($configured_activities)) {
-            $average_score = $total_score / count($configured_activities);
-            $average_max = $total_max / count($configured_activities);
+        if ($aggregate === 'average') {
+            $average_score = $total_score / count($activities);
+            $average_max = $total_max / count($activities);
             $percentage = $average_max > 0 ? ($average_score / $average_max) * 100 : 0;
             return [
                 'score' => $average_score,
@@ -253,6 +298,63 @@ class H5PResultsManager {
         ];
     }
 
+    /**
+     * Load attempts for a set of activities (and optionally users) in one query
+     *
+     * @param array $h5p_ids H5P content IDs
+     * @param array|null $user_ids Limit to these users (null = all users)
+     * @return array user_id => h5p_id => attempts, oldest first
+     */
+    public static function load_attempts(array $h5p_ids, $user_ids = null) {
+        global $wpdb;
+
+        $h5p_ids = array_values(array_unique(array_map('intval', $h5p_ids)));
+        if (empty($h5p_ids) || ($user_ids !== null && empty($user_ids))) {
+            return [];
+        }
+
+        $results_table = $wpdb->prefix . 'h5p_results';
+        $where = 'content_id IN (' . implode(',', array_fill(0, count($h5p_ids), '%d')) . ')';
+        $args = $h5p_ids;
+
+        if ($user_ids !== null) {
+            $user_ids = array_values(array_unique(array_map('intval', $user_ids)));
+            $where .= ' AND user_id IN (' . implode(',', array_fill(0, count($user_ids), '%d')) . ')';
+            $args = array_merge($args, $user_ids);
+        }
+
+        $rows = $wpdb->get_results($wpdb->prepare(
+            "SELECT id, user_id, content_id, score, max_score, finished FROM {$results_table}
+             WHERE {$where}
+             ORDER BY finished ASC, id ASC",
+            ...$args
+        ), ARRAY_A);
+
+        $attempts = [];
+        foreach ($rows as $row) {
+            $attempts[(int)$row['user_id']][(int)$row['content_id']][] = [
+                'id' => (int)$row['id'],
+                'score' => (float)$row['score'],
+                'max_score' => (float)$row['max_score'],
+                'finished' => $row['finished']
+            ];
+        }
+
+        return $attempts;
+    }
+
+    private static function current_attempt($current_data) {
+        return [
+            'score' => $current_data['score'],
+            'max_score' => $current_data['max_score'] ?? 100,
+            'finished' => time() // Assume finished now
+        ];
+    }
+
+    private static function get_aggregate($post_id) {
+        return get_post_meta($post_id, '_lti_h5p_grading_aggregate', true) ?: 'sum';
+    }
+
     /**
      * Check if grading is enabled for a chapter
      *
@@ -272,30 +374,17 @@ class H5PResultsManager {
      */
     public static function get_user_attempts($user_id, $post_id) {
         $configured_activities = self::get_configured_activities($post_id);
+        $loaded = self::load_attempts(array_column($configured_activities, 'h5p_id'), [$user_id]);
         $attempts = [];
 
         foreach ($configured_activities as $activity) {
-            global $wpdb;
-            $results_table = $wpdb->prefix . 'h5p_results';
-
-            $activity_attempts = $wpdb->get_results($wpdb->prepare(
-                "SELECT id, score, max_score, finished FROM {$results_table}
-                 WHERE user_id = %d AND content_id = %d
-                 ORDER BY finished DESC",
-                $user_id,
-                $activity['h5p_id']
-            ), ARRAY_A);
+            $activity_attempts = $loaded[(int)$user_id][(int)$activity['h5p_id']] ?? [];
 
             $attempts[$activity['h5p_id']] = [
                 'h5p_id' => $activity['h5p_id'],
                 'grading_scheme' => $activity['grading_scheme'],
-                'attempts' => $activity_attempts,
-                'calculated_score' => self::calculate_score(
-                    $user_id,
-                    $post_id,
-                    $activity['h5p_id'],
-                    $activity['grading_scheme']
-                )
+                'attempts' => array_reverse($activity_attempts),
+                'calculated_score' => self::score_attempts($activity_attempts, $activity['grading_scheme'])
             ];
         }
 
@@ -306,34 +395,21 @@ class H5PResultsManager {
      * Get detailed H5P results for all users for a chapter
      *
      * @param int $post_id Chapter post ID
+     * @param array|null $user_ids Limit to these users (null = all users)
      * @return array Results grouped by user
      */
-    public static function get_chapter_results($post_id) {
+    public static function get_chapter_results($post_id, $user_ids = null) {
         global $wpdb;
         error_log("[PB-LTI] get_chapter_results for post $post_id. Prefix: " . $wpdb->prefix);
 
-        $config = self::get_configuration($post_id);
-        $activities = self::get_configured_activities($post_id);
-
-        if (empty($activities)) {
-            error_log("[PB-LTI] No configured activities for post $post_id. Attempting auto-detection.");
-            // Detection logic if not explicitly configured
-            $post = get_post($post_id);
-            if ($post) {
-                preg_match_all('/\[h5p id="(\d+)"\]/', $post->post_content, $matches);
-                if (!empty($matches[1])) {
-                    foreach (array_unique($matches[1]) as $hid) {
-                        $activities[] = [
-                            'h5p_id' => (int)$hid,
-                            'grading_scheme' => 'best',
-                            'weight' => 1.0
-                        ];
-                    }
-                    error_log("[PB-LTI] Auto-detected H5P IDs: " . implode(',', array_column($activities, 'h5p_id')));
-                }
-            }
+        if ($user_ids !== null && empty($user_ids)) {
+            return [];
         }
 
+        $config = self::get_configuration($post_id);
+        $configured = self::get_configured_activities($post_id);
+        $activities = self::get_result_activities($post_id, $configured);
+
         if (empty($activities)) {
             error_log("[PB-LTI] No H5P activities found for post $post_id");
             return [];
@@ -345,13 +421,16 @@ class H5PResultsManager {
         // Get all H5P IDs
         $h5p_ids = array_column($activities, 'h5p_id');
         $placeholders = implode(',', array_fill(0, count($h5p_ids), '%d'));
+        $user_list = $user_ids === null ? '' : implode(',', array_map('intval', $user_ids));
+        $user_filter = $user_ids === null ? '' : " AND r.user_id IN ({$user_list})";
+        $history_filter = $user_ids === null ? '' : " AND user_id IN ({$user_list})";
 
         // Query for results joined with user data
         $query = $wpdb->prepare(
             "SELECT r.id, r.user_id, r.content_id, r.score, r.max_score, r.finished, u.display_name, u.user_email
              FROM {$results_table} r
              JOIN {$users_table} u ON r.user_id = u.ID
-             WHERE r.content_id IN ($placeholders)
+             WHERE r.content_id IN ($placeholders){$user_filter}
              ORDER BY u.display_name ASC, r.finished DESC",
             ...$h5p_ids
         );
@@ -360,6 +439,7 @@ class H5PResultsManager {
 
         $raw_results = $wpdb->get_results($query, ARRAY_A);
         error_log("[PB-LTI] Raw results count: " . count($raw_results));
+        $titles = self::get_h5p_titles($h5p_ids);
         $user_results = [];
 
         // Group by user
@@ -372,7 +452,8 @@ class H5PResultsManager {
                     'user_email' => $row['user_email'],
                     'activities' => [],
                     'total_calculated_score' => 0,
-                    'total_percentage' => 0
+                    'total_percentage' => 0,
+                    'history' => []
                 ];
             }
 
@@ -381,7 +462,7 @@ class H5PResultsManager {
                 $user_results[$user_id]['activities'][$h5p_id] = [
                     'id' => $h5p_id,
                     'result_id' => (int)$row['id'],
-                    'title' => self::get_h5p_title($h5p_id),
+                    'title' => $titles[$h5p_id] ?? "H5P #$h5p_id",
                     'attempts' => [],
                     'grading_scheme' => $config['activities'][$h5p_id]['scheme'] ?? 'best',
                     'calculated_score' => 0,
@@ -397,41 +478,264 @@ class H5PResultsManager {
             ];
         }
 
-        // Calculate final grade for each user
+        // Chapter totals come from the materialized table; anything missing is computed from the rows already loaded
+        $materialized = empty($configured) ? [] : ChapterScores::for_post($post_id, $user_ids);
+
         foreach ($user_results as $uid => &$data) {
+            $user_attempts = [];
             foreach ($data['activities'] as $hid => &$activity) {
-                $calc = self::calculate_score($uid, $post_id, $hid, $activity['grading_scheme']);
-                $activity['calculated_score' ] = $calc['score'];
+                // Attempts are listed newest first; grading schemes expect oldest first
+                $user_attempts[$hid] = array_reverse($activity['attempts']);
+                $calc = self::score_attempts($user_attempts[$hid], $activity['grading_scheme']);
+                $activity['calculated_score'] = $calc['score'];
+            }
+            unset($activity);
+
+            if (isset($materialized[$uid])) {
+                $row = $materialized[$uid];
+                $chapter_score = [
+                    'score' => (float)$row['score'],
+                    'max_score' => (float)$row['max_score'],
+                    'percentage' => (float)$row['percentage']
+                ];
+                $data['synced_percentage'] = $row['synced_percentage'] !== null ? (float)$row['synced_percentage'] : null;
+                $data['needs_sync'] = (bool)$row['needs_sync'];
+            } else {
+                $chapter_score = self::aggregate_chapter($configured, $user_attempts, $config['aggregate']);
             }
-            $chapter_score = self::calculate_chapter_score($uid, $post_id);
+
             $data['total_calculated_score'] = $chapter_score['score'];
             $data['total_percentage'] = $chapter_score['percentage'];
             $data['total_max'] = $chapter_score['max_score'];
+        }
+        unset($data);
 
-            // Fetch attempt history from sync logs for this user/post
+        // Sync history for every user in one query
+        if (!empty($user_results)) {
             $sync_table = $wpdb->prefix . 'lti_h5p_grade_sync_log';
-            $data['history'] = $wpdb->get_results($wpdb->prepare(
-                "SELECT result_id, score_sent as score, max_score, synced_at as finished, status, error_message 
-                 FROM {$sync_table} 
-                 WHERE user_id = %d AND post_id = %d 
+            $history = $wpdb->get_results($wpdb->prepare(
+                "SELECT user_id, result_id, score_sent as score, max_score, synced_at as finished, status, error_message
+                 FROM {$sync_table}
+                 WHERE post_id = %d{$history_filter}
                  ORDER BY synced_at DESC",
-                $uid,
                 $post_id
             ), ARRAY_A);
+
+            foreach ($history as $entry) {
+                $uid = (int)$entry['user_id'];
+                if (isset($user_results[$uid])) {
+                    unset($entry['user_id']);
+                    $user_results[$uid]['history'][] = $entry;
+                }
+            }
         }
 
         return $user_results;
     }
 
     /**
-     * Get H5P activity title
+     * Get one page of a chapter's results for the Results Viewer
      *
-     * @param int $h5p_id H5P content ID
-     * @return string
+     * Keyset-paginated over the students with at least one attempt, with
+     * chapter totals from the materialized lti_chapter_scores table. Attempt
+     * details and sync history are not included; load them per student with
+     * get_chapter_results($post_id, [$user_id]).
+     *
+     * @param int $post_id Chapter post ID
+     * @param array $args {
+     *     @type string   $search   Matched against display name and email
+     *     @type string   $sort     name, email or score
+     *     @type string   $order    asc or desc
+     *     @type int      $activity Only students with attempts on this H5P ID (0 = any)
+     *     @type int      $per_page Rows per page (1-100)
+     *     @type string   $cursor   next_cursor from the previous page
+     *     @type int[]    $user_ids Limit to these users (e.g. a student viewing their own row)
+     * }
+     * @return array ['rows' => array, 'total' => int, 'next_cursor' => string|null, 'activities' => array]
+     */
+    public static function get_results_page($post_id, array $args = []) {
+        global $wpdb;
+
+        $args = array_merge([
+            'search' => '',
+            'sort' => 'name',
+            'order' => 'asc',
+            'activity' => 0,
+            'per_page' => 25,
+            'cursor' => '',
+            'user_ids' => null
+        ], $args);
+
+        $configured = self::get_configured_activities($post_id);
+        $activities = self::get_result_activities($post_id, $configured);
+        $titles = self::get_h5p_titles(array_column($activities, 'h5p_id'));
+        $activity_list = [];
+        foreach ($activities as $activity) {
+            $activity_list[] = [
+                'id' => (int)$activity['h5p_id'],
+                'title' => $titles[(int)$activity['h5p_id']] ?? 'H5P #' . (int)$activity['h5p_id']
+            ];
+        }
+
+        $page = ['rows' => [], 'total' => 0, 'next_cursor' => null, 'activities' => $activity_list];
+
+        $h5p_ids = array_map('intval', array_column($activities, 'h5p_id'));
+        if ((int)$args['activity']) {
+            $h5p_ids = array_values(array_intersect($h5p_ids, [(int)$args['activity']]));
+        }
+        if (empty($h5p_ids) || ($args['user_ids'] !== null && empty($args['user_ids']))) {
+            return $page;
+        }
+
+        if (!empty($configured)) {
+            ChapterScores::for_post($post_id, []); // Builds the chapter's rows on first use
+        }
+
+        $per_page = min(100, max(1, (int)$args['per_page']));
+        $desc = strtolower($args['order']) === 'desc';
+        $sort_columns = [
+            'name' => 'u.display_name',
+            'email' => 'u.user_email',
+            'score' => 'COALESCE(cs.percentage, 0)'
+        ];
+        $sort_column = $sort_columns[$args['sort']] ?? $sort_columns['name'];
+
+        // Students with at least one attempt on the chapter's activities
+        $from = "FROM {$wpdb->users} u
+             JOIN (SELECT DISTINCT user_id FROM {$wpdb->prefix}h5p_results WHERE content_id IN (" . implode(',', $h5p_ids) . ")) r ON r.user_id = u.ID
+             LEFT JOIN {$wpdb->prefix}lti_chapter_scores cs ON cs.post_id = " . (int)$post_id . " AND cs.user_id = u.ID";
+
+        $where = '1=1';
+        if ($args['search'] !== '') {
+            $like = '%' . $wpdb->esc_like($args['search']) . '%';
+            $where .= $wpdb->prepare(' AND (u.display_name LIKE %s OR u.user_email LIKE %s)', $like, $like);
+        }
+        if ($args['user_ids'] !== null) {
+            $where .= ' AND u.ID IN (' . implode(',', array_map('intval', $args['user_ids'])) . ')';
+        }
+
+        $page['total'] = (int)$wpdb->get_var("SELECT COUNT(*) {$from} WHERE {$where}");
+
+        // Keyset: continue after the last (sort value, user ID) of the previous page
+        $keyset = '';
+        $cursor = self::decode_cursor($args['cursor']);
+        if ($cursor) {
+            $cmp = $desc ? '<' : '>';
+            $format = $args['sort'] === 'score' ? 'CAST(%s AS DECIMAL(6,2))' : '%s';
+            $keyset = $wpdb->prepare(
+                " AND ({$sort_column} {$cmp} {$format} OR ({$sort_column} = {$format} AND u.ID {$cmp} %d))",
+                $cursor[0],
+                $cursor[0],
+                $cursor[1]
+            );
+        }
+
+        $direction = $desc ? 'DESC' : 'ASC';
+        $rows = $wpdb->get_results(
+            "SELECT u.ID AS user_id, u.display_name, u.user_email, {$sort_column} AS sort_value,
+                    cs.score, cs.max_score, cs.percentage, cs.synced_percentage, cs.needs_sync
+             {$from}
+             WHERE {$where}{$keyset}
+             ORDER BY {$sort_column} {$direction}, u.ID {$direction}
+             LIMIT " . ($per_page + 1),
+            ARRAY_A
+        );
+
+        if (count($rows) > $per_page) {
+            array_pop($rows);
+            $last = end($rows);
+            $page['next_cursor'] = self::encode_cursor([$last['sort_value'], (int)$last['user_id']]);
+        }
+
+        foreach ($rows as $row) {
+            $page['rows'][] = [
+                'user_id' => (int)$row['user_id'],
+                'display_name' => $row['display_name'],
+                'user_email' => $row['user_email'],
+                'total_calculated_score' => (float)$row['score'],
+                'total_max' => (float)$row['max_score'],
+                'total_percentage' => (float)$row['percentage'],
+                'synced_percentage' => $row['synced_percentage'] !== null ? (float)$row['synced_percentage'] : null,
+                'needs_sync' => (bool)$row['needs_sync']
+            ];
+        }
+
+        return $page;
+    }
+
+    /**
+     * Activities whose results a chapter shows: the configured ones, or the
+     * [h5p id="..."] shortcodes in the content when nothing is configured
+     *
+     * @param int $post_id Chapter post ID
+     * @param array $configured Configured activities
+     * @return array Activities (h5p_id, grading_scheme, weight)
+     */
+    public static function get_result_activities($post_id, array $configured) {
+        if (!empty($configured)) {
+            return $configured;
+        }
+
+        error_log("[PB-LTI] No configured activities for post $post_id. Attempting auto-detection.");
+        $activities = [];
+        $post = get_post($post_id);
+        if ($post) {
+            preg_match_all('/\[h5p id="(\d+)"\]/', $post->post_content, $matches);
+            if (!empty($matches[1])) {
+                foreach (array_unique($matches[1]) as $hid) {
+                    $activities[] = [
+                        'h5p_id' => (int)$hid,
+                        'grading_scheme' => 'best',
+                        'weight' => 1.0
+                    ];
+                }
+                error_log("[PB-LTI] Auto-detected H5P IDs: " . implode(',', array_column($activities, 'h5p_id')));
+            }
+        }
+
+        return $activities;
+    }
+
+    private static function encode_cursor(array $cursor) {
+        return rtrim(strtr(base64_encode(wp_json_encode($cursor)), '+/', '-_'), '=');
+    }
+
+    private static function decode_cursor($cursor) {
+        if (!$cursor) {
+            return null;
+        }
+        $decoded = json_decode(base64_decode(strtr($cursor, '-_', '+/')), true);
+        return is_array($decoded) && count($decoded) === 2 ? $decoded : null;
+    }
+
+    /**
+     * Get H5P activity titles
+     *
+     * @param array $h5p_ids H5P content IDs
+     * @return array h5p_id => title
      */
-    private static function get_h5p_title($h5p_id) {
+    private static function get_h5p_titles(array $h5p_ids) {
         global $wpdb;
+
+        $h5p_ids = array_values(array_unique(array_map('intval', $h5p_ids)));
+        if (empty($h5p_ids)) {
+            return [];
+        }
+
         $table = $wpdb->prefix . 'h5p_contents';
-        return $wpdb->get_var($wpdb->prepare("SELECT title FROM {$table} WHERE id = %d", $h5p_id)) ?: "H5P #$h5p_id";
+        $placeholders = implode(',', array_fill(0, count($h5p_ids), '%d'));
+        $rows = $wpdb->get_results($wpdb->prepare(
+            "SELECT id, title FROM {$table} WHERE id IN ($placeholders)",
+            ...$h5p_ids
+        ), ARRAY_A);
+
+        $titles = [];
+        foreach ($rows as $row) {
+            if ($row['title'] !== '') {
+                $titles[(int)$row['id']] = $row['title'];
+            }
+        }
+
+        return $titles;
     }
 }
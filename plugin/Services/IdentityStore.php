@@ -0,0 +1,231 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * IdentityStore
+ *
+ * Maps LTI identities (issuer, sub) to WordPress users through the
+ * network-wide lti_identities table, so resolving a returning user is one
+ * unique-index lookup instead of a usermeta meta_value scan. The role last
+ * granted on each blog is cached in lti_identity_roles, letting launches
+ * skip role writes when nothing changed.
+ *
+ * The _lti_user_id / _lti_platform_issuer user meta is still written; grade
+ * sync reads it per user.
+ */
+class IdentityStore {
+
+    const BACKFILL_OPTION = 'pb_lti_identities_backfilled';
+
+    /**
+     * Initialize cleanup hooks
+     */
+    public static function init() {
+        add_action('deleted_user', [__CLASS__, 'forget_user']);
+        add_action('wpmu_delete_user', [__CLASS__, 'forget_user']);
+    }
+
+    /**
+     * Find the user for an LTI identity, with the role cached for a blog
+     *
+     * @param string $issuer Platform issuer
+     * @param string $sub LTI user ID (sub claim)
+     * @param int $blog_id Blog whose cached role to return
+     * @return object|null {id, user_id, role} or null if unknown
+     */
+    public static function find($issuer, $sub, $blog_id) {
+        global $wpdb;
+
+        $identity = $wpdb->get_row($wpdb->prepare(
+            "SELECT i.id, i.user_id, r.role
+             FROM " . self::table() . " i
+             LEFT JOIN " . self::roles_table() . " r ON r.identity_id = i.id AND r.blog_id = %d
+             WHERE i.issuer = %s AND i.sub = %s",
+            $blog_id,
+            $issuer,
+            $sub
+        ));
+
+        if ($identity) {
+            $identity->id = (int)$identity->id;
+            $identity->user_id = (int)$identity->user_id;
+            return $identity;
+        }
+
+        // Not migrated yet: fall back to usermeta once and record the mapping
+        if (!get_site_option(self::BACKFILL_OPTION)) {
+            $user_id = self::find_in_usermeta($issuer, $sub);
+            if ($user_id) {
+                return (object)[
+                    'id' => self::link($issuer, $sub, $user_id),
+                    'user_id' => $user_id,
+                    'role' => null
+                ];
+            }
+        }
+
+        return null;
+    }
+
+    /**
+     * Map an LTI identity to a user
+     *
+     * @param string $issuer Platform issuer
+     * @param string $sub LTI user ID (sub claim)
+     * @param int $user_id WordPress user ID
+     * @return int Identity ID
+     */
+    public static function link($issuer, $sub, $user_id) {
+        global $wpdb;
+
+        // LAST_INSERT_ID(id) makes insert_id the existing row's ID on duplicate
+        $wpdb->query($wpdb->prepare(
+            "INSERT INTO " . self::table() . " (issuer, sub, user_id, created_at)
+             VALUES (%s, %s, %d, %s)
+             ON DUPLICATE KEY UPDATE user_id = VALUES(user_id), id = LAST_INSERT_ID(id)",
+            $issuer,
+            $sub,
+            $user_id,
+            current_time('mysql', true)
+        ));
+
+        return (int)$wpdb->insert_id;
+    }
+
+    /**
+     * Cache the role granted to an identity on a blog
+     *
+     * @param int $identity_id Identity ID
+     * @param int $blog_id Blog ID
+     * @param string $role WordPress role
+     */
+    public static function remember_role($identity_id, $blog_id, $role) {
+        global $wpdb;
+
+        $wpdb->query($wpdb->prepare(
+            "INSERT INTO " . self::roles_table() . " (identity_id, blog_id, role, updated_at)
+             VALUES (%d, %d, %s, %s)
+             ON DUPLICATE KEY UPDATE role = VALUES(role), updated_at = VALUES(updated_at)",
+            $identity_id,
+            $blog_id,
+            $role,
+            current_time('mysql', true)
+        ));
+    }
+
+    /**
+     * Pick a free username with one query instead of one username_exists() per candidate
+     *
+     * @param string $base Sanitized base username
+     * @return string $base, or $base followed by the lowest free numeric suffix
+     */
+    public static function unique_username($base) {
+        global $wpdb;
+
+        $taken = $wpdb->get_col($wpdb->prepare(
+            "SELECT user_login FROM {$wpdb->users} WHERE user_login LIKE %s",
+            $wpdb->esc_like($base) . '%'
+        ));
+
+        $suffixes = [];
+        $base_taken = false;
+        foreach ($taken as $login) {
+            // user_login comparisons are case-insensitive, like username_exists()
+            if (strcasecmp($login, $base) === 0) {
+                $base_taken = true;
+                continue;
+            }
+            $suffix = substr($login, strlen($base));
+            if (ctype_digit($suffix) && $suffix[0] !== '0') {
+                $suffixes[(int)$suffix] = true;
+            }
+        }
+
+        if (!$base_taken) {
+            return $base;
+        }
+
+        $counter = 1;
+        while (isset($suffixes[$counter])) {
+            $counter++;
+        }
+
+        return $base . $counter;
+    }
+
+    /**
+     * Copy existing usermeta mappings into lti_identities in one statement
+     *
+     * @return int Identities added
+     */
+    public static function backfill() {
+        global $wpdb;
+
+        $added = $wpdb->query($wpdb->prepare(
+            "INSERT IGNORE INTO " . self::table() . " (issuer, sub, user_id, created_at)
+             SELECT iss.meta_value, sub.meta_value, sub.user_id, %s
+             FROM {$wpdb->usermeta} sub
+             JOIN {$wpdb->usermeta} iss ON iss.user_id = sub.user_id AND iss.meta_key = '_lti_platform_issuer'
+             WHERE sub.meta_key = '_lti_user_id' AND sub.meta_value <> '' AND iss.meta_value <> ''
+             ORDER BY sub.user_id ASC",
+            current_time('mysql', true)
+        ));
+
+        if ($added === false) {
+            error_log('[PB-LTI Identity] Backfill failed: ' . $wpdb->last_error);
+            return 0;
+        }
+
+        update_site_option(self::BACKFILL_OPTION, time());
+        error_log('[PB-LTI Identity] Backfilled ' . (int)$added . ' identities from usermeta');
+
+        return (int)$added;
+    }
+
+    /**
+     * Remove a deleted user's identities and cached roles
+     *
+     * @param int $user_id WordPress user ID
+     */
+    public static function forget_user($user_id) {
+        global $wpdb;
+
+        $wpdb->query($wpdb->prepare(
+            "DELETE r FROM " . self::roles_table() . " r
+             JOIN " . self::table() . " i ON i.id = r.identity_id
+             WHERE i.user_id = %d",
+            $user_id
+        ));
+        $wpdb->delete(self::table(), ['user_id' => $user_id], ['%d']);
+    }
+
+    /**
+     * Legacy lookup through usermeta (pre-migration only)
+     */
+    private static function find_in_usermeta($issuer, $sub) {
+        global $wpdb;
+
+        $user_id = $wpdb->get_var($wpdb->prepare(
+            "SELECT user_id FROM {$wpdb->usermeta}
+             WHERE meta_key = '_lti_user_id' AND meta_value = %s
+             AND user_id IN (
+                 SELECT user_id FROM {$wpdb->usermeta}
+                 WHERE meta_key = '_lti_platform_issuer' AND meta_value = %s
+             )",
+            $sub,
+            $issuer
+        ));
+
+        return $user_id ? (int)$user_id : null;
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_identities';
+    }
+
+    private static function roles_table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_identity_roles';
+    }
+}
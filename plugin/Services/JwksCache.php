@@ -0,0 +1,214 @@
+<?php
+namespace PB_LTI\Services;
+
+use Firebase\JWT\JWK;
+
+/**
+ * JwksCache
+ *
+ * Persistent per-issuer cache of platform JWKS keys, indexed by kid.
+ * Launches resolve signing keys from the cache; the keyset URL is only
+ * fetched when the cache is cold, when an unknown kid appears (rate limited),
+ * or in the background shortly before the cached set expires.
+ */
+class JwksCache {
+
+    const DEFAULT_TTL = 3600;         // Used when the platform sends no Cache-Control
+    const MIN_TTL = 300;
+    const MAX_TTL = 86400;
+    const REFRESH_AHEAD = 300;        // Schedule a background refresh this long before expiry
+    const STALE_GRACE = 86400;        // Keep serving the last good set if refreshes fail
+    const UNKNOWN_KID_INTERVAL = 60;  // At most one forced refetch per issuer per interval
+
+    /**
+     * Parsed Firebase\JWT\Key objects memoized for the current request
+     *
+     * @var array issuer => [kid => Key]
+     */
+    private static $parsed = [];
+
+    /**
+     * Initialize background refresh hook
+     */
+    public static function init() {
+        add_action('pb_lti_refresh_jwks', [__CLASS__, 'refresh_issuer'], 10, 1);
+    }
+
+    /**
+     * Get signing keys for a platform, suitable for JWT::decode()
+     *
+     * @param object $platform Platform configuration
+     * @param string|null $kid Key ID from the JWT header (null if absent)
+     * @return \Firebase\JWT\Key|array Key for $kid, or the whole set when no kid is given
+     * @throws \Exception When no matching key can be found
+     */
+    public static function get_keys($platform, $kid = null) {
+        $entry = self::get_entry($platform->issuer);
+
+        if (!$entry || $entry['stale_at'] <= time()) {
+            // Cold cache or past the grace window: must fetch synchronously
+            $entry = self::fetch($platform, $entry);
+        } elseif ($entry['expires_at'] <= time() + self::REFRESH_AHEAD) {
+            // Still usable - refresh in the background so launches never wait
+            self::schedule_refresh($platform->issuer);
+        }
+
+        if ($kid !== null && !isset($entry['keys'][$kid])) {
+            // Unknown kid usually means the platform rotated keys
+            if ($entry['checked_at'] > time() - self::UNKNOWN_KID_INTERVAL) {
+                throw new \Exception('Unknown JWKS kid "' . $kid . '" for ' . $platform->issuer . ' (refetch rate limited)');
+            }
+
+            error_log('[PB-LTI JWKS] Unknown kid ' . $kid . ' for ' . $platform->issuer . ' - refetching keyset');
+            $entry = self::fetch($platform, $entry);
+
+            if (!isset($entry['keys'][$kid])) {
+                throw new \Exception('Unknown JWKS kid "' . $kid . '" in ' . $platform->key_set_url);
+            }
+        }
+
+        $keys = self::parse($platform->issuer, $entry);
+
+        if ($kid !== null) {
+            if (!isset($keys[$kid])) {
+                throw new \Exception('JWKS key "' . $kid . '" could not be parsed for ' . $platform->issuer);
+            }
+            return $keys[$kid];
+        }
+
+        return count($keys) === 1 ? reset($keys) : $keys;
+    }
+
+    /**
+     * Refresh the cached keyset for an issuer (background cron handler)
+     *
+     * @param string $issuer Platform issuer
+     */
+    public static function refresh_issuer($issuer) {
+        $platform = PlatformRegistry::find($issuer);
+        if (!$platform) {
+            return;
+        }
+
+        try {
+            self::fetch($platform, self::get_entry($issuer));
+        } catch (\Exception $e) {
+            error_log('[PB-LTI JWKS] Background refresh failed for ' . $issuer . ': ' . $e->getMessage());
+        }
+    }
+
+    /**
+     * Drop the cached keyset for an issuer
+     *
+     * @param string $issuer Platform issuer
+     */
+    public static function flush($issuer) {
+        delete_site_transient(self::cache_key($issuer));
+        unset(self::$parsed[$issuer]);
+    }
+
+    /**
+     * Fetch the keyset from the platform and store it
+     *
+     * @param object $platform Platform configuration
+     * @param array|null $previous Previously cached entry (kept on fetch failure)
+     * @return array Cache entry
+     * @throws \Exception When the keyset cannot be fetched and nothing usable is cached
+     */
+    private static function fetch($platform, $previous = null) {
+        try {
+            $response = LmsHttp::for_platform($platform)->get($platform->key_set_url, [
+                'headers' => ['Accept' => 'application/json']
+            ]);
+        } catch (\Exception $e) {
+            if ($previous && $previous['stale_at'] > time()) {
+                // Platform is unreachable but the old set is still within grace
+                $previous['checked_at'] = time();
+                self::store($platform->issuer, $previous);
+                error_log('[PB-LTI JWKS] Fetch failed, serving cached keyset for ' . $platform->issuer . ': ' . $e->getMessage());
+                return $previous;
+            }
+            throw new \Exception('Failed to fetch JWKS from ' . $platform->key_set_url . ': ' . $e->getMessage());
+        }
+
+        $jwks = json_decode((string)$response->getBody(), true);
+
+        if (!isset($jwks['keys']) || !is_array($jwks['keys'])) {
+            throw new \Exception('Invalid JWKS format: "keys" property missing in ' . $platform->key_set_url);
+        }
+
+        // Index raw JWKs by kid; parsed keys hold OpenSSL handles and cannot be persisted
+        $keys = [];
+        foreach ($jwks['keys'] as $index => $jwk) {
+            $keys[$jwk['kid'] ?? (string)$index] = $jwk;
+        }
+
+        $ttl = self::ttl_from_headers($response->getHeaderLine('Cache-Control'));
+        $now = time();
+
+        $entry = [
+            'keys' => $keys,
+            'checked_at' => $now,
+            'expires_at' => $now + $ttl,
+            'stale_at' => $now + $ttl + self::STALE_GRACE
+        ];
+
+        self::store($platform->issuer, $entry);
+        unset(self::$parsed[$platform->issuer]);
+
+        error_log('[PB-LTI JWKS] Cached ' . count($keys) . ' keys for ' . $platform->issuer . ' (ttl ' . $ttl . 's)');
+
+        return $entry;
+    }
+
+    /**
+     * Derive cache lifetime from a Cache-Control header
+     *
+     * @param string $cache_control Cache-Control header value
+     * @return int TTL in seconds
+     */
+    private static function ttl_from_headers($cache_control) {
+        if (preg_match('/(?:^|,)\s*(?:no-store|no-cache)\b/i', $cache_control)) {
+            return self::MIN_TTL;
+        }
+
+        if (preg_match('/(?:^|,)\s*max-age\s*=\s*(\d+)/i', $cache_control, $matches)) {
+            return max(self::MIN_TTL, min(self::MAX_TTL, (int)$matches[1]));
+        }
+
+        return self::DEFAULT_TTL;
+    }
+
+    /**
+     * Parse cached JWKs into Key objects, memoized per request
+     *
+     * @param string $issuer Platform issuer
+     * @param array $entry Cache entry
+     * @return array kid => Key
+     */
+    private static function parse($issuer, $entry) {
+        if (!isset(self::$parsed[$issuer])) {
+            self::$parsed[$issuer] = JWK::parseKeySet(['keys' => array_values($entry['keys'])]);
+        }
+        return self::$parsed[$issuer];
+    }
+
+    private static function schedule_refresh($issuer) {
+        if (!wp_next_scheduled('pb_lti_refresh_jwks', [$issuer])) {
+            wp_schedule_single_event(time(), 'pb_lti_refresh_jwks', [$issuer]);
+        }
+    }
+
+    private static function get_entry($issuer) {
+        $entry = get_site_transient(self::cache_key($issuer));
+        return is_array($entry) ? $entry : null;
+    }
+
+    private static function store($issuer, $entry) {
+        set_site_transient(self::cache_key($issuer), $entry, max(1, $entry['stale_at'] - time()));
+    }
+
+    private static function cache_key($issuer) {
+        return 'pb_lti_jwks_' . md5($issuer);
+    }
+}
@@ -2,12 +2,15 @@
 namespace PB_LTI\Services;
 
 use Firebase\JWT\JWT;
-use Firebase\JWT\JWK;
 
 class JwtValidator {
     public static function validate(string $jwt) {
-        // Decode header and payload to extract issuer
+        // Decode header and payload to extract issuer and key ID
         $parts = explode('.', $jwt);
+        if (count($parts) !== 3) {
+            throw new \Exception('Malformed JWT');
+        }
+        $header = json_decode(JWT::urlsafeB64Decode($parts[0]));
         $payload = json_decode(JWT::urlsafeB64Decode($parts[1]));
 
         // Find platform by issuer
@@ -21,22 +24,9 @@ class JwtValidator {
             throw new \Exception('Invalid audience');
         }
 
-        // Fetch JWKS and parse keys
-        $jwks_json = @file_get_contents($platform->key_set_url);
-        if ($jwks_json === false) {
-            $error = error_get_last();
-            throw new \Exception('Failed to fetch JWKS from ' . $platform->key_set_url . ': ' . ($error['message'] ?? 'Unknown error'));
-        }
-
-        $jwks = json_decode($jwks_json, true);
-        
-        if (!isset($jwks['keys'])) {
-            throw new \Exception('Invalid JWKS format: "keys" property missing in ' . $platform->key_set_url);
-        }
+        // Resolve signing key from the cached JWKS (fetches only on miss/rotation)
+        $keys = JwksCache::get_keys($platform, $header->kid ?? null);
 
-        // Parse the key set and decode JWT
-        $keys = JWK::parseKeySet($jwks);
-        
         // Decode and validate JWT
         return JWT::decode($jwt, $keys);
     }
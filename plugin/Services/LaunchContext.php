@@ -0,0 +1,256 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * LaunchContext
+ *
+ * Per-(blog, chapter, user) AGS launch context - lineitem URL, scopes and
+ * resource link - in the network table lti_launch_context. A launch writes
+ * one row with a single upsert (no blog switching), and grade sync can read
+ * a whole chapter's rows at once.
+ *
+ * Replaces the _lti_ags_lineitem_user_<id>, _lti_ags_scope_user_<id> and
+ * _lti_resource_link_id_user_<id> post meta. Each book's existing meta is
+ * moved into the table by a background migration; until that has run,
+ * reads fall back to the old post meta.
+ */
+class LaunchContext {
+
+    const MIGRATED_OPTION = 'pb_lti_launch_context_migrated';
+    const MIGRATE_HOOK = 'pb_lti_migrate_launch_context';
+    const MIGRATE_CHUNK = 500;
+
+    const LEGACY_LINEITEM_PREFIX = '_lti_ags_lineitem_user_';
+    const LEGACY_SCOPE_PREFIX = '_lti_ags_scope_user_';
+    const LEGACY_RESOURCE_LINK_PREFIX = '_lti_resource_link_id_user_';
+
+    /**
+     * Initialize migration hook and queue this book's migration if needed
+     */
+    public static function init() {
+        add_action(self::MIGRATE_HOOK, [__CLASS__, 'migrate']);
+
+        if (!self::is_migrated() && !wp_next_scheduled(self::MIGRATE_HOOK)) {
+            wp_schedule_single_event(time(), self::MIGRATE_HOOK);
+        }
+    }
+
+    /**
+     * Store the AGS context for a launch
+     *
+     * @param int $blog_id Book blog ID
+     * @param int $post_id Chapter post ID
+     * @param int $user_id WordPress user ID
+     * @param string $issuer Platform issuer
+     * @param string $lineitem_url AGS lineitem URL
+     * @param array $scopes AGS scopes granted
+     * @param string $resource_link_id LTI resource link ID
+     */
+    public static function save($blog_id, $post_id, $user_id, $issuer, $lineitem_url, array $scopes, $resource_link_id) {
+        global $wpdb;
+
+        $saved = $wpdb->query($wpdb->prepare(
+            "INSERT INTO " . self::table() . "
+                (blog_id, post_id, user_id, platform_issuer, lineitem_url, scopes, resource_link_id, updated_at)
+             VALUES (%d, %d, %d, %s, %s, %s, %s, %s)
+             ON DUPLICATE KEY UPDATE
+                platform_issuer = VALUES(platform_issuer),
+                lineitem_url = VALUES(lineitem_url),
+                scopes = VALUES(scopes),
+                resource_link_id = VALUES(resource_link_id),
+                updated_at = VALUES(updated_at)",
+            $blog_id,
+            $post_id,
+            $user_id,
+            $issuer,
+            $lineitem_url,
+            wp_json_encode(array_values($scopes)),
+            $resource_link_id,
+            current_time('mysql', true)
+        ));
+
+        if ($saved === false) {
+            error_log('[PB-LTI Launch Context] Failed to store context for user ' . $user_id . ', post ' . $post_id . ': ' . $wpdb->last_error);
+        }
+    }
+
+    /**
+     * Get the lineitem URL a user launched a chapter with
+     *
+     * @param int $blog_id Book blog ID
+     * @param int $post_id Chapter post ID
+     * @param int $user_id WordPress user ID
+     * @return string|null Lineitem URL or null if the user never launched this chapter
+     */
+    public static function lineitem_url($blog_id, $post_id, $user_id) {
+        $contexts = self::for_post($blog_id, $post_id, [$user_id]);
+        return $contexts[(int)$user_id]['lineitem_url'] ?? null;
+    }
+
+    /**
+     * Get launch contexts for a chapter
+     *
+     * @param int $blog_id Book blog ID
+     * @param int $post_id Chapter post ID
+     * @param array|null $user_ids Limit to these users (null = all)
+     * @return array user_id => ['lineitem_url', 'scopes', 'resource_link_id', 'platform_issuer']
+     */
+    public static function for_post($blog_id, $post_id, $user_ids = null) {
+        global $wpdb;
+
+        if ($user_ids !== null && empty($user_ids)) {
+            return [];
+        }
+
+        $sql = $wpdb->prepare(
+            "SELECT user_id, platform_issuer, lineitem_url, scopes, resource_link_id FROM " . self::table() . "
+             WHERE blog_id = %d AND post_id = %d",
+            $blog_id,
+            $post_id
+        );
+        if ($user_ids !== null) {
+            $sql .= ' AND user_id IN (' . implode(',', array_map('intval', $user_ids)) . ')';
+        }
+
+        $contexts = [];
+        foreach ($wpdb->get_results($sql, ARRAY_A) as $row) {
+            $contexts[(int)$row['user_id']] = [
+                'platform_issuer' => $row['platform_issuer'],
+                'lineitem_url' => $row['lineitem_url'],
+                'scopes' => json_decode($row['scopes'], true) ?: [],
+                'resource_link_id' => $row['resource_link_id']
+            ];
+        }
+
+        if (!self::is_migrated($blog_id)) {
+            $contexts += self::legacy_for_post($blog_id, $post_id, $user_ids, $contexts);
+        }
+
+        return $contexts;
+    }
+
+    /**
+     * Whether a book's legacy post meta has been moved into the table
+     *
+     * @param int|null $blog_id Book blog ID (default: current blog)
+     * @return bool
+     */
+    public static function is_migrated($blog_id = null) {
+        if ($blog_id && is_multisite() && (int)$blog_id !== get_current_blog_id()) {
+            return (bool)get_blog_option($blog_id, self::MIGRATED_OPTION);
+        }
+        return (bool)get_option(self::MIGRATED_OPTION);
+    }
+
+    /**
+     * Move the current book's per-user launch post meta into the table
+     *
+     * @return int Contexts migrated
+     */
+    public static function migrate() {
+        global $wpdb;
+
+        $blog_id = get_current_blog_id();
+        $like = $wpdb->esc_like(self::LEGACY_LINEITEM_PREFIX) . '%';
+        $migrated = 0;
+        $last_meta_id = 0;
+
+        do {
+            $rows = $wpdb->get_results($wpdb->prepare(
+                "SELECT meta_id, post_id, meta_key, meta_value FROM {$wpdb->postmeta}
+                 WHERE meta_key LIKE %s AND meta_id > %d
+                 ORDER BY meta_id ASC
+                 LIMIT %d",
+                $like,
+                $last_meta_id,
+                self::MIGRATE_CHUNK
+            ));
+
+            foreach ($rows as $row) {
+                $last_meta_id = (int)$row->meta_id;
+                $user_id = (int)substr($row->meta_key, strlen(self::LEGACY_LINEITEM_PREFIX));
+                if (!$user_id || $row->meta_value === '') {
+                    continue;
+                }
+
+                // The row may already exist from a launch since the upgrade - keep the newer one
+                if (self::exists($blog_id, (int)$row->post_id, $user_id)) {
+                    continue;
+                }
+
+                self::save(
+                    $blog_id,
+                    (int)$row->post_id,
+                    $user_id,
+                    (string)get_user_meta($user_id, '_lti_platform_issuer', true),
+                    $row->meta_value,
+                    (array)get_post_meta($row->post_id, self::LEGACY_SCOPE_PREFIX . $user_id, true),
+                    (string)get_post_meta($row->post_id, self::LEGACY_RESOURCE_LINK_PREFIX . $user_id, true)
+                );
+                $migrated++;
+            }
+        } while (count($rows) === self::MIGRATE_CHUNK);
+
+        update_option(self::MIGRATED_OPTION, time());
+
+        // Drop the legacy rows now that reads no longer fall back to them
+        foreach ([self::LEGACY_LINEITEM_PREFIX, self::LEGACY_SCOPE_PREFIX, self::LEGACY_RESOURCE_LINK_PREFIX] as $prefix) {
+            $wpdb->query($wpdb->prepare(
+                "DELETE FROM {$wpdb->postmeta} WHERE meta_key LIKE %s",
+                $wpdb->esc_like($prefix) . '%'
+            ));
+        }
+
+        error_log('[PB-LTI Launch Context] Migrated ' . $migrated . ' launch contexts for blog ' . $blog_id);
+
+        return $migrated;
+    }
+
+    /**
+     * Read lineitems from the pre-migration post meta
+     */
+    private static function legacy_for_post($blog_id, $post_id, $user_ids, array $known) {
+        $switched = is_multisite() && (int)$blog_id !== get_current_blog_id();
+        if ($switched) {
+            switch_to_blog($blog_id);
+        }
+
+        $contexts = [];
+        foreach (get_post_meta($post_id) as $key => $values) {
+            if (strpos($key, self::LEGACY_LINEITEM_PREFIX) !== 0) {
+                continue;
+            }
+            $user_id = (int)substr($key, strlen(self::LEGACY_LINEITEM_PREFIX));
+            if (isset($known[$user_id]) || ($user_ids !== null && !in_array($user_id, array_map('intval', $user_ids), true))) {
+                continue;
+            }
+            $contexts[$user_id] = [
+                'platform_issuer' => null,
+                'lineitem_url' => $values[0],
+                'scopes' => (array)get_post_meta($post_id, self::LEGACY_SCOPE_PREFIX . $user_id, true),
+                'resource_link_id' => (string)get_post_meta($post_id, self::LEGACY_RESOURCE_LINK_PREFIX . $user_id, true)
+            ];
+        }
+
+        if ($switched) {
+            restore_current_blog();
+        }
+
+        return $contexts;
+    }
+
+    private static function exists($blog_id, $post_id, $user_id) {
+        global $wpdb;
+        return (bool)$wpdb->get_var($wpdb->prepare(
+            "SELECT 1 FROM " . self::table() . " WHERE blog_id = %d AND post_id = %d AND user_id = %d",
+            $blog_id,
+            $post_id,
+            $user_id
+        ));
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_launch_context';
+    }
+}
@@ -0,0 +1,162 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * LineItemCache
+ *
+ * Caches AGS lineitem metadata (scoreMaximum, label, resourceId) by lineitem
+ * URL so grade sync can detect scales without a GET before every score post.
+ * Entries are seeded from Deep Linking (the lineItem we declared when the
+ * activity was created) and from launches (background prefetch of the
+ * lineitem in the AGS claim).
+ */
+class LineItemCache {
+
+    const TTL = 12 * HOUR_IN_SECONDS;
+    const DECLARED_TTL = HOUR_IN_SECONDS;       // Deep Linking values may be edited in the LMS
+    const DECLARED_RETENTION = 30 * DAY_IN_SECONDS;
+    const PREFETCH_HOOK = 'pb_lti_prefetch_lineitem';
+
+    /**
+     * @var array Per-request memo: url => lineitem
+     */
+    private static $memo = [];
+
+    /**
+     * Initialize background prefetch hook
+     */
+    public static function init() {
+        add_action(self::PREFETCH_HOOK, [__CLASS__, 'prefetch'], 10, 2);
+    }
+
+    /**
+     * Get cached lineitem metadata
+     *
+     * @param string $lineitem_url AGS lineitem URL
+     * @return array|null Lineitem or null if not cached
+     */
+    public static function get($lineitem_url) {
+        if (isset(self::$memo[$lineitem_url])) {
+            return self::$memo[$lineitem_url];
+        }
+
+        $cached = get_site_transient(self::cache_key($lineitem_url));
+        if (!is_array($cached)) {
+            return null;
+        }
+
+        self::$memo[$lineitem_url] = $cached;
+        return $cached;
+    }
+
+    /**
+     * Store lineitem metadata
+     *
+     * @param string $lineitem_url AGS lineitem URL
+     * @param array $lineitem Lineitem details
+     * @param int $ttl Lifetime in seconds
+     */
+    public static function set($lineitem_url, array $lineitem, $ttl = self::TTL) {
+        self::$memo[$lineitem_url] = $lineitem;
+        set_site_transient(self::cache_key($lineitem_url), $lineitem, $ttl);
+    }
+
+    /**
+     * Drop cached metadata (e.g. after the LMS rejects a score)
+     *
+     * @param string $lineitem_url AGS lineitem URL
+     */
+    public static function invalidate($lineitem_url) {
+        unset(self::$memo[$lineitem_url]);
+        delete_site_transient(self::cache_key($lineitem_url));
+    }
+
+    /**
+     * Get lineitem metadata, fetching from the LMS only on a cache miss
+     *
+     * @param object $platform Platform configuration
+     * @param string $lineitem_url AGS lineitem URL
+     * @return array|null Lineitem details or null on failure
+     */
+    public static function resolve($platform, $lineitem_url) {
+        $lineitem = self::get($lineitem_url);
+        if ($lineitem !== null) {
+            return $lineitem;
+        }
+
+        $lineitem = AGSClient::fetch_lineitem($platform, $lineitem_url);
+        if (is_array($lineitem)) {
+            self::set($lineitem_url, $lineitem);
+        }
+
+        return $lineitem;
+    }
+
+    /**
+     * Remember the lineItem declared in a Deep Linking content item
+     *
+     * @param array $line_item lineItem from the content item (must have resourceId)
+     */
+    public static function remember_declared(array $line_item) {
+        if (empty($line_item['resourceId'])) {
+            return;
+        }
+        set_site_transient(self::declared_key($line_item['resourceId']), $line_item, self::DECLARED_RETENTION);
+    }
+
+    /**
+     * Seed the cache for a launch's lineitem
+     *
+     * When we have the Deep Linking declaration for the resource it is cached
+     * as a short-lived (DECLARED_TTL) seed, since the LMS may have changed the
+     * lineitem since. Either way the lineitem is then fetched in the
+     * background, which confirms or replaces the seed, so the first grade sync
+     * finds the real lineitem cached.
+     *
+     * @param string $issuer Platform issuer
+     * @param string $lineitem_url Lineitem URL from the AGS claim
+     * @param string|null $resource_id Our resourceId for the launched content
+     */
+    public static function prime_from_launch($issuer, $lineitem_url, $resource_id = null) {
+        if (self::get($lineitem_url) !== null) {
+            return;
+        }
+
+        if ($resource_id) {
+            $declared = get_site_transient(self::declared_key($resource_id));
+            if (is_array($declared) && isset($declared['scoreMaximum'])) {
+                self::set($lineitem_url, $declared, self::DECLARED_TTL);
+            }
+        }
+
+        if (!wp_next_scheduled(self::PREFETCH_HOOK, [$issuer, $lineitem_url])) {
+            wp_schedule_single_event(time(), self::PREFETCH_HOOK, [$issuer, $lineitem_url]);
+        }
+    }
+
+    /**
+     * Fetch a lineitem into the cache (cron handler)
+     *
+     * @param string $issuer Platform issuer
+     * @param string $lineitem_url AGS lineitem URL
+     */
+    public static function prefetch($issuer, $lineitem_url) {
+        $platform = PlatformRegistry::find($issuer);
+        if (!$platform) {
+            return;
+        }
+
+        $lineitem = AGSClient::fetch_lineitem($platform, $lineitem_url);
+        if (is_array($lineitem)) {
+            self::set($lineitem_url, $lineitem);
+        }
+    }
+
+    private static function cache_key($lineitem_url) {
+        return 'pb_lti_lineitem_' . md5($lineitem_url);
+    }
+
+    private static function declared_key($resource_id) {
+        return 'pb_lti_dl_lineitem_' . md5($resource_id);
+    }
+}
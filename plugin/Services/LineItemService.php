@@ -1,13 +1,13 @@
 <?php
 namespace PB_LTI\Services;
 
-use GuzzleHttp\Client;
-
 class LineItemService {
   public static function create($platform, string $context_id, string $label, float $max) {
-    $token = TokenCache::get($platform->issuer);
-    $client = new Client();
+    $token = AGSClient::get_token($platform);
+    $client = LmsHttp::for_platform($platform);
     $res = $client->post($platform->lineitems_url, [
+      // A retried create after a proxy 502/504 can add a second gradebook column
+      'pb_lti_retry' => false,
       'headers' => [
         'Authorization' => 'Bearer '.$token,
         'Content-Type' => 'application/vnd.ims.lis.v2.lineitem+json'
@@ -0,0 +1,211 @@
+<?php
+namespace PB_LTI\Services;
+
+use GuzzleHttp\Client;
+use GuzzleHttp\Exception\ConnectException;
+use GuzzleHttp\Handler\CurlMultiHandler;
+use GuzzleHttp\HandlerStack;
+use GuzzleHttp\Middleware;
+use GuzzleHttp\TransferStats;
+use Psr\Http\Message\RequestInterface;
+use Psr\Http\Message\ResponseInterface;
+
+/**
+ * LmsHttp
+ *
+ * Shared HTTP transport for all LMS traffic (JWKS, OAuth2 token, AGS).
+ * One Guzzle client per platform, all sitting on a single curl multi
+ * handle for the process, so TCP/TLS connections to the LMS are reused
+ * (keep-alive, HTTP/2 when curl supports it) and pooled requests for
+ * different platforms progress together. Every client gets the same
+ * timeouts, retry policy and request instrumentation.
+ *
+ * Connection errors and transient LMS errors (429/5xx) are retried only for
+ * requests that are safe to repeat: GET/PUT/DELETE and AGS score POSTs. Pass the request option
+ * 'pb_lti_retry' => false to disable retries for a single request.
+ */
+class LmsHttp {
+
+    const CONNECT_TIMEOUT = 5;
+    const TIMEOUT = 15;
+    const MAX_RETRIES = 2;
+    const RETRY_STATUSES = [429, 502, 503, 504];
+    const IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'];
+
+    /**
+     * @var Client[] issuer => client
+     */
+    private static $clients = [];
+
+    /**
+     * @var CurlMultiHandler|null
+     */
+    private static $handler = null;
+
+    /**
+     * Get the shared client for a platform
+     *
+     * @param object $platform Platform configuration
+     * @return Client
+     */
+    public static function for_platform($platform) {
+        $issuer = $platform->issuer;
+
+        if (!isset(self::$clients[$issuer])) {
+            self::$clients[$issuer] = self::create_client($issuer);
+        }
+
+        return self::$clients[$issuer];
+    }
+
+    /**
+     * Build a client on the shared handler with retry and instrumentation middleware
+     *
+     * @param string $issuer Platform issuer (used to tag instrumentation)
+     * @return Client
+     */
+    private static function create_client($issuer) {
+        $stack = HandlerStack::create(self::handler());
+        $stack->push(self::retry_middleware(), 'pb_lti_retry');
+
+        $options = [
+            'handler' => $stack,
+            'connect_timeout' => self::CONNECT_TIMEOUT,
+            'timeout' => self::TIMEOUT,
+            'headers' => [
+                'User-Agent' => 'Pressbooks-LTI/' . (defined('PB_LTI_VERSION') ? PB_LTI_VERSION : 'dev'),
+                'Connection' => 'keep-alive'
+            ],
+            'on_stats' => function (TransferStats $stats) use ($issuer) {
+                self::record($issuer, $stats);
+            }
+        ];
+
+        if (self::supports_http2()) {
+            // Negotiated via ALPN; curl falls back to HTTP/1.1 if the LMS doesn't offer h2
+            $options['version'] = 2.0;
+            $options['curl'] = [CURLOPT_HTTP_VERSION => CURL_HTTP_VERSION_2TLS];
+        }
+
+        return new Client($options);
+    }
+
+    /**
+     * Process-wide curl multi handle (connection cache lives here)
+     */
+    private static function handler() {
+        if (self::$handler === null) {
+            self::$handler = new CurlMultiHandler();
+        }
+        return self::$handler;
+    }
+
+    /**
+     * Guzzle's retry middleware, skipped for requests sent with 'pb_lti_retry' => false
+     */
+    private static function retry_middleware() {
+        $retry = Middleware::retry(self::retry_decider(), self::retry_delay());
+
+        return function (callable $handler) use ($retry) {
+            $with_retry = $retry($handler);
+
+            return function (RequestInterface $request, array $options) use ($handler, $with_retry) {
+                if (isset($options['pb_lti_retry']) && $options['pb_lti_retry'] === false) {
+                    return $handler($request, $options);
+                }
+                return $with_retry($request, $options);
+            };
+        };
+    }
+
+    /**
+     * Retry connection failures and transient LMS errors, only on requests that are safe to repeat
+     */
+    private static function retry_decider() {
+        return function ($retries, RequestInterface $request, ?ResponseInterface $response = null, $exception = null) {
+            if ($retries >= self::MAX_RETRIES || !self::is_repeatable($request)) {
+                return false;
+            }
+
+            // Includes timeouts and empty replies, where the LMS may already have acted on the request
+            if ($exception instanceof ConnectException) {
+                return true;
+            }
+
+            return $response && in_array($response->getStatusCode(), self::RETRY_STATUSES, true);
+        };
+    }
+
+    /**
+     * Whether sending the request twice has the same effect as sending it once
+     *
+     * A 502/504 from a proxy, a timeout or an empty reply doesn't mean the LMS
+     * didn't act on a POST. Score POSTs are the exception: the LMS keeps the
+     * latest score per user.
+     */
+    private static function is_repeatable(RequestInterface $request) {
+        $method = strtoupper($request->getMethod());
+        if (in_array($method, self::IDEMPOTENT_METHODS, true)) {
+            return true;
+        }
+
+        return $method === 'POST' && substr(rtrim($request->getUri()->getPath(), '/'), -7) === '/scores';
+    }
+
+    /**
+     * Exponential backoff in milliseconds, honoring Retry-After when present
+     */
+    private static function retry_delay() {
+        return function ($retries, ?ResponseInterface $response = null) {
+            if ($response && $response->hasHeader('Retry-After')) {
+                $retry_after = $response->getHeaderLine('Retry-After');
+                if (ctype_digit($retry_after)) {
+                    return min(10, (int)$retry_after) * 1000;
+                }
+            }
+            return 250 * (2 ** ($retries - 1));
+        };
+    }
+
+    /**
+     * Log slow or failed requests and expose timings to other code
+     */
+    private static function record($issuer, TransferStats $stats) {
+        $request = $stats->getRequest();
+        $response = $stats->getResponse();
+        $handler_stats = $stats->getHandlerStats();
+
+        $entry = [
+            'issuer' => $issuer,
+            'method' => $request->getMethod(),
+            'host' => $request->getUri()->getHost(),
+            'path' => $request->getUri()->getPath(),
+            'status' => $response ? $response->getStatusCode() : null,
+            'time' => $stats->getTransferTime(),
+            'connect_time' => $handler_stats['connect_time'] ?? null,
+            'appconnect_time' => $handler_stats['appconnect_time'] ?? null,
+            'http_version' => $handler_stats['http_version'] ?? null
+        ];
+
+        if (!$response || $entry['status'] >= 400 || $entry['time'] > 2) {
+            error_log(sprintf(
+                '[PB-LTI HTTP] %s %s%s -> %s in %.3fs',
+                $entry['method'],
+                $entry['host'],
+                $entry['path'],
+                $entry['status'] ?? 'error',
+                $entry['time']
+            ));
+        }
+
+        do_action('pb_lti_http_request', $entry);
+    }
+
+    private static function supports_http2() {
+        if (!function_exists('curl_version') || !defined('CURL_HTTP_VERSION_2TLS') || !defined('CURL_VERSION_HTTP2')) {
+            return false;
+        }
+        $version = curl_version();
+        return ($version['features'] & CURL_VERSION_HTTP2) === CURL_VERSION_HTTP2;
+    }
+}
@@ -1,18 +1,134 @@
 <?php
 namespace PB_LTI\Services;
 
+/**
+ * NonceService
+ *
+ * One-time launch nonces. Recording a nonce is a single atomic
+ * insert-or-reject: INSERT IGNORE on the lti_nonces primary key, or
+ * wp_cache_add() when a persistent object cache (Redis/memcached drop-in)
+ * is available. Expired rows are purged in batches by an hourly cron job.
+ */
 class NonceService {
-    public static function consume(string $nonce) {
-        global $wpdb;
-        $table = $wpdb->base_prefix . 'lti_nonces';
 
-        if ($wpdb->get_var($wpdb->prepare("SELECT nonce FROM $table WHERE nonce=%s", $nonce))) {
+    const TTL = 60;                 // Minimum time a nonce is remembered
+    const MAX_TTL = 3600;
+    const CACHE_GROUP = 'pb_lti_nonces';
+    const PURGE_HOOK = 'pb_lti_purge_nonces';
+    const PURGE_BATCH = 1000;
+    const PURGE_MAX_BATCHES = 50;
+
+    const BACKEND_DATABASE = 'database';
+    const BACKEND_OBJECT_CACHE = 'object-cache';
+
+    /**
+     * Initialize cache group and purge schedule
+     */
+    public static function init() {
+        // Nonces are network-wide, like the lti_nonces table
+        wp_cache_add_global_groups([self::CACHE_GROUP]);
+
+        add_action(self::PURGE_HOOK, [__CLASS__, 'purge_expired']);
+
+        // The table is shared by the network, so one site's cron is enough
+        if (is_main_site() && !wp_next_scheduled(self::PURGE_HOOK)) {
+            wp_schedule_event(time(), 'hourly', self::PURGE_HOOK);
+        }
+    }
+
+    /**
+     * Record a nonce, rejecting it if it was already used
+     *
+     * @param string $nonce Nonce from the id_token
+     * @param int|null $expires_at Token expiry (exp claim); the nonce is remembered at least this long
+     * @throws \Exception On replay
+     */
+    public static function consume(string $nonce, ?int $expires_at = null) {
+        $ttl = self::ttl($expires_at);
+
+        $fresh = self::backend() === self::BACKEND_OBJECT_CACHE
+            ? wp_cache_add(md5($nonce), 1, self::CACHE_GROUP, $ttl)
+            : self::insert($nonce, $ttl);
+
+        if (!$fresh) {
             throw new \Exception('Replay detected: nonce ' . $nonce . ' already used');
         }
+    }
+
+    /**
+     * Delete expired nonces in batches (cron handler)
+     *
+     * @return int Rows deleted
+     */
+    public static function purge_expired() {
+        global $wpdb;
+
+        $table = self::table();
+        $now = gmdate('Y-m-d H:i:s');
+        $deleted = 0;
+
+        for ($i = 0; $i < self::PURGE_MAX_BATCHES; $i++) {
+            $count = (int)$wpdb->query($wpdb->prepare(
+                "DELETE FROM {$table} WHERE expires_at < %s LIMIT %d",
+                $now,
+                self::PURGE_BATCH
+            ));
+            $deleted += $count;
+
+            if ($count < self::PURGE_BATCH) {
+                break;
+            }
+        }
 
-        $wpdb->insert($table, [
-            'nonce' => $nonce,
-            'expires_at' => gmdate('Y-m-d H:i:s', time()+60)
-        ]);
+        if ($deleted) {
+            error_log('[PB-LTI Nonce] Purged ' . $deleted . ' expired nonces');
+        }
+
+        return $deleted;
+    }
+
+    /**
+     * Backend in use: the object cache when it is persistent, otherwise the database
+     *
+     * Override with the pb_lti_nonce_backend filter.
+     *
+     * @return string BACKEND_DATABASE or BACKEND_OBJECT_CACHE
+     */
+    public static function backend() {
+        $default = wp_using_ext_object_cache() ? self::BACKEND_OBJECT_CACHE : self::BACKEND_DATABASE;
+        return apply_filters('pb_lti_nonce_backend', $default);
+    }
+
+    /**
+     * Atomic insert-or-reject against the primary key
+     *
+     * @return bool True if the nonce was new
+     */
+    private static function insert($nonce, $ttl) {
+        global $wpdb;
+
+        $inserted = $wpdb->query($wpdb->prepare(
+            "INSERT IGNORE INTO " . self::table() . " (nonce, expires_at) VALUES (%s, %s)",
+            $nonce,
+            gmdate('Y-m-d H:i:s', time() + $ttl)
+        ));
+
+        if ($inserted === false) {
+            throw new \Exception('Could not record nonce: ' . $wpdb->last_error);
+        }
+
+        return $inserted === 1;
+    }
+
+    private static function ttl($expires_at) {
+        if (!$expires_at) {
+            return self::TTL;
+        }
+        return min(self::MAX_TTL, max(self::TTL, $expires_at - time()));
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_nonces';
     }
 }
@@ -0,0 +1,147 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * OidcState
+ *
+ * Issues and verifies the OIDC state/nonce pair for login initiation.
+ *
+ * Default mode stores the nonce in a transient keyed by state. Stateless
+ * mode (PB_LTI_STATELESS_STATE constant or the pb_lti_stateless_state filter)
+ * instead puts the nonce, issuer and expiry in the state itself, signed with
+ * an HMAC, and binds it to the browser with a short-lived cookie, so login
+ * initiation does no database writes.
+ */
+class OidcState {
+
+    const TTL = 60;
+    const COOKIE = 'pb_lti_state_bind';
+
+    /**
+     * Whether stateless (signed) state is enabled
+     *
+     * @return bool
+     */
+    public static function is_stateless() {
+        return (bool)apply_filters('pb_lti_stateless_state', defined('PB_LTI_STATELESS_STATE') && PB_LTI_STATELESS_STATE);
+    }
+
+    /**
+     * Create state and nonce for a login initiation
+     *
+     * @param string $issuer Platform issuer
+     * @return array ['state' => string, 'nonce' => string]
+     */
+    public static function issue($issuer) {
+        $nonce = wp_generate_password(32, false);
+
+        if (!self::is_stateless()) {
+            $state = wp_generate_password(32, false);
+            set_transient('pb_lti_state_' . $state, $nonce, self::TTL);
+            return ['state' => $state, 'nonce' => $nonce];
+        }
+
+        $binding = bin2hex(random_bytes(16));
+        self::set_cookie($binding);
+
+        $payload = self::base64url_encode(wp_json_encode([
+            'n' => $nonce,
+            'iss' => $issuer,
+            'exp' => time() + self::TTL,
+            'b' => hash('sha256', $binding)
+        ]));
+
+        return ['state' => $payload . '.' . self::sign($payload), 'nonce' => $nonce];
+    }
+
+    /**
+     * Verify the state returned with a launch against the id_token's claims
+     *
+     * @param string|null $state State parameter from the launch POST
+     * @param object $claims Validated id_token claims
+     * @throws \Exception If the state is missing, expired, forged or not bound to this login
+     */
+    public static function verify($state, $claims) {
+        if (!$state) {
+            throw new \Exception('Missing state');
+        }
+
+        $nonce = $claims->nonce ?? null;
+
+        if (strpos($state, '.') === false) {
+            // Transient state from login initiation
+            $key = 'pb_lti_state_' . $state;
+            $expected = get_transient($key);
+            if ($expected === false) {
+                throw new \Exception('Unknown or expired state');
+            }
+            delete_transient($key);
+            if (!hash_equals((string)$expected, (string)$nonce)) {
+                throw new \Exception('State does not match id_token nonce');
+            }
+            return;
+        }
+
+        list($payload, $signature) = explode('.', $state, 2);
+        if (!hash_equals(self::sign($payload), $signature)) {
+            throw new \Exception('Invalid state signature');
+        }
+
+        $data = json_decode(self::base64url_decode($payload), true);
+        if (!is_array($data) || ($data['exp'] ?? 0) < time()) {
+            throw new \Exception('Expired state');
+        }
+        if (($data['iss'] ?? null) !== ($claims->iss ?? null) || !hash_equals((string)($data['n'] ?? ''), (string)$nonce)) {
+            throw new \Exception('State does not match id_token');
+        }
+
+        // Browser binding: browsers that block third-party cookies in the LMS iframe won't send it
+        $binding = $_COOKIE[self::COOKIE] ?? null;
+        if ($binding !== null) {
+            if (!hash_equals((string)($data['b'] ?? ''), hash('sha256', (string)$binding))) {
+                throw new \Exception('State was issued to a different browser');
+            }
+        } elseif (apply_filters('pb_lti_require_state_cookie', false)) {
+            throw new \Exception('Missing state cookie');
+        }
+
+        self::clear_cookie();
+    }
+
+    private static function sign($payload) {
+        return self::base64url_encode(hash_hmac('sha256', $payload, wp_salt('auth') . '|pb_lti_oidc_state', true));
+    }
+
+    private static function set_cookie($value) {
+        if (headers_sent()) {
+            return;
+        }
+        setcookie(self::COOKIE, $value, self::cookie_options(time() + self::TTL));
+    }
+
+    private static function clear_cookie() {
+        if (headers_sent() || !isset($_COOKIE[self::COOKIE])) {
+            return;
+        }
+        setcookie(self::COOKIE, '', self::cookie_options(time() - HOUR_IN_SECONDS));
+    }
+
+    private static function cookie_options($expires) {
+        // The launch is a cross-site form_post from the LMS, so the cookie needs SameSite=None (which requires Secure)
+        return [
+            'expires' => $expires,
+            'path' => wp_parse_url(rest_url('pb-lti/v1/'), PHP_URL_PATH) ?: '/',
+            'secure' => is_ssl(),
+            'httponly' => true,
+            'samesite' => is_ssl() ? 'None' : 'Lax'
+        ];
+    }
+
+    private static function base64url_encode($data) {
+        return rtrim(strtr(base64_encode($data), '+/', '-_'), '=');
+    }
+
+    private static function base64url_decode($data) {
+        return base64_decode(strtr($data, '-_', '+/'));
+    }
+}
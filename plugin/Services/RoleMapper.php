@@ -28,8 +28,11 @@ class RoleMapper {
         $lti_user_id = $claims->sub;
         $platform_issuer = $claims->iss;
 
-        // Look up existing user by LTI ID first
-        $user_id = self::get_user_by_lti_id($lti_user_id, $platform_issuer);
+        // Look up existing user by LTI ID first (one indexed lookup, includes the role cached for this blog)
+        $identity = IdentityStore::find($platform_issuer, $lti_user_id, $blog_id);
+        $user_id = $identity ? $identity->user_id : null;
+        $identity_id = $identity ? $identity->id : null;
+        $cached_role = $identity ? $identity->role : null;
 
         if (!$user_id) {
             // Extract user information from LTI claims
@@ -75,12 +78,7 @@ class RoleMapper {
             $username = sanitize_user($username, true);
 
             // Ensure unique username
-            $base_username = $username;
-            $counter = 1;
-            while (username_exists($username)) {
-                $username = $base_username . $counter;
-                $counter++;
-            }
+            $username = IdentityStore::unique_username($username);
 
             // Create user with real email
             $user_id = wp_create_user($username, wp_generate_password(), $email);
@@ -102,6 +100,7 @@ class RoleMapper {
             // Store LTI ID mapping
             update_user_meta($user_id, '_lti_user_id', $lti_user_id);
             update_user_meta($user_id, '_lti_platform_issuer', $platform_issuer);
+            $identity_id = IdentityStore::link($platform_issuer, $lti_user_id, $user_id);
 
             error_log(sprintf(
                 '[PB-LTI] Created new user %d (%s) for LTI user: %s - Name: %s, Email: %s',
@@ -160,15 +159,20 @@ class RoleMapper {
                 grant_super_admin($user_id);
                 error_log('[PB-LTI] Granted Super Admin status to institutional administrator: ' . $user_id);
             }
+        }
+
+        // Skip role writes when this blog already has the role we granted last time
+        $role_current = $cached_role === $wp_role
+            && (!is_multisite() || is_user_member_of_blog($user_id, $blog_id));
 
-            if ($blog_id != get_current_blog_id()) {
+        if (!$role_current) {
+            if (is_multisite() && $blog_id != get_current_blog_id()) {
                 add_user_to_blog($blog_id, $user_id, $wp_role);
                 error_log('[PB-LTI] Added user ' . $user_id . ' to blog ' . $blog_id . ' with role ' . $wp_role);
             } else {
                 $user->set_role($wp_role);
             }
-        } else {
-            $user->set_role($wp_role);
+            IdentityStore::remember_role($identity_id, $blog_id, $wp_role);
         }
 
         wp_set_current_user($user->ID);
@@ -184,22 +188,4 @@ class RoleMapper {
 
         return $user->ID;
     }
-
-    private static function get_user_by_lti_id($lti_user_id, $platform_issuer) {
-        global $wpdb;
-
-        // Look up user by LTI ID and platform
-        $user_id = $wpdb->get_var($wpdb->prepare(
-            "SELECT user_id FROM {$wpdb->usermeta}
-             WHERE meta_key = '_lti_user_id' AND meta_value = %s
-             AND user_id IN (
-                 SELECT user_id FROM {$wpdb->usermeta}
-                 WHERE meta_key = '_lti_platform_issuer' AND meta_value = %s
-             )",
-            $lti_user_id,
-            $platform_issuer
-        ));
-
-        return $user_id ? (int)$user_id : null;
-    }
 }
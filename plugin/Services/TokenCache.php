@@ -1,28 +1,187 @@
 <?php
 namespace PB_LTI\Services;
 
+/**
+ * TokenCache
+ *
+ * OAuth2 access tokens per (issuer, scope set). Tokens are refreshed ahead
+ * of expiry, and refreshes are single-flight: a per-key MySQL named lock lets
+ * one worker fetch while the others keep using the still-valid token, or
+ * briefly wait for the new one when there is none.
+ */
 class TokenCache {
 
-    public static function get(string $issuer): ?string {
-        $cached = get_site_transient('pb_lti_token_' . md5($issuer));
-        if (!$cached) {
-            return null;
-        }
-        if ($cached['expires_at'] <= time()) {
-            delete_site_transient('pb_lti_token_' . md5($issuer));
-            return null;
-        }
-        return $cached['token'];
+    const REFRESH_AHEAD = 300;      // Start refreshing this long before expiry
+    const EXPIRY_MARGIN = 30;       // Treat tokens as expired this early (clock skew)
+    const LOCK_WAIT = 5;            // Seconds to wait for another worker's refresh
+    const LOCK_POLL_MS = 100;
+
+    public static function get(string $issuer, array $scopes = []): ?string {
+        $cached = self::read($issuer, $scopes);
+        return $cached ? $cached['token'] : null;
     }
 
-    public static function set(string $issuer, string $token, int $expires_in): void {
+    public static function set(string $issuer, string $token, int $expires_in, array $scopes = []): void {
+        $lifetime = max(1, $expires_in - self::EXPIRY_MARGIN);
+
         set_site_transient(
-            'pb_lti_token_' . md5($issuer),
+            self::cache_key($issuer, $scopes),
             [
                 'token' => $token,
-                'expires_at' => time() + $expires_in - 30
+                'expires_at' => time() + $lifetime,
+                // Refresh in the last REFRESH_AHEAD seconds, or the last fifth of short-lived tokens
+                'refresh_at' => time() + max((int)($lifetime * 0.8), $lifetime - self::REFRESH_AHEAD)
             ],
             $expires_in
         );
     }
+
+    /**
+     * Get a valid token, fetching at most once across concurrent workers
+     *
+     * @param string $issuer Platform issuer
+     * @param array $scopes Scopes the token must carry
+     * @param callable $fetch Returns ['access_token' => string, 'expires_in' => int]
+     * @return string Access token
+     * @throws \Exception When no token can be obtained
+     */
+    public static function acquire(string $issuer, array $scopes, callable $fetch): string {
+        $cached = self::read($issuer, $scopes);
+
+        if ($cached && time() < $cached['refresh_at']) {
+            return $cached['token'];
+        }
+
+        $lock = self::lock_name($issuer, $scopes);
+
+        if ($cached) {
+            // Still valid but due for refresh: only the lock holder refreshes
+            if (!self::try_lock($lock)) {
+                return $cached['token'];
+            }
+            try {
+                return self::refresh($issuer, $scopes, $fetch);
+            } catch (\Exception $e) {
+                error_log('[PB-LTI Token] Proactive refresh failed for ' . $issuer . ', keeping current token: ' . $e->getMessage());
+                return $cached['token'];
+            } finally {
+                self::unlock($lock);
+            }
+        }
+
+        // No usable token: one worker fetches, the rest wait for it
+        if (self::try_lock($lock)) {
+            try {
+                // Another worker may have finished a refresh between our read and the lock
+                $cached = self::read($issuer, $scopes);
+                if ($cached) {
+                    return $cached['token'];
+                }
+                return self::refresh($issuer, $scopes, $fetch);
+            } finally {
+                self::unlock($lock);
+            }
+        }
+
+        $deadline = microtime(true) + self::LOCK_WAIT;
+        while (microtime(true) < $deadline) {
+            usleep(self::LOCK_POLL_MS * 1000);
+            $cached = self::read($issuer, $scopes, true);
+            if ($cached) {
+                return $cached['token'];
+            }
+        }
+
+        // The lock holder is stuck or failed - fetch ourselves rather than fail the request
+        error_log('[PB-LTI Token] Timed out waiting for token refresh for ' . $issuer . ' - fetching directly');
+        return self::refresh($issuer, $scopes, $fetch);
+    }
+
+    private static function refresh(string $issuer, array $scopes, callable $fetch): string {
+        $data = $fetch();
+
+        if (empty($data['access_token'])) {
+            throw new \Exception('No access token in response');
+        }
+
+        self::set($issuer, $data['access_token'], (int)($data['expires_in'] ?? 3600), $scopes);
+
+        return $data['access_token'];
+    }
+
+    /**
+     * @param bool $fresh Bypass this request's cache to see another worker's write
+     */
+    private static function read(string $issuer, array $scopes, bool $fresh = false): ?array {
+        $key = self::cache_key($issuer, $scopes);
+        $cached = $fresh ? self::read_stored($key) : get_site_transient($key);
+        if (!is_array($cached) || empty($cached['token'])) {
+            return null;
+        }
+        if ($cached['expires_at'] <= time()) {
+            return null;
+        }
+        // Entries written before refresh_at existed refresh on their last 5 minutes
+        $cached['refresh_at'] = $cached['refresh_at'] ?? $cached['expires_at'] - self::REFRESH_AHEAD;
+        return $cached;
+    }
+
+    /**
+     * Read a token entry from its backing store, skipping this request's cache
+     *
+     * External object caches hold site transients themselves; otherwise the
+     * entry is the _site_transient_ row in sitemeta (multisite) or options.
+     * Expiry is checked by read() from the entry's own expires_at.
+     */
+    private static function read_stored(string $key) {
+        if (wp_using_ext_object_cache()) {
+            return wp_cache_get($key, 'site-transient', true);
+        }
+
+        global $wpdb;
+
+        if (is_multisite()) {
+            $value = $wpdb->get_var($wpdb->prepare(
+                "SELECT meta_value FROM {$wpdb->sitemeta} WHERE site_id = %d AND meta_key = %s",
+                get_current_network_id(),
+                '_site_transient_' . $key
+            ));
+        } else {
+            $value = $wpdb->get_var($wpdb->prepare(
+                "SELECT option_value FROM {$wpdb->options} WHERE option_name = %s",
+                '_site_transient_' . $key
+            ));
+        }
+
+        return $value === null ? false : maybe_unserialize($value);
+    }
+
+    /**
+     * MySQL named locks are atomic across PHP workers and released automatically
+     * if the worker dies with its connection
+     */
+    private static function try_lock(string $name): bool {
+        global $wpdb;
+        return (int)$wpdb->get_var($wpdb->prepare("SELECT GET_LOCK(%s, 0)", $name)) === 1;
+    }
+
+    private static function unlock(string $name): void {
+        global $wpdb;
+        $wpdb->query($wpdb->prepare("SELECT RELEASE_LOCK(%s)", $name));
+    }
+
+    private static function scope_hash(array $scopes): string {
+        $scopes = array_unique($scopes);
+        sort($scopes);
+        return md5(implode(' ', $scopes));
+    }
+
+    private static function cache_key(string $issuer, array $scopes): string {
+        // Unscoped keys keep the pre-existing name so cached tokens survive upgrades
+        return 'pb_lti_token_' . md5($issuer) . ($scopes ? '_' . substr(self::scope_hash($scopes), 0, 12) : '');
+    }
+
+    private static function lock_name(string $issuer, array $scopes): string {
+        return 'pb_lti_tok_' . md5($issuer . '|' . self::scope_hash($scopes));
+    }
 }
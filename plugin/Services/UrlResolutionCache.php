@@ -0,0 +1,186 @@
+<?php
+namespace PB_LTI\Services;
+
+/**
+ * UrlResolutionCache
+ *
+ * Caches target_link_uri -> (blog_id, post_id) so launches skip blog lookup,
+ * switch_to_blog and rewrite-rule matching. Entries live in the object cache
+ * with the network table lti_url_resolution behind it, are seeded by Deep
+ * Linking when it emits content items, and are dropped when a post's slug,
+ * parent or status changes or a book's permalinks, domain or path change.
+ */
+class UrlResolutionCache {
+
+    const CACHE_GROUP = 'pb_lti_url_resolution';
+
+    /**
+     * Initialize cache group and invalidation hooks
+     */
+    public static function init() {
+        wp_cache_add_global_groups([self::CACHE_GROUP]);
+
+        add_action('post_updated', [__CLASS__, 'on_post_updated'], 10, 3);
+        add_action('trashed_post', [__CLASS__, 'forget_post']);
+        add_action('deleted_post', [__CLASS__, 'forget_post']);
+
+        foreach (['permalink_structure', 'home', 'siteurl'] as $option) {
+            add_action('update_option_' . $option, [__CLASS__, 'forget_current_blog']);
+        }
+
+        add_action('wp_update_site', [__CLASS__, 'on_site_updated'], 10, 2);
+        add_action('wp_uninitialize_site', [__CLASS__, 'on_site_deleted']);
+    }
+
+    /**
+     * Look up a cached resolution
+     *
+     * @param string $url Target link URI
+     * @return array|null ['blog_id' => int, 'post_id' => int] or null on miss
+     */
+    public static function get($url) {
+        global $wpdb;
+
+        $hash = self::hash($url);
+        $cached = wp_cache_get($hash, self::CACHE_GROUP);
+        if (is_array($cached)) {
+            return $cached;
+        }
+
+        $row = $wpdb->get_row($wpdb->prepare(
+            "SELECT blog_id, post_id FROM " . self::table() . " WHERE url_hash = %s",
+            $hash
+        ));
+        if (!$row) {
+            return null;
+        }
+
+        $resolved = ['blog_id' => (int)$row->blog_id, 'post_id' => (int)$row->post_id];
+        wp_cache_set($hash, $resolved, self::CACHE_GROUP);
+
+        return $resolved;
+    }
+
+    /**
+     * Remember a URL's resolution
+     *
+     * @param string $url Target link URI
+     * @param int $blog_id Book blog ID
+     * @param int $post_id Post ID
+     */
+    public static function set($url, $blog_id, $post_id) {
+        global $wpdb;
+
+        if (!$url || !$post_id) {
+            return;
+        }
+
+        $hash = self::hash($url);
+        $wpdb->query($wpdb->prepare(
+            "REPLACE INTO " . self::table() . " (url_hash, url, blog_id, post_id, created_at) VALUES (%s, %s, %d, %d, %s)",
+            $hash,
+            self::normalize($url),
+            $blog_id,
+            $post_id,
+            current_time('mysql', true)
+        ));
+
+        wp_cache_set($hash, ['blog_id' => (int)$blog_id, 'post_id' => (int)$post_id], self::CACHE_GROUP);
+    }
+
+    /**
+     * Drop a post's URLs when its slug, parent, type or status changes
+     */
+    public static function on_post_updated($post_id, $after, $before) {
+        foreach (['post_name', 'post_parent', 'post_status', 'post_type'] as $field) {
+            if ($after->$field !== $before->$field) {
+                self::forget_post($post_id);
+                return;
+            }
+        }
+    }
+
+    /**
+     * Drop every cached URL for a post in the current blog
+     *
+     * @param int $post_id Post ID
+     */
+    public static function forget_post($post_id) {
+        self::forget(get_current_blog_id(), (int)$post_id);
+    }
+
+    /**
+     * Drop every cached URL for the current blog (permalink settings changed)
+     */
+    public static function forget_current_blog() {
+        self::forget(get_current_blog_id());
+    }
+
+    /**
+     * Drop a book's URLs when its domain or path changes
+     */
+    public static function on_site_updated($new_site, $old_site) {
+        if ($new_site->domain !== $old_site->domain || $new_site->path !== $old_site->path) {
+            self::forget((int)$new_site->blog_id);
+        }
+    }
+
+    public static function on_site_deleted($site) {
+        self::forget((int)$site->blog_id);
+    }
+
+    /**
+     * Delete entries for a blog (optionally one post) from the table and the object cache
+     */
+    private static function forget($blog_id, $post_id = null) {
+        global $wpdb;
+
+        $where = $wpdb->prepare("blog_id = %d", $blog_id);
+        if ($post_id !== null) {
+            $where .= $wpdb->prepare(" AND post_id = %d", $post_id);
+        }
+
+        $hashes = $wpdb->get_col("SELECT url_hash FROM " . self::table() . " WHERE {$where}");
+        if (empty($hashes)) {
+            return;
+        }
+
+        $wpdb->query("DELETE FROM " . self::table() . " WHERE {$where}");
+        foreach ($hashes as $hash) {
+            wp_cache_delete($hash, self::CACHE_GROUP);
+        }
+    }
+
+    /**
+     * Canonical form: lowercase scheme/host, no fragment, no trailing slash
+     *
+     * @param string $url URL
+     * @return string
+     */
+    public static function normalize($url) {
+        $parts = wp_parse_url($url);
+        if (!$parts || empty($parts['host'])) {
+            return $url;
+        }
+
+        $normalized = strtolower($parts['scheme'] ?? 'https') . '://' . strtolower($parts['host']);
+        if (isset($parts['port'])) {
+            $normalized .= ':' . $parts['port'];
+        }
+        $normalized .= untrailingslashit($parts['path'] ?? '');
+        if (isset($parts['query']) && $parts['query'] !== '') {
+            $normalized .= '?' . $parts['query'];
+        }
+
+        return $normalized;
+    }
+
+    private static function hash($url) {
+        return md5(self::normalize($url));
+    }
+
+    private static function table() {
+        global $wpdb;
+        return $wpdb->base_prefix . 'lti_url_resolution';
+    }
+}
@@ -555,76 +555,118 @@ class H5PResultsMetaBox {
                 $('.pb-lti-included-count').text(checked);
             }
 
-            // Sync existing grades AJAX handler
-            $('#pb-lti-sync-existing-grades').on('click', function() {
-                const $button = $(this);
-                const $spinner = $('.pb-lti-sync-spinner');
-                const $results = $('#pb-lti-sync-results');
-                const postId = $button.data('post-id');
+            // Sync existing grades AJAX handler (batched; each request advances the run)
+            const syncNonce = '<?php echo wp_create_nonce('pb_lti_sync_grades'); ?>';
 
-                // Confirm before syncing
-                if (!confirm('This will sync all existing H5P grades for this chapter to the LMS gradebook. Continue?')) {
-                    return;
+            function renderSyncProgress(r, noticeClass, label) {
+                const $results = $('#pb-lti-sync-results');
+                $results.removeClass('notice-success notice-error notice-warning notice-info')
+                        .addClass(noticeClass)
+                        .html('<p><strong>' + label + '</strong> ' +
+                              r.done + ' of ' + r.total + ' students processed</p>' +
+                              '<ul>' +
+                              '<li>Successfully synced: ' + r.success + '</li>' +
+                              '<li>Skipped (no LTI context): ' + r.skipped + '</li>' +
+                              '<li>Failed: ' + r.failed + '</li>' +
+                              '<li>Remaining: ' + r.remaining + '</li>' +
+                              '</ul>')
+                        .show();
+
+                if (r.errors && r.errors.length > 0) {
+                    $results.append(
+                        '<details style="margin-top: 10px;">' +
+                        '<summary>View Errors</summary>' +
+                        '<ul><li>' + r.errors.join('</li><li>') + '</li></ul>' +
+                        '</details>'
+                    );
                 }
+            }
 
-                // Show loading state
-                $button.prop('disabled', true);
-                $spinner.addClass('is-active');
-                $results.hide().removeClass('notice-success notice-error notice-warning');
+            function runSyncStep(postId, step) {
+                const $button = $('#pb-lti-sync-existing-grades');
+                const $spinner = $('.pb-lti-sync-spinner');
+                const $results = $('#pb-lti-sync-results');
 
-                // Make AJAX request
                 $.ajax({
                     url: ajaxurl,
                     type: 'POST',
                     data: {
                         action: 'pb_lti_sync_existing_grades',
                         post_id: postId,
-                        nonce: '<?php echo wp_create_nonce('pb_lti_sync_grades'); ?>'
+                        step: step,
+                        nonce: syncNonce
                     },
                     success: function(response) {
-                        $spinner.removeClass('is-active');
-                        $button.prop('disabled', false);
-
-                        if (response.success) {
-                            $results.addClass('notice-success')
-                                   .html('<p><strong>✅ Success:</strong> ' + response.data.message + '</p>')
-                                   .show();
-
-                            // Show detailed results if available
-                            if (response.data.results) {
-                                const r = response.data.results;
-                                const details = '<ul>' +
-                                    '<li>Successfully synced: ' + r.success + '</li>' +
-                                    '<li>Skipped (no LTI context): ' + r.skipped + '</li>' +
-                                    '<li>Failed: ' + r.failed + '</li>' +
-                                    '</ul>';
-                                $results.find('p').append(details);
-
-                                if (r.errors && r.errors.length > 0) {
-                                    $results.find('p').append(
-                                        '<details style="margin-top: 10px;">' +
-                                        '<summary>View Errors</summary>' +
-                                        '<ul><li>' + r.errors.join('</li><li>') + '</li></ul>' +
-                                        '</details>'
-                                    );
-                                }
-                            }
-                        } else {
-                            $results.addClass('notice-error')
+                        if (!response.success) {
+                            $spinner.removeClass('is-active');
+                            $button.prop('disabled', false);
+                            $results.removeClass('notice-info').addClass('notice-error')
                                    .html('<p><strong>❌ Error:</strong> ' + response.data.message + '</p>')
                                    .show();
+                            return;
+                        }
+
+                        const r = response.data.results;
+                        if (r.busy) {
+                            // Another tab or request holds this chapter's run; check back shortly
+                            renderSyncProgress(r, 'notice-info', '⏳ Waiting for another sync request…');
+                            setTimeout(function() { runSyncStep(postId, 'continue'); }, 2000);
+                            return;
+                        }
+                        if (r.status === 'running') {
+                            renderSyncProgress(r, 'notice-info', '🔄 Syncing…');
+                            runSyncStep(postId, 'continue');
+                            return;
                         }
+
+                        $spinner.removeClass('is-active');
+                        $button.prop('disabled', false).text('🔄 Sync Existing Grades to LMS').data('resume', false);
+                        renderSyncProgress(r, r.failed > 0 ? 'notice-warning' : 'notice-success', r.failed > 0 ? '⚠️ Completed with errors:' : '✅ Success:');
                     },
                     error: function(xhr, status, error) {
+                        // Progress is saved per batch, so the run can be resumed
                         $spinner.removeClass('is-active');
-                        $button.prop('disabled', false);
-                        $results.addClass('notice-error')
-                               .html('<p><strong>❌ Error:</strong> ' + error + '</p>')
+                        $button.prop('disabled', false).text('🔄 Resume Grade Sync').data('resume', true);
+                        $results.removeClass('notice-info').addClass('notice-error')
+                               .html('<p><strong>❌ Error:</strong> ' + error + ' — click Resume to continue where it stopped.</p>')
                                .show();
                     }
                 });
+            }
+
+            $('#pb-lti-sync-existing-grades').on('click', function() {
+                const $button = $(this);
+                const postId = $button.data('post-id');
+                const resume = $button.data('resume') === true;
+
+                // Confirm before syncing
+                if (!resume && !confirm('This will sync all existing H5P grades for this chapter to the LMS gradebook. Continue?')) {
+                    return;
+                }
+
+                // Show loading state
+                $button.prop('disabled', true);
+                $('.pb-lti-sync-spinner').addClass('is-active');
+                $('#pb-lti-sync-results').hide().removeClass('notice-success notice-error notice-warning');
+
+                runSyncStep(postId, resume ? 'continue' : 'start');
             });
 
+            // Offer to resume an interrupted run
+            if ($('#pb-lti-sync-existing-grades').length) {
+                $.post(ajaxurl, {
+                    action: 'pb_lti_sync_progress',
+                    post_id: $('#pb-lti-sync-existing-grades').data('post-id'),
+                    nonce: syncNonce
+                }, function(response) {
+                    if (response.success && response.data.results && response.data.results.status === 'running') {
+                        const r = response.data.results;
+                        $('#pb-lti-sync-existing-grades').text('🔄 Resume Grade Sync (' + r.remaining + ' remaining)').data('resume', true);
+                        renderSyncProgress(r, 'notice-warning', '⏸️ Interrupted sync:');
+                    }
+                });
+            }
+
             // Results Viewer Modal Handlers
             let allResults = [];
             let currentPage = 1;
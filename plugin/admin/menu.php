@@ -8,8 +8,21 @@ add_action('network_admin_menu', function(){
 
 function pb_lti_audit_page() {
   global $wpdb;
-  $rows = $wpdb->get_results("SELECT * FROM {$wpdb->prefix}lti_audit ORDER BY id DESC LIMIT 100");
-  echo '<h1>LTI Audit Log</h1><table><tr><th>Event</th><th>Context</th><th>Time</th></tr>';
+
+  // Daily counts come from the rollup table, not a scan of the log
+  $totals = [];
+  foreach (\PB_LTI\Services\AuditLogger::daily_counts(30) as $r) {
+    $totals[$r->event] = ($totals[$r->event] ?? 0) + (int)$r->count;
+  }
+  echo '<h1>LTI Audit Log</h1><h2>Last 30 days</h2><table><tr><th>Event</th><th>Count</th></tr>';
+  foreach ($totals as $event => $count) {
+    echo '<tr><td>' . esc_html($event) . '</td><td>' . (int)$count . '</td></tr>';
+  }
+  echo '</table>';
+  echo '<p>Retention: ' . (int)\PB_LTI\Services\AuditLogger::retention_days() . ' days</p>';
+
+  $rows = $wpdb->get_results("SELECT * FROM {$wpdb->base_prefix}lti_audit ORDER BY id DESC LIMIT 100");
+  echo '<h2>Recent events</h2><table><tr><th>Event</th><th>Context</th><th>Time</th></tr>';
   foreach ($rows as $r) {
     echo "<tr><td>{$r->event}</td><td>{$r->context}</td><td>{$r->created_at}</td></tr>";
   }
@@ -6,7 +6,8 @@
 defined('ABSPATH') || exit;
 
 use PB_LTI\Services\ContentService;
-use PB_LTI\Services\H5PGradeSyncEnhanced;
+use PB_LTI\Services\BulkGradeSync;
+use PB_LTI\Services\GradebookExport;
 
 /**
  * AJAX handler: Get book structure (chapters, parts, etc.)
@@ -31,8 +32,24 @@ function pb_lti_ajax_get_book_structure() {
     }
 }
 
+/**
+ * AJAX handler: Search the book catalog (Deep Linking picker)
+ */
+add_action('wp_ajax_pb_lti_search_books', 'pb_lti_ajax_search_books');
+add_action('wp_ajax_nopriv_pb_lti_search_books', 'pb_lti_ajax_search_books');
+
+function pb_lti_ajax_search_books() {
+    $search = isset($_POST['search']) ? sanitize_text_field(wp_unslash($_POST['search'])) : '';
+    $page = isset($_POST['page']) ? intval($_POST['page']) : 1;
+
+    wp_send_json_success(ContentService::search_books($search, $page));
+}
+
 /**
  * AJAX handler: Sync existing H5P grades for a chapter
+ *
+ * Processes one batch per request. step=start begins a new run; step=continue
+ * resumes the current one. The UI keeps calling until status is "complete".
  */
 add_action('wp_ajax_pb_lti_sync_existing_grades', 'pb_lti_ajax_sync_existing_grades');
 
@@ -41,6 +58,7 @@ function pb_lti_ajax_sync_existing_grades() {
     check_ajax_referer('pb_lti_sync_grades', 'nonce');
 
     $post_id = isset($_POST['post_id']) ? intval($_POST['post_id']) : 0;
+    $step = isset($_POST['step']) ? sanitize_key($_POST['step']) : 'start';
 
     if (!$post_id) {
         wp_send_json_error(['message' => 'Invalid post ID']);
@@ -53,26 +71,46 @@ function pb_lti_ajax_sync_existing_grades() {
         return;
     }
 
-    // Run the sync
+    // Run the next batch
     try {
-        $results = H5PGradeSyncEnhanced::sync_existing_grades($post_id);
+        if ($step === 'start') {
+            $progress = BulkGradeSync::start($post_id);
+            if ($progress['status'] === BulkGradeSync::STATUS_COMPLETE && $progress['total'] === 0 && !empty($progress['errors'])) {
+                wp_send_json_error([
+                    'message' => 'No grades were synced. ' . implode(' ', $progress['errors']),
+                    'results' => $progress
+                ]);
+                return;
+            }
+        }
 
-        if ($results['success'] > 0 || $results['skipped'] > 0) {
+        $progress = BulkGradeSync::run_batch($post_id);
+
+        if (!$progress) {
+            wp_send_json_error(['message' => 'No sync in progress for this chapter']);
+            return;
+        }
+
+        if (!empty($progress['busy'])) {
+            // Another request (second tab, retried call) is running this chapter's batch
             wp_send_json_success([
-                'message' => sprintf(
-                    'Sync complete: %d succeeded, %d skipped, %d failed',
-                    $results['success'],
-                    $results['skipped'],
-                    $results['failed']
-                ),
-                'results' => $results
-            ]);
-        } else {
-            wp_send_json_error([
-                'message' => 'No grades were synced. ' . implode(' ', $results['errors']),
-                'results' => $results
+                'message' => 'Another request is syncing this chapter - waiting',
+                'results' => $progress
             ]);
+            return;
         }
+
+        wp_send_json_success([
+            'message' => sprintf(
+                '%s: %d succeeded, %d skipped, %d failed, %d remaining',
+                $progress['status'] === BulkGradeSync::STATUS_COMPLETE ? 'Sync complete' : 'Syncing',
+                $progress['success'],
+                $progress['skipped'],
+                $progress['failed'],
+                $progress['remaining']
+            ),
+            'results' => $progress
+        ]);
     } catch (\Exception $e) {
         wp_send_json_error([
             'message' => 'Error during sync: ' . $e->getMessage()
@@ -80,6 +118,24 @@ function pb_lti_ajax_sync_existing_grades() {
     }
 }
 
+/**
+ * AJAX handler: Read progress of the current/last grade sync run (no side effects)
+ */
+add_action('wp_ajax_pb_lti_sync_progress', 'pb_lti_ajax_sync_progress');
+
+function pb_lti_ajax_sync_progress() {
+    check_ajax_referer('pb_lti_sync_grades', 'nonce');
+
+    $post_id = isset($_POST['post_id']) ? intval($_POST['post_id']) : 0;
+
+    if (!$post_id || !current_user_can('edit_post', $post_id)) {
+        wp_send_json_error(['message' => 'Insufficient permissions']);
+        return;
+    }
+
+    wp_send_json_success(['results' => BulkGradeSync::get_progress($post_id)]);
+}
+
 /**
  * AJAX handler: Get all H5P results for a chapter
  */
@@ -161,3 +217,214 @@ function pb_lti_ajax_get_h5p_results() {
         wp_send_json_error(['message' => 'Error fetching results: ' . $e->getMessage()]);
     }
 }
+
+/**
+ * Check the book a Results Viewer chapter belongs to
+ *
+ * Post IDs are only unique within a blog, so the viewer sends the chapter's
+ * blog_id with its post_id (it may be launched on the main site and list
+ * chapters from other books). Without one, the current blog is assumed.
+ *
+ * @param int $post_id Chapter post ID
+ * @param int $blog_id Blog the chapter belongs to (0 = current blog)
+ * @return int|null Blog ID, or null if the chapter doesn't exist there
+ */
+function pb_lti_results_blog_for_post($post_id, $blog_id = 0) {
+    $blog_id = $blog_id ?: get_current_blog_id();
+
+    if (!is_multisite() || $blog_id === get_current_blog_id()) {
+        return get_post($post_id) ? $blog_id : null;
+    }
+
+    if (!get_site($blog_id)) {
+        return null;
+    }
+
+    switch_to_blog($blog_id);
+    $found = (bool)get_post($post_id);
+    restore_current_blog();
+
+    return $found ? $blog_id : null;
+}
+
+/**
+ * AJAX handler: One page of Results Viewer rows (no attempt details)
+ */
+add_action('wp_ajax_pb_lti_get_results_page', 'pb_lti_ajax_get_results_page');
+
+function pb_lti_ajax_get_results_page() {
+    check_ajax_referer('pb_lti_h5p_results_nonce', 'nonce');
+
+    $post_id = isset($_POST['post_id']) ? intval($_POST['post_id']) : 0;
+    $blog_id = $post_id ? pb_lti_results_blog_for_post($post_id, isset($_POST['blog_id']) ? intval($_POST['blog_id']) : 0) : null;
+
+    if (!$blog_id) {
+        wp_send_json_error(['message' => 'Invalid post ID']);
+        return;
+    }
+
+    switch_to_blog($blog_id);
+
+    $is_instructor = current_user_can('edit_post', $post_id) || is_super_admin();
+
+    try {
+        $page = \PB_LTI\Services\H5PResultsManager::get_results_page($post_id, [
+            'search' => isset($_POST['search']) ? sanitize_text_field(wp_unslash($_POST['search'])) : '',
+            'sort' => isset($_POST['sort']) ? sanitize_key($_POST['sort']) : 'name',
+            'order' => isset($_POST['order']) ? sanitize_key($_POST['order']) : 'asc',
+            'activity' => isset($_POST['activity']) ? intval($_POST['activity']) : 0,
+            'per_page' => isset($_POST['per_page']) ? intval($_POST['per_page']) : 25,
+            'cursor' => isset($_POST['cursor']) ? sanitize_text_field(wp_unslash($_POST['cursor'])) : '',
+            // Students only ever see their own row
+            'user_ids' => $is_instructor ? null : [get_current_user_id()]
+        ]);
+        $page['last_sync'] = get_post_meta($post_id, '_lti_last_grade_sync', true) ?: 'Never';
+        $page['is_instructor'] = $is_instructor;
+
+        restore_current_blog();
+        wp_send_json_success($page);
+    } catch (\Exception $e) {
+        restore_current_blog();
+        wp_send_json_error(['message' => 'Error fetching results: ' . $e->getMessage()]);
+    }
+}
+
+/**
+ * AJAX handler: Attempts and sync history for one student (loaded when details are opened)
+ */
+add_action('wp_ajax_pb_lti_get_result_details', 'pb_lti_ajax_get_result_details');
+
+function pb_lti_ajax_get_result_details() {
+    check_ajax_referer('pb_lti_h5p_results_nonce', 'nonce');
+
+    $post_id = isset($_POST['post_id']) ? intval($_POST['post_id']) : 0;
+    $user_id = isset($_POST['user_id']) ? intval($_POST['user_id']) : 0;
+    $blog_id = $post_id ? pb_lti_results_blog_for_post($post_id, isset($_POST['blog_id']) ? intval($_POST['blog_id']) : 0) : null;
+
+    if (!$blog_id || !$user_id) {
+        wp_send_json_error(['message' => 'Invalid post or user ID']);
+        return;
+    }
+
+    switch_to_blog($blog_id);
+
+    if ($user_id !== get_current_user_id() && !current_user_can('edit_post', $post_id) && !is_super_admin()) {
+        restore_current_blog();
+        wp_send_json_error(['message' => 'Insufficient permissions']);
+        return;
+    }
+
+    try {
+        $results = \PB_LTI\Services\H5PResultsManager::get_chapter_results($post_id, [$user_id]);
+        restore_current_blog();
+
+        if (!isset($results[$user_id])) {
+            wp_send_json_error(['message' => 'No results for this student']);
+            return;
+        }
+
+        wp_send_json_success($results[$user_id]);
+    } catch (\Exception $e) {
+        restore_current_blog();
+        wp_send_json_error(['message' => 'Error fetching results: ' . $e->getMessage()]);
+    }
+}
+
+/**
+ * AJAX handler: Latest grade sync log entry for a student and chapter (read-only)
+ *
+ * Lets tests and tooling wait for a score to reach the LMS instead of
+ * sleeping. Defaults to the current user; students can only read their own.
+ */
+add_action('wp_ajax_pb_lti_grade_sync_status', 'pb_lti_ajax_grade_sync_status');
+
+function pb_lti_ajax_grade_sync_status() {
+    $post_id = isset($_GET['post_id']) ? intval($_GET['post_id']) : 0;
+    $user_id = isset($_GET['user_id']) ? intval($_GET['user_id']) : get_current_user_id();
+    $blog_id = $post_id ? pb_lti_results_blog_for_post($post_id, isset($_GET['blog_id']) ? intval($_GET['blog_id']) : 0) : null;
+
+    if (!$blog_id || !$user_id) {
+        wp_send_json_error(['message' => 'Invalid post or user ID']);
+        return;
+    }
+
+    switch_to_blog($blog_id);
+
+    if ($user_id !== get_current_user_id() && !current_user_can('edit_post', $post_id) && !is_super_admin()) {
+        restore_current_blog();
+        wp_send_json_error(['message' => 'Insufficient permissions']);
+        return;
+    }
+
+    $entry = \PB_LTI\Services\H5PGradeSyncEnhanced::get_latest_sync($user_id, $post_id);
+    restore_current_blog();
+
+    nocache_headers();
+    wp_send_json_success([
+        'user_id' => $user_id,
+        'post_id' => $post_id,
+        'entry' => $entry
+    ]);
+}
+
+/**
+ * AJAX handler: Stream a gradebook export (one chapter, or every grading chapter of the book)
+ *
+ * GET post_id=<id>&blog_id=<id>[&scope=book], format=csv|jsonl. With scope=book the
+ * chapter only identifies the book, and every grading chapter of that book is exported.
+ */
+add_action('wp_ajax_pb_lti_export_gradebook', 'pb_lti_ajax_export_gradebook');
+
+function pb_lti_ajax_export_gradebook() {
+    check_ajax_referer('pb_lti_export_gradebook', 'nonce');
+
+    $post_id = isset($_GET['post_id']) ? intval($_GET['post_id']) : 0;
+    $whole_book = isset($_GET['scope']) && $_GET['scope'] === 'book';
+    $format = isset($_GET['format']) && $_GET['format'] === GradebookExport::FORMAT_JSONL
+        ? GradebookExport::FORMAT_JSONL
+        : GradebookExport::FORMAT_CSV;
+
+    // Same lookup for both scopes: the viewer may run on the main site and list other books' chapters
+    $blog_id = $post_id ? pb_lti_results_blog_for_post($post_id, isset($_GET['blog_id']) ? intval($_GET['blog_id']) : 0) : null;
+    if (!$blog_id) {
+        wp_send_json_error(['message' => 'Invalid post ID']);
+        return;
+    }
+
+    switch_to_blog($blog_id);
+
+    $allowed = $whole_book
+        ? current_user_can('edit_others_posts') || is_super_admin()
+        : current_user_can('edit_post', $post_id) || is_super_admin();
+    if (!$allowed) {
+        restore_current_blog();
+        wp_send_json_error(['message' => 'Insufficient permissions']);
+        return;
+    }
+
+    $post_ids = $whole_book ? GradebookExport::grading_chapters() : [$post_id];
+    $filename = sanitize_file_name(
+        get_bloginfo('name') . ($whole_book ? '' : '-' . get_the_title($post_id)) . '-grades-' . gmdate('Ymd')
+    ) . '.' . $format;
+
+    // Stream straight to the client instead of building the export in memory
+    while (ob_get_level()) {
+        ob_end_clean();
+    }
+    if (function_exists('set_time_limit')) {
+        set_time_limit(0);
+    }
+    nocache_headers();
+    header('Content-Type: ' . ($format === GradebookExport::FORMAT_CSV ? 'text/csv' : 'application/x-ndjson') . '; charset=UTF-8');
+    header('Content-Disposition: attachment; filename="' . $filename . '"');
+    header('X-Accel-Buffering: no');
+
+    $handle = fopen('php://output', 'w');
+    $written = GradebookExport::stream($post_ids, $format, $handle);
+    fclose($handle);
+
+    error_log('[PB-LTI Export] Exported ' . $written . ' student records from ' . count($post_ids) . ' chapters (blog ' . $blog_id . ', ' . $format . ')');
+
+    restore_current_blog();
+    exit;
+}
@@ -10,19 +10,33 @@ require_once PB_LTI_PATH.'Services/AuditLogger.php';
 require_once PB_LTI_PATH.'Services/PlatformRegistry.php';
 require_once PB_LTI_PATH.'Services/DeploymentRegistry.php';
 require_once PB_LTI_PATH.'Services/NonceService.php';
+require_once PB_LTI_PATH.'Services/OidcState.php';
+require_once PB_LTI_PATH.'Services/LmsHttp.php';
+require_once PB_LTI_PATH.'Services/JwksCache.php';
 require_once PB_LTI_PATH.'Services/JwtValidator.php';
+require_once PB_LTI_PATH.'Services/IdentityStore.php';
 require_once PB_LTI_PATH.'Services/RoleMapper.php';
 require_once PB_LTI_PATH.'Services/CookieManager.php';
 require_once PB_LTI_PATH.'Services/TokenCache.php';
 require_once PB_LTI_PATH.'Services/AGSClient.php';
+require_once PB_LTI_PATH.'Services/GradeOutbox.php';
 require_once PB_LTI_PATH.'Services/ScaleMapper.php';
 require_once PB_LTI_PATH.'Services/LineItemService.php';
+require_once PB_LTI_PATH.'Services/LineItemCache.php';
+require_once PB_LTI_PATH.'Services/LaunchContext.php';
+require_once PB_LTI_PATH.'Services/UrlResolutionCache.php';
+require_once PB_LTI_PATH.'Services/BookCatalog.php';
+require_once PB_LTI_PATH.'Services/BookStructureCache.php';
 require_once PB_LTI_PATH.'Services/ContentService.php';
 require_once PB_LTI_PATH.'Services/EmbedService.php';
 require_once PB_LTI_PATH.'Services/H5PGradeSync.php';
 require_once PB_LTI_PATH.'Services/H5PActivityDetector.php';
+require_once PB_LTI_PATH.'Services/H5PContentIndex.php';
 require_once PB_LTI_PATH.'Services/H5PResultsManager.php';
+require_once PB_LTI_PATH.'Services/ChapterScores.php';
 require_once PB_LTI_PATH.'Services/H5PGradeSyncEnhanced.php';
+require_once PB_LTI_PATH.'Services/BulkGradeSync.php';
+require_once PB_LTI_PATH.'Services/GradebookExport.php';
 require_once PB_LTI_PATH.'Services/H5PMultisiteSetup.php';
 
 // Load all Controllers
@@ -37,6 +51,7 @@ require_once PB_LTI_PATH.'admin/menu.php';
 require_once PB_LTI_PATH.'admin/h5p-results-metabox.php';
 require_once PB_LTI_PATH.'routes/rest.php';
 require_once PB_LTI_PATH.'ajax/handlers.php';
+require_once PB_LTI_PATH.'cli/commands.php';
 
 // Load database installer
 require_once PB_LTI_PATH.'db/schema.php';
@@ -62,6 +77,42 @@ add_action('admin_init', ['PB_LTI\Admin\H5PResultsMetaBox', 'init']);
 // Falls back to individual activity sync when chapter grading is not configured
 add_action('init', ['PB_LTI\Services\H5PGradeSyncEnhanced', 'init']);
 
+// Initialize H5P content index (h5p_id -> chapter, maintained on save_post)
+add_action('init', ['PB_LTI\Services\H5PContentIndex', 'init']);
+
+// Initialize H5P activity inventory (per-post _lti_h5p_inventory, refreshed on save)
+add_action('init', ['PB_LTI\Services\H5PActivityDetector', 'init']);
+
+// Initialize LTI identity store cleanup (drops mappings for deleted users)
+add_action('init', ['PB_LTI\Services\IdentityStore', 'init']);
+
+// Initialize nonce store (object-cache backend, hourly purge of expired rows)
+add_action('init', ['PB_LTI\Services\NonceService', 'init']);
+
+// Initialize AGS outbox worker (delivers queued scores via WP-Cron)
+add_action('init', ['PB_LTI\Services\GradeOutbox', 'init']);
+
+// Initialize launch URL resolution cache invalidation (permalink/slug/site path changes)
+add_action('init', ['PB_LTI\Services\UrlResolutionCache', 'init']);
+
+// Initialize audit log buffering (shutdown flush) and retention pruning
+add_action('init', ['PB_LTI\Services\AuditLogger', 'init']);
+
+// Initialize book catalog invalidation (site create/update/delete, name and URL changes)
+add_action('init', ['PB_LTI\Services\BookCatalog', 'init']);
+
+// Initialize book structure cache invalidation (chapter/part/visibility changes)
+add_action('init', ['PB_LTI\Services\BookStructureCache', 'init']);
+
+// Initialize launch context migration (moves per-user lineitem post meta into lti_launch_context)
+add_action('init', ['PB_LTI\Services\LaunchContext', 'init']);
+
+// Initialize lineitem metadata prefetch (fills LineItemCache after launches)
+add_action('init', ['PB_LTI\Services\LineItemCache', 'init']);
+
+// Initialize background JWKS refresh (keeps launch-time key lookups off the network)
+add_action('init', ['PB_LTI\Services\JwksCache', 'init']);
+
 // Initialize cookie manager (ensures cookies work in LTI embedded contexts)
 add_action('init', ['PB_LTI\Services\CookieManager', 'init'], 1);
 
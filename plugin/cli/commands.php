@@ -0,0 +1,214 @@
+<?php
+/**
+ * WP-CLI commands for LTI plugin
+ */
+
+defined('ABSPATH') || exit;
+
+if (!defined('WP_CLI') || !WP_CLI) {
+    return;
+}
+
+use PB_LTI\Services\AuditLogger;
+use PB_LTI\Services\BookCatalog;
+use PB_LTI\Services\ChapterScores;
+use PB_LTI\Services\GradeOutbox;
+use PB_LTI\Services\GradebookExport;
+use PB_LTI\Services\H5PContentIndex;
+use PB_LTI\Services\LaunchContext;
+use PB_LTI\Services\NonceService;
+
+/**
+ * Deliver queued AGS scores now instead of waiting for WP-Cron.
+ *
+ * ## OPTIONS
+ *
+ * [--limit=<limit>]
+ * : Maximum rows to process per batch.
+ * ---
+ * default: 50
+ * ---
+ *
+ * [--all]
+ * : Keep draining until no due rows remain.
+ */
+WP_CLI::add_command('pb-lti outbox drain', function ($args, $assoc_args) {
+    $limit = (int)($assoc_args['limit'] ?? GradeOutbox::BATCH_SIZE);
+    $totals = ['sent' => 0, 'retrying' => 0, 'failed' => 0];
+
+    do {
+        $stats = GradeOutbox::drain($limit);
+        foreach ($stats as $key => $count) {
+            $totals[$key] += $count;
+        }
+        $processed = array_sum($stats);
+    } while (isset($assoc_args['all']) && $processed > 0);
+
+    WP_CLI::success(sprintf(
+        '%d sent, %d retrying, %d failed',
+        $totals['sent'],
+        $totals['retrying'],
+        $totals['failed']
+    ));
+});
+
+/**
+ * Show AGS outbox queue depth by status.
+ */
+WP_CLI::add_command('pb-lti outbox status', function () {
+    $items = [];
+    foreach (GradeOutbox::stats() as $status => $count) {
+        $items[] = ['status' => $status, 'count' => $count];
+    }
+    WP_CLI\Utils\format_items('table', $items, ['status', 'count']);
+});
+
+/**
+ * Re-queue scores the worker gave up on.
+ */
+WP_CLI::add_command('pb-lti outbox retry-failed', function () {
+    WP_CLI::success(GradeOutbox::retry_failed() . ' rows re-queued');
+});
+
+/**
+ * Recalculate materialized chapter scores from H5P results.
+ *
+ * ## OPTIONS
+ *
+ * <post_id>
+ * : Chapter post ID (use --url to select the book).
+ */
+WP_CLI::add_command('pb-lti scores rebuild', function ($args) {
+    WP_CLI::success(ChapterScores::rebuild((int)$args[0]) . ' users scored');
+});
+
+/**
+ * List users whose chapter score differs from what the LMS last received.
+ *
+ * ## OPTIONS
+ *
+ * <post_id>
+ * : Chapter post ID (use --url to select the book).
+ */
+WP_CLI::add_command('pb-lti scores needs-sync', function ($args) {
+    $items = [];
+    foreach (ChapterScores::for_post((int)$args[0], ChapterScores::needs_sync((int)$args[0])) as $user_id => $row) {
+        $items[] = [
+            'user_id' => $user_id,
+            'percentage' => $row['percentage'],
+            'synced_percentage' => $row['synced_percentage'] ?? '-'
+        ];
+    }
+    WP_CLI\Utils\format_items('table', $items, ['user_id', 'percentage', 'synced_percentage']);
+});
+
+/**
+ * Rebuild the H5P content -> chapter index.
+ *
+ * ## OPTIONS
+ *
+ * [--network]
+ * : Backfill every book on the network instead of the current one.
+ */
+WP_CLI::add_command('pb-lti h5p-index backfill', function ($args, $assoc_args) {
+    $blog_ids = isset($assoc_args['network']) && is_multisite()
+        ? get_sites(['fields' => 'ids', 'number' => 0])
+        : [get_current_blog_id()];
+
+    $total = 0;
+    foreach ($blog_ids as $blog_id) {
+        switch_to_blog($blog_id);
+        $count = H5PContentIndex::backfill();
+        restore_current_blog();
+
+        WP_CLI::log(sprintf('Blog %d: %d posts indexed', $blog_id, $count));
+        $total += $count;
+    }
+
+    WP_CLI::success($total . ' posts indexed');
+});
+
+/**
+ * Delete expired launch nonces now instead of waiting for WP-Cron.
+ */
+WP_CLI::add_command('pb-lti nonces purge', function () {
+    WP_CLI::success(NonceService::purge_expired() . ' expired nonces deleted (backend: ' . NonceService::backend() . ')');
+});
+
+/**
+ * Move per-user lineitem post meta into the lti_launch_context table.
+ *
+ * ## OPTIONS
+ *
+ * [--network]
+ * : Migrate every book on the network instead of the current one.
+ */
+WP_CLI::add_command('pb-lti launch-context migrate', function ($args, $assoc_args) {
+    $blog_ids = isset($assoc_args['network']) && is_multisite()
+        ? get_sites(['fields' => 'ids', 'number' => 0])
+        : [get_current_blog_id()];
+
+    $total = 0;
+    foreach ($blog_ids as $blog_id) {
+        switch_to_blog($blog_id);
+        $count = LaunchContext::migrate();
+        restore_current_blog();
+
+        WP_CLI::log(sprintf('Blog %d: %d launch contexts migrated', $blog_id, $count));
+        $total += $count;
+    }
+
+    WP_CLI::success($total . ' launch contexts migrated');
+});
+
+/**
+ * Rebuild the network book catalog used by the Deep Linking picker.
+ */
+WP_CLI::add_command('pb-lti book-catalog rebuild', function () {
+    if (!is_multisite()) {
+        WP_CLI::error('The book catalog requires multisite');
+    }
+
+    WP_CLI::success(BookCatalog::rebuild() . ' books indexed');
+});
+
+/**
+ * Delete audit events older than the retention period now.
+ */
+WP_CLI::add_command('pb-lti audit prune', function () {
+    WP_CLI::success(AuditLogger::prune() . ' audit events deleted (retention: ' . AuditLogger::retention_days() . ' days)');
+});
+
+/**
+ * Export grades for one chapter or every grading-enabled chapter of the book.
+ *
+ * ## OPTIONS
+ *
+ * [--post=<post_id>]
+ * : Chapter to export. Omit to export the whole book.
+ *
+ * [--format=<format>]
+ * : csv or jsonl.
+ * ---
+ * default: csv
+ * ---
+ *
+ * [--output=<file>]
+ * : Write to a file instead of STDOUT.
+ */
+WP_CLI::add_command('pb-lti gradebook export', function ($args, $assoc_args) {
+    $format = ($assoc_args['format'] ?? 'csv') === GradebookExport::FORMAT_JSONL ? GradebookExport::FORMAT_JSONL : GradebookExport::FORMAT_CSV;
+    $post_ids = isset($assoc_args['post']) ? [(int)$assoc_args['post']] : GradebookExport::grading_chapters();
+
+    $handle = isset($assoc_args['output']) ? fopen($assoc_args['output'], 'w') : STDOUT;
+    if (!$handle) {
+        WP_CLI::error('Could not open ' . $assoc_args['output']);
+    }
+
+    $written = GradebookExport::stream($post_ids, $format, $handle);
+
+    if (isset($assoc_args['output'])) {
+        fclose($handle);
+        WP_CLI::success($written . ' student records from ' . count($post_ids) . ' chapters written to ' . $assoc_args['output']);
+    }
+});
@@ -54,8 +54,28 @@ function pb_lti_install_h5p_results_tables() {
 
     dbDelta($sql);
 
+    // Materialized chapter scores (current calculated score vs last score sent to the LMS)
+    $table_name = $wpdb->prefix . 'lti_chapter_scores';
+
+    $sql = "CREATE TABLE $table_name (
+        user_id bigint(20) unsigned NOT NULL COMMENT 'WordPress user ID',
+        post_id bigint(20) unsigned NOT NULL COMMENT 'Chapter/post ID',
+        score decimal(10,2) NOT NULL DEFAULT 0.00 COMMENT 'Calculated chapter score',
+        max_score decimal(10,2) NOT NULL DEFAULT 0.00,
+        percentage decimal(6,2) NOT NULL DEFAULT 0.00,
+        synced_percentage decimal(6,2) DEFAULT NULL COMMENT 'Percentage last delivered to the LMS',
+        synced_at datetime DEFAULT NULL,
+        needs_sync tinyint(1) NOT NULL DEFAULT 1 COMMENT 'Calculated score differs from last synced',
+        updated_at datetime NOT NULL,
+        PRIMARY KEY  (post_id, user_id),
+        KEY user_id (user_id),
+        KEY post_needs_sync (post_id, needs_sync)
+    ) $charset_collate;";
+
+    dbDelta($sql);
+
     // Update version
-    update_option('pb_lti_h5p_results_db_version', '1.0.0');
+    update_option('pb_lti_h5p_results_db_version', '1.1.0');
 
     error_log('[PB-LTI] H5P Results database tables created successfully');
 }
@@ -65,7 +85,7 @@ function pb_lti_install_h5p_results_tables() {
  */
 function pb_lti_check_h5p_results_tables() {
     $current_version = get_option('pb_lti_h5p_results_db_version', '0');
-    $target_version = '1.0.0';
+    $target_version = '1.1.0';
 
     if (version_compare($current_version, $target_version, '<')) {
         pb_lti_install_h5p_results_tables();
@@ -6,4 +6,17 @@ function pb_lti_run_migrations() {
     foreach (pb_lti_schema_sql() as $sql) {
         dbDelta($sql);
     }
+
+    // One-time data migrations
+    if (!get_site_option(\PB_LTI\Services\IdentityStore::BACKFILL_OPTION)) {
+        \PB_LTI\Services\IdentityStore::backfill();
+    }
+
+    if (!get_site_option(\PB_LTI\Services\AuditLogger::ROLLUP_BACKFILL_OPTION)) {
+        \PB_LTI\Services\AuditLogger::backfill_daily();
+    }
+
+    if (is_multisite() && !get_site_option(\PB_LTI\Services\BookCatalog::BUILT_OPTION)) {
+        \PB_LTI\Services\BookCatalog::rebuild();
+    }
 }
@@ -52,16 +52,123 @@ function pb_lti_schema_sql() {
         CREATE TABLE {$wpdb->base_prefix}lti_nonces (
             nonce VARCHAR(255) NOT NULL,
             expires_at DATETIME NOT NULL,
-            PRIMARY KEY  (nonce)
+            PRIMARY KEY  (nonce),
+            KEY expires_at (expires_at)
+        ) $charset;",
+
+        "grade_outbox" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_grade_outbox (
+            id BIGINT UNSIGNED AUTO_INCREMENT,
+            blog_id BIGINT UNSIGNED NOT NULL,
+            user_id BIGINT UNSIGNED NOT NULL,
+            post_id BIGINT UNSIGNED NOT NULL,
+            result_id BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            platform_issuer VARCHAR(255) NOT NULL,
+            lti_user_id VARCHAR(255) NOT NULL,
+            lineitem_url TEXT NOT NULL,
+            lineitem_hash CHAR(32) NOT NULL,
+            score DECIMAL(10,2) NOT NULL,
+            max_score DECIMAL(10,2) NOT NULL,
+            percentage DECIMAL(6,2) NOT NULL,
+            chapter_score TINYINT(1) NOT NULL DEFAULT 0,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+            version INT UNSIGNED NOT NULL DEFAULT 1,
+            last_error TEXT,
+            next_attempt_at DATETIME NOT NULL,
+            created_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY  (id),
+            UNIQUE KEY user_lineitem (user_id, lineitem_hash),
+            KEY status_due (status, next_attempt_at)
+        ) $charset;",
+
+        "identities" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_identities (
+            id BIGINT UNSIGNED AUTO_INCREMENT,
+            issuer VARCHAR(255) NOT NULL,
+            sub VARCHAR(255) NOT NULL,
+            user_id BIGINT UNSIGNED NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY  (id),
+            UNIQUE KEY issuer_sub (issuer, sub),
+            KEY user_id (user_id)
+        ) $charset;",
+
+        "identity_roles" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_identity_roles (
+            identity_id BIGINT UNSIGNED NOT NULL,
+            blog_id BIGINT UNSIGNED NOT NULL,
+            role VARCHAR(64) NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY  (identity_id, blog_id)
+        ) $charset;",
+
+        "launch_context" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_launch_context (
+            blog_id BIGINT UNSIGNED NOT NULL,
+            post_id BIGINT UNSIGNED NOT NULL,
+            user_id BIGINT UNSIGNED NOT NULL,
+            platform_issuer VARCHAR(255) NOT NULL DEFAULT '',
+            lineitem_url TEXT NOT NULL,
+            scopes TEXT,
+            resource_link_id VARCHAR(255) NOT NULL DEFAULT '',
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY  (blog_id, post_id, user_id),
+            KEY user_id (user_id)
+        ) $charset;",
+
+        "url_resolution" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_url_resolution (
+            url_hash CHAR(32) NOT NULL,
+            url TEXT NOT NULL,
+            blog_id BIGINT UNSIGNED NOT NULL,
+            post_id BIGINT UNSIGNED NOT NULL,
+            created_at DATETIME NOT NULL,
+            PRIMARY KEY  (url_hash),
+            KEY blog_post (blog_id, post_id)
+        ) $charset;",
+
+        "book_catalog" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_book_catalog (
+            blog_id BIGINT UNSIGNED NOT NULL,
+            title VARCHAR(255) NOT NULL DEFAULT '',
+            url VARCHAR(255) NOT NULL DEFAULT '',
+            path VARCHAR(255) NOT NULL DEFAULT '',
+            description TEXT,
+            registered DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            PRIMARY KEY  (blog_id),
+            KEY registered (registered),
+            KEY title (title(191))
+        ) $charset;",
+
+        "h5p_index" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_h5p_index (
+            blog_id BIGINT UNSIGNED NOT NULL,
+            h5p_id BIGINT UNSIGNED NOT NULL,
+            post_id BIGINT UNSIGNED NOT NULL,
+            PRIMARY KEY  (blog_id, h5p_id, post_id),
+            KEY blog_post (blog_id, post_id)
         ) $charset;",
 
         "audit" => "
-        CREATE TABLE {$wpdb->prefix}lti_audit (
+        CREATE TABLE {$wpdb->base_prefix}lti_audit (
             id BIGINT UNSIGNED AUTO_INCREMENT,
             event VARCHAR(255) NOT NULL,
             context TEXT,
             created_at DATETIME NOT NULL,
-            PRIMARY KEY  (id)
+            PRIMARY KEY  (id),
+            KEY event_created (event(191), created_at),
+            KEY created_at (created_at)
+        ) $charset;",
+
+        "audit_daily" => "
+        CREATE TABLE {$wpdb->base_prefix}lti_audit_daily (
+            day DATE NOT NULL,
+            event VARCHAR(191) NOT NULL,
+            count BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            PRIMARY KEY  (day, event)
         ) $charset;"
     ];
 }
@@ -10,6 +10,7 @@ defined('ABSPATH') || exit;
 
 // Extract data passed from controller
 $books = $data['books'] ?? [];
+$books_total = $data['books_total'] ?? count($books);
 $deep_link_return_url = $data['return_url'] ?? '';
 $client_id = $data['client_id'] ?? '';
 $deployment_id = $data['deployment_id'] ?? '';
@@ -68,6 +69,32 @@ $deployment_id = $data['deployment_id'] ?? '';
             margin-bottom: 20px;
         }
 
+        .book-search {
+            display: flex;
+            gap: 10px;
+            align-items: center;
+            margin-bottom: 20px;
+        }
+
+        .book-search input {
+            flex: 1;
+            padding: 10px 12px;
+            border: 1px solid #ddd;
+            border-radius: 4px;
+            font-size: 14px;
+        }
+
+        .book-count {
+            color: #64748b;
+            font-size: 14px;
+            white-space: nowrap;
+        }
+
+        .load-more {
+            text-align: center;
+            margin-bottom: 20px;
+        }
+
         .book-card {
             border: 2px solid #ddd;
             border-radius: 6px;
@@ -451,6 +478,13 @@ $deployment_id = $data['deployment_id'] ?? '';
         </div>
 
         <div class="content">
+            <?php if (!empty($books)): ?>
+                <div class="book-search">
+                    <input type="search" id="book-search" placeholder="Search books by title or path..." autocomplete="off">
+                    <span class="book-count" id="book-count"><?php echo esc_html(sprintf('%d of %d books', count($books), $books_total)); ?></span>
+                </div>
+            <?php endif; ?>
+
             <div class="tabs">
                 <button class="tab-btn active" onclick="switchTab('content-picker')">📖 Content Picker</button>
                 <button class="tab-btn" onclick="switchTab('results-viewer-picker')">📊 Results Viewers</button>
@@ -471,7 +505,7 @@ $deployment_id = $data['deployment_id'] ?? '';
                 <?php else: ?>
                     <div class="book-list" id="book-list-content">
                         <?php foreach ($books as $book): ?>
-                            <div class="book-card" data-book-id="<?php echo esc_attr($book['id']); ?>" data-book-title="<?php echo esc_attr($book['title']); ?>">
+                            <div class="book-card" data-book-id="<?php echo esc_attr($book['id']); ?>" data-book-title="<?php echo esc_attr($book['title']); ?>" data-book-url="<?php echo esc_attr($book['url']); ?>">
                                 <div class="book-title"><?php echo esc_html($book['title']); ?></div>
                                 <?php if (!empty($book['description'])): ?>
                                     <div class="book-description"><?php echo esc_html($book['description']); ?></div>
@@ -488,6 +522,9 @@ $deployment_id = $data['deployment_id'] ?? '';
                             </div>
                         <?php endforeach; ?>
                     </div>
+                    <div class="load-more" id="load-more-content" <?php echo count($books) < $books_total ? '' : 'style="display: none;"'; ?>>
+                        <button class="btn btn-secondary" onclick="loadMoreBooks()">Load more books</button>
+                    </div>
                 <?php endif; ?>
 
                 <div class="actions">
@@ -515,6 +552,9 @@ $deployment_id = $data['deployment_id'] ?? '';
                         </div>
                     <?php endforeach; ?>
                 </div>
+                <div class="load-more" id="load-more-results" <?php echo count($books) < $books_total ? '' : 'style="display: none;"'; ?>>
+                    <button class="btn btn-secondary" onclick="loadMoreBooks()">Load more books</button>
+                </div>
                 
                 <div class="actions">
                     <button class="btn btn-secondary" onclick="window.history.back()">Cancel</button>
@@ -579,17 +619,123 @@ $deployment_id = $data['deployment_id'] ?? '';
             document.getElementById(tabId).classList.add('active');
         }
 
-        // Handle book card clicks in content picker tab
-        document.querySelectorAll('#book-list-content .book-card').forEach(card => {
-            card.addEventListener('click', function(e) {
-                // Don't trigger if clicking the expand button
-                if (e.target.classList.contains('expand-btn')) {
+        // Handle book card clicks in content picker tab (delegated so loaded pages work too)
+        const contentList = document.getElementById('book-list-content');
+        if (contentList) {
+            contentList.addEventListener('click', function(e) {
+                const card = e.target.closest('.book-card');
+                // Don't trigger if clicking the expand button or inside the chapter list
+                if (!card || e.target.classList.contains('expand-btn') || e.target.closest('.chapter-list')) {
                     return;
                 }
 
-                selectBook(this);
+                selectBook(card);
+            });
+        }
+
+        // Book catalog paging and search
+        const bookCatalog = {
+            search: '',
+            page: 1,
+            shown: <?php echo (int)count($books); ?>,
+            total: <?php echo (int)$books_total; ?>,
+            request: 0
+        };
+
+        function fetchBooks(search, page) {
+            const requestId = ++bookCatalog.request;
+            return fetch('<?php echo esc_url(admin_url('admin-ajax.php')); ?>', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/x-www-form-urlencoded',
+                },
+                body: 'action=pb_lti_search_books&search=' + encodeURIComponent(search) + '&page=' + page
+            })
+            .then(response => response.json())
+            .then(data => {
+                // Ignore responses to superseded searches
+                if (requestId !== bookCatalog.request || !data.success) {
+                    return null;
+                }
+                return data.data;
+            });
+        }
+
+        function renderBooks(result, append) {
+            const contentList = document.getElementById('book-list-content');
+            const resultsList = document.getElementById('book-list-results');
+            let contentHtml = '';
+            let resultsHtml = '';
+
+            result.books.forEach(book => {
+                contentHtml += `<div class="book-card" data-book-id="${book.id}" data-book-title="${escapeAttr(book.title)}" data-book-url="${escapeAttr(book.url)}">
+                    <div class="book-title">${escapeAttr(book.title)}</div>
+                    ${book.description ? `<div class="book-description">${escapeAttr(book.description)}</div>` : ''}
+                    <div class="book-url">${escapeAttr(book.url)}</div>
+                    <div style="margin-top: 15px;">
+                        <button class="expand-btn" onclick="loadChapters(${book.id}, event)">
+                            📚 View Chapters
+                        </button>
+                    </div>
+                    <div class="chapter-list" id="chapters-${book.id}">
+                        <div class="loading">Loading chapters...</div>
+                    </div>
+                </div>`;
+                resultsHtml += `<div class="book-card" style="display: flex; justify-content: space-between; align-items: center;" onclick="submitResultsViewer(${book.id}, '', event)">
+                    <div>
+                        <div class="book-title" style="margin-bottom: 0;">${escapeAttr(book.title)}</div>
+                        <div class="book-url">${escapeAttr(book.url)}</div>
+                    </div>
+                    <button class="btn btn-primary" style="background: #166534;">
+                        Add Viewer
+                    </button>
+                </div>`;
+            });
+
+            if (!append && !result.books.length) {
+                contentHtml = resultsHtml = '<p style="text-align:center;color:#64748b;">No books match your search</p>';
+            }
+
+            if (append) {
+                contentList.insertAdjacentHTML('beforeend', contentHtml);
+                resultsList.insertAdjacentHTML('beforeend', resultsHtml);
+                bookCatalog.shown += result.books.length;
+            } else {
+                contentList.innerHTML = contentHtml;
+                resultsList.innerHTML = resultsHtml;
+                bookCatalog.shown = result.books.length;
+            }
+
+            bookCatalog.page = result.page;
+            bookCatalog.total = result.total;
+            document.getElementById('book-count').textContent = `${bookCatalog.shown} of ${bookCatalog.total} books`;
+            ['load-more-content', 'load-more-results'].forEach(id => {
+                document.getElementById(id).style.display = result.has_more ? '' : 'none';
             });
-        });
+        }
+
+        function loadMoreBooks() {
+            fetchBooks(bookCatalog.search, bookCatalog.page + 1)
+                .then(result => result && renderBooks(result, true))
+                .catch(() => alert('Failed to load more books'));
+        }
+
+        const bookSearch = document.getElementById('book-search');
+        if (bookSearch) {
+            let searchTimer = null;
+            bookSearch.addEventListener('input', function() {
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(() => {
+                    bookCatalog.search = bookSearch.value.trim();
+                    selectedBook = null;
+                    selectedContent = null;
+                    updateSelection();
+                    fetchBooks(bookCatalog.search, 1)
+                        .then(result => result && renderBooks(result, false))
+                        .catch(() => alert('Failed to search books'));
+                }, 300);
+            });
+        }
 
         function selectBook(card) {
             // Clear previous selections
@@ -634,25 +780,47 @@ $deployment_id = $data['deployment_id'] ?? '';
 
             chapterList.classList.add('visible');
 
-            // Fetch chapters via AJAX (use full URL for Bedrock compatibility)
-            fetch('<?php echo esc_url(admin_url('admin-ajax.php')); ?>', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                },
-                body: 'action=pb_lti_get_book_structure&book_id=' + bookId
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    renderChapters(bookId, data.data);
-                } else {
+            if (chapterList.dataset.loaded) {
+                return;
+            }
+
+            getBookStructure(bookId)
+                .then(structure => {
+                    renderChapters(bookId, structure);
+                    chapterList.dataset.loaded = '1';
+                })
+                .catch(() => {
                     chapterList.innerHTML = '<p>Error loading chapters</p>';
-                }
-            })
-            .catch(error => {
-                chapterList.innerHTML = '<p>Error loading chapters</p>';
-            });
+                });
+        }
+
+        // Book structures fetched so far (bookId => Promise), so each book is requested
+        // at most once per page and several books can load concurrently
+        const bookStructures = {};
+
+        function getBookStructure(bookId) {
+            if (!bookStructures[bookId]) {
+                // Fetch chapters via AJAX (use full URL for Bedrock compatibility)
+                bookStructures[bookId] = fetch('<?php echo esc_url(admin_url('admin-ajax.php')); ?>', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/x-www-form-urlencoded',
+                    },
+                    body: 'action=pb_lti_get_book_structure&book_id=' + bookId
+                })
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success) {
+                        throw new Error((data.data && data.data.message) || 'Unknown error');
+                    }
+                    return data.data;
+                })
+                .catch(error => {
+                    delete bookStructures[bookId];  // Allow a retry
+                    throw error;
+                });
+            }
+            return bookStructures[bookId];
         }
 
         function renderChapters(bookId, structure) {
@@ -778,27 +946,16 @@ $deployment_id = $data['deployment_id'] ?? '';
         }
 
         function showChapterSelectionModal(bookId) {
-            // Fetch book structure
-            fetch('<?php echo esc_url(admin_url('admin-ajax.php')); ?>', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                },
-                body: `action=pb_lti_get_book_structure&book_id=${bookId}`
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    populateChapterCheckboxes(data.data);
+            // Reuses the structure if the book was already expanded
+            getBookStructure(bookId)
+                .then(structure => {
+                    populateChapterCheckboxes(structure);
                     document.getElementById('chapter-modal').classList.add('active');
-                } else {
-                    alert('Failed to load chapters: ' + (data.data || 'Unknown error'));
-                }
-            })
-            .catch(error => {
-                console.error('Error:', error);
-                alert('Failed to load chapters');
-            });
+                })
+                .catch(error => {
+                    console.error('Error:', error);
+                    alert('Failed to load chapters: ' + error.message);
+                });
         }
 
         function populateChapterCheckboxes(structure) {
@@ -903,6 +1060,12 @@ $deployment_id = $data['deployment_id'] ?? '';
             document.getElementById('selection-form').submit();
         }
 
+        function escapeAttr(text) {
+            const div = document.createElement('div');
+            div.textContent = text || '';
+            return div.innerHTML.replace(/"/g, '&quot;');
+        }
+
         function escapeHtml(text) {
             const div = document.createElement('div');
             div.textContent = text;
@@ -0,0 +1,356 @@
+"""
+Headless LTI launch client and concurrent load generator
+
+Drives the tool's launch path over raw HTTP, one cookie jar per simulated
+student, instead of through a browser:
+
+    login     POST /wp-json/pb-lti/v1/login (third-party initiated login) -> 302 to the platform
+    authorize GET the platform's auth URL -> form_post id_token + state
+    launch    POST id_token/state to /wp-json/pb-lti/v1/launch -> 302 to the chapter (?lti_launch=1)
+    chapter   GET the chapter as the logged-in student
+    h5p_save  POST an H5P result to the chapter's setFinished URL (triggers grade sync)
+
+Concurrency is ramped in stages; each stage reports p50/p95/p99 latency and
+error rates per step plus completed launches per second, and the run stops
+early once a stage goes over the error or latency budget.
+
+The platform is the mock in mock_platform.py, started in-process unless
+--platform-url points at one running elsewhere.
+
+Usage:
+    python launch_load.py --tool-url https://pb.local \\
+        --target https://pb.local/book/chapter/chapter-1/ --ramp 10,50,200,1000 --stage-seconds 30
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import ssl
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, CookieJar, TCPConnector
+
+from mock_platform import MockPlatform, login_initiation_params
+from stats import LatencyRecorder, format_summary
+
+STEPS = ('login', 'authorize', 'launch', 'chapter', 'h5p_save')
+
+
+class StepFailed(Exception):
+    """A step returned something other than what the flow expects"""
+
+    def __init__(self, label):
+        super().__init__(label)
+        self.label = label
+
+
+class FormParser(HTMLParser):
+    """Collects the first form's action and input values"""
+
+    def __init__(self):
+        super().__init__()
+        self.action = None
+        self.fields = {}
+        self._in_form = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form' and self.action is None:
+            self.action = attrs.get('action', '')
+            self._in_form = True
+        elif tag == 'input' and self._in_form and attrs.get('name'):
+            self.fields[attrs['name']] = attrs.get('value', '')
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self._in_form = False
+
+
+def parse_form(html):
+    parser = FormParser()
+    parser.feed(html)
+    return parser.action, parser.fields
+
+
+def parse_h5p_integration(html):
+    """setFinished URL and content IDs from the page's H5PIntegration settings"""
+    match = re.search(r'H5PIntegration\s*=\s*', html)
+    if not match:
+        return None, []
+    try:
+        settings, _ = json.JSONDecoder().raw_decode(html, match.end())
+    except ValueError:
+        return None, []
+
+    url = (settings.get('ajax') or {}).get('setFinished')
+    content_ids = [key[4:] for key in (settings.get('contents') or {}) if key.startswith('cid-')]
+    return url, content_ids
+
+
+class LaunchClient:
+    """Runs one simulated student's launch flow and records each step"""
+
+    def __init__(self, tool_url, platform, connector, recorder, timeout=30, save_h5p=True, max_score=10, rng=None):
+        self.login_url = tool_url.rstrip('/') + '/wp-json/pb-lti/v1/login'
+        self.platform = platform
+        self.connector = connector
+        self.recorder = recorder
+        self.timeout = ClientTimeout(total=timeout)
+        self.save_h5p = save_h5p
+        self.max_score = max_score
+        self.rng = rng or random.Random()
+
+    async def run(self, user_id, target, lineitem_id=None, role='student'):
+        """Full flow for one student in a fresh cookie jar; returns True if every step succeeded"""
+        params = login_initiation_params(
+            self.platform['issuer'], self.platform['client_id'], self.platform['deployment_id'],
+            target, user_id, role=role, lineitem_id=lineitem_id
+        )
+
+        started = time.perf_counter()
+        async with ClientSession(connector=self.connector, connector_owner=False, timeout=self.timeout,
+                                 cookie_jar=CookieJar(unsafe=True)) as session:
+            try:
+                auth_url = await self._step('login', self._login(session, params))
+                action, fields = await self._step('authorize', self._authorize(session, auth_url))
+                chapter_url = await self._step('launch', self._launch(session, action, fields))
+                page = await self._step('chapter', self._chapter(session, chapter_url))
+                if self.save_h5p:
+                    await self._step('h5p_save', self._save_h5p(session, chapter_url, page))
+            except StepFailed:
+                self.recorder.record('total', time.perf_counter() - started, 'failed')
+                return False
+
+        self.recorder.record('total', time.perf_counter() - started)
+        return True
+
+    async def _step(self, name, coro):
+        started = time.perf_counter()
+        try:
+            result = await coro
+        except StepFailed as e:
+            self.recorder.record(name, time.perf_counter() - started, e.label)
+            raise
+        except (ClientError, asyncio.TimeoutError) as e:
+            self.recorder.record(name, time.perf_counter() - started, type(e).__name__)
+            raise StepFailed(type(e).__name__)
+        self.recorder.record(name, time.perf_counter() - started)
+        return result
+
+    async def _login(self, session, params):
+        async with session.post(self.login_url, data=params, allow_redirects=False) as response:
+            await response.read()
+            location = response.headers.get('Location', '')
+            if response.status not in (301, 302, 303) or not location:
+                raise StepFailed(str(response.status))
+            if not location.startswith(self.platform['auth_login_url']):
+                raise StepFailed('bad_redirect')
+            return location
+
+    async def _authorize(self, session, auth_url):
+        async with session.get(auth_url, allow_redirects=False) as response:
+            html = await response.text()
+            if response.status != 200:
+                raise StepFailed(str(response.status))
+        action, fields = parse_form(html)
+        if not action or 'id_token' not in fields:
+            raise StepFailed('no_form')
+        return urljoin(auth_url, action), fields
+
+    async def _launch(self, session, action, fields):
+        async with session.post(action, data=fields, allow_redirects=False) as response:
+            await response.read()
+            location = response.headers.get('Location', '')
+            if response.status not in (301, 302, 303) or not location:
+                raise StepFailed(str(response.status))
+            if 'lti_launch=1' not in location:
+                raise StepFailed('bad_redirect')
+            return urljoin(action, location)
+
+    async def _chapter(self, session, chapter_url):
+        async with session.get(chapter_url) as response:
+            html = await response.text()
+            if response.status != 200:
+                raise StepFailed(str(response.status))
+        return html
+
+    async def _save_h5p(self, session, chapter_url, page):
+        url, content_ids = parse_h5p_integration(page)
+        if not url or not content_ids:
+            raise StepFailed('no_h5p')
+
+        opened = int(time.time()) - self.rng.randint(30, 600)
+        async with session.post(urljoin(chapter_url, url), data={
+            'contentId': content_ids[0],
+            'score': self.rng.randint(0, self.max_score),
+            'maxScore': self.max_score,
+            'opened': opened,
+            'finished': int(time.time()),
+        }) as response:
+            body = await response.text()
+            if response.status != 200:
+                raise StepFailed(str(response.status))
+        try:
+            if not json.loads(body).get('success'):
+                raise StepFailed('h5p_rejected')
+        except (ValueError, AttributeError):
+            raise StepFailed('h5p_bad_response')
+
+
+async def run_stage(client, concurrency, seconds, users, targets, user_ids):
+    """Keep `concurrency` students launching for `seconds`; returns completed and failed flow counts"""
+    deadline = time.monotonic() + seconds
+    counts = {'ok': 0, 'failed': 0}
+
+    async def worker():
+        while time.monotonic() < deadline:
+            n = next(users)
+            target, lineitem_id = targets[n % len(targets)]
+            ok = await client.run(user_ids[n % len(user_ids)], target, lineitem_id)
+            counts['ok' if ok else 'failed'] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return counts
+
+
+async def run_load(args):
+    platform_runner = None
+    if args.platform_url:
+        platform = {
+            'issuer': args.platform_url.rstrip('/'),
+            'client_id': args.client_id,
+            'deployment_id': args.deployment_id,
+        }
+    else:
+        mock = MockPlatform(
+            args.platform_issuer or f"http://{args.platform_host}:{args.platform_port}",
+            client_id=args.client_id,
+            deployment_id=args.deployment_id,
+            key_file=args.key_file,
+            seed=args.seed,
+        )
+        platform_runner = await mock.start(args.platform_host, args.platform_port)
+        platform = {'issuer': mock.issuer, 'client_id': mock.client_id, 'deployment_id': mock.deployment_id}
+    platform['auth_login_url'] = platform['issuer'] + '/mod/lti/auth.php'
+
+    # One lineitem per target so every launch carries an AGS claim
+    targets = [(url, index + 1 if args.ags else None) for index, url in enumerate(args.target)]
+    user_ids = [args.user_offset + i for i in range(args.user_pool)]
+    users = itertools.count()
+
+    ssl_context = False if args.insecure else ssl.create_default_context()
+    connector = TCPConnector(limit=args.connection_limit, ssl=ssl_context)
+
+    results = {
+        'tool_url': args.tool_url,
+        'issuer': platform['issuer'],
+        'targets': args.target,
+        'stages': [],
+    }
+
+    try:
+        for concurrency in args.ramp:
+            recorder = LatencyRecorder()
+            client = LaunchClient(
+                args.tool_url, platform, connector, recorder,
+                timeout=args.timeout, save_h5p=not args.skip_h5p,
+                rng=random.Random(args.seed)
+            )
+
+            started = time.monotonic()
+            counts = await run_stage(client, concurrency, args.stage_seconds, users, targets, user_ids)
+            elapsed = time.monotonic() - started
+
+            flows = counts['ok'] + counts['failed']
+            summary = recorder.summary()
+            stage = {
+                'concurrency': concurrency,
+                'seconds': round(elapsed, 2),
+                'flows': flows,
+                'completed': counts['ok'],
+                'launches_per_second': round(counts['ok'] / elapsed, 2) if elapsed else 0,
+                'error_rate': round(counts['failed'] / flows, 4) if flows else 0,
+                'steps': summary,
+            }
+            results['stages'].append(stage)
+
+            print(f"\n=== {concurrency} concurrent students: {stage['completed']}/{flows} flows ok, "
+                  f"{stage['launches_per_second']} launches/s, {stage['error_rate'] * 100:.2f}% failed ===")
+            print(format_summary(summary))
+
+            over = over_budget(stage, args)
+            if over:
+                stage['stopped'] = over
+                print(f"Stopping ramp: {over}")
+                break
+    finally:
+        await connector.close()
+        if platform_runner:
+            await platform_runner.cleanup()
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    return results
+
+
+def over_budget(stage, args):
+    """Reason the ramp should stop after this stage, or None"""
+    if stage['error_rate'] > args.max_error_rate:
+        return f"error rate {stage['error_rate'] * 100:.2f}% over {args.max_error_rate * 100:.2f}%"
+    launch = stage['steps'].get('launch')
+    if args.max_launch_p95_ms and launch and launch['p95_ms'] > args.max_launch_p95_ms:
+        return f"launch p95 {launch['p95_ms']} ms over {args.max_launch_p95_ms} ms"
+    return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent LTI launch load generator')
+    parser.add_argument('--tool-url', default=os.getenv('PRESSBOOKS_URL', 'https://pb.lti.qbnox.com'),
+                        help='Pressbooks network URL')
+    parser.add_argument('--target', action='append', required=True,
+                        help='Chapter URL to launch into (repeatable; launches round-robin)')
+    parser.add_argument('--ramp', type=lambda value: [int(n) for n in value.split(',')], default=[10, 50, 100],
+                        help='Concurrency per stage, e.g. 10,100,1000')
+    parser.add_argument('--stage-seconds', type=float, default=30)
+    parser.add_argument('--user-pool', type=int, default=1000,
+                        help='Distinct LTI users to cycle through (WordPress accounts are created on first launch)')
+    parser.add_argument('--user-offset', type=int, default=100000, help='First LTI user ID')
+    parser.add_argument('--no-ags', dest='ags', action='store_false', help='Launch without an AGS lineitem claim')
+    parser.add_argument('--skip-h5p', action='store_true', help='Stop after the chapter load')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-flow HTTP timeout in seconds')
+    parser.add_argument('--connection-limit', type=int, default=0, help='Max open connections (0 = unlimited)')
+    parser.add_argument('--insecure', action='store_true', help='Skip TLS verification (self-signed lab certs)')
+    parser.add_argument('--max-error-rate', type=float, default=0.05, help='Stop the ramp above this failure fraction')
+    parser.add_argument('--max-launch-p95-ms', type=float, default=None, help='Stop the ramp above this launch p95')
+    parser.add_argument('--output', help='Write per-stage results as JSON')
+    parser.add_argument('--seed', type=int, default=None)
+
+    platform = parser.add_argument_group('platform')
+    platform.add_argument('--platform-url', help='Use a mock platform already running at this issuer URL')
+    platform.add_argument('--platform-host', default='127.0.0.1')
+    platform.add_argument('--platform-port', type=int, default=8765)
+    platform.add_argument('--platform-issuer', help='Public issuer URL of the in-process mock')
+    platform.add_argument('--client-id', default=os.getenv('MOCK_LMS_CLIENT_ID', 'pb-lti-mock'))
+    platform.add_argument('--deployment-id', default=os.getenv('MOCK_LMS_DEPLOYMENT_ID', '1'))
+    platform.add_argument('--key-file', default=os.getenv('MOCK_LMS_KEY_FILE'))
+
+    args = parser.parse_args(argv)
+    for url in args.target:
+        if not urlparse(url).scheme:
+            parser.error(f"--target must be an absolute URL: {url}")
+    return args
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(run_load(parse_args()))
+    except KeyboardInterrupt:
+        pass
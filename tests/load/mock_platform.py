@@ -0,0 +1,546 @@
+"""
+Mock LTI 1.3 platform for offline load testing
+
+Stands in for Moodle so the tool side of the integration (/pb-lti/v1/login,
+/launch and AGS grade passback) can be benchmarked without a live LMS. It
+signs id_tokens with its own RSA key and serves the endpoints Pressbooks
+calls back into, on the same paths Moodle uses so the platform can be
+registered with scripts/pressbooks-register-platform.php:
+
+    /mod/lti/auth.php       OIDC authorization (answers with a form_post launch)
+    /mod/lti/certs.php      JWKS
+    /mod/lti/token.php      OAuth2 client-credentials token (RFC 7523 client assertion)
+    /mod/lti/services.php/<context>/lineitems/<id>/lineitem          AGS lineitem GET
+    /mod/lti/services.php/<context>/lineitems/<id>/lineitem/scores   AGS score POST
+
+Every response is timed per endpoint, and each endpoint can be given a
+fixed delay, random jitter and an error rate (seeded, so runs repeat).
+Stats, received scores and faults are exposed under /_mock/.
+
+Usage:
+    python mock_platform.py --port 8765 --fault token=delay=0.2 --fault scores=error_rate=0.05,status=503
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import secrets
+import time
+from dataclasses import asdict, dataclass
+from html import escape
+
+import jwt
+from aiohttp import ClientSession, ClientTimeout, web
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from stats import LatencyRecorder, format_summary
+
+LTI_CLAIM = 'https://purl.imsglobal.org/spec/lti/claim/'
+AGS_CLAIM = 'https://purl.imsglobal.org/spec/lti-ags/claim/endpoint'
+
+SCOPE_LINEITEM = 'https://purl.imsglobal.org/spec/lti-ags/scope/lineitem'
+SCOPE_LINEITEM_READONLY = 'https://purl.imsglobal.org/spec/lti-ags/scope/lineitem.readonly'
+SCOPE_SCORE = 'https://purl.imsglobal.org/spec/lti-ags/scope/score'
+SCOPE_RESULT_READONLY = 'https://purl.imsglobal.org/spec/lti-ags/scope/result.readonly'
+AGS_SCOPES = [SCOPE_LINEITEM, SCOPE_LINEITEM_READONLY, SCOPE_SCORE, SCOPE_RESULT_READONLY]
+
+ROLES = {
+    'student': ['http://purl.imsglobal.org/vocab/lis/v2/membership#Learner'],
+    'instructor': ['http://purl.imsglobal.org/vocab/lis/v2/membership#Instructor'],
+    'admin': [
+        'http://purl.imsglobal.org/vocab/lis/v2/institution/person#Administrator',
+        'http://purl.imsglobal.org/vocab/lis/v2/membership#Instructor',
+    ],
+}
+
+ENDPOINTS = ('auth', 'jwks', 'token', 'lineitem', 'scores')
+
+
+@dataclass
+class Fault:
+    """Injected behaviour for one endpoint"""
+    delay: float = 0.0       # Seconds added to every response
+    jitter: float = 0.0      # Extra uniform random delay, up to this many seconds
+    error_rate: float = 0.0  # Fraction of requests answered with `status` instead
+    status: int = 503
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse 'delay=0.2,jitter=0.1,error_rate=0.05,status=500'"""
+        fault = cls()
+        for part in filter(None, spec.split(',')):
+            name, _, value = part.partition('=')
+            name = name.strip()
+            if name not in cls.__dataclass_fields__:
+                raise ValueError(f"Unknown fault setting '{name}'")
+            setattr(fault, name, int(value) if name == 'status' else float(value))
+        return fault
+
+
+def b64url_json(data):
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).rstrip(b'=').decode()
+
+
+def b64url_json_decode(value):
+    return json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+
+
+def login_initiation_params(issuer, client_id, deployment_id, target_link_uri, user_id, role='student',
+                            context_id='1', resource_link_id=None, lineitem_id=None):
+    """
+    Parameters for a tool's OIDC login initiation (third-party initiated login)
+
+    The launch details travel in lti_message_hint and come back to
+    /mod/lti/auth.php, which turns them into the id_token. Lineitems are
+    created on first use, so this works against a mock running elsewhere.
+    """
+    resource_link_id = resource_link_id or f"rl-{context_id}-{lineitem_id or 0}"
+    hint = {'target': target_link_uri, 'role': role, 'context': str(context_id), 'rl': resource_link_id}
+    if lineitem_id is not None:
+        hint['li'] = str(lineitem_id)
+
+    return {
+        'iss': issuer,
+        'login_hint': str(user_id),
+        'target_link_uri': target_link_uri,
+        'lti_message_hint': b64url_json(hint),
+        'client_id': client_id,
+        'lti_deployment_id': deployment_id,
+    }
+
+
+class MockPlatform:
+    """In-process LTI 1.3 platform with AGS, latency recording and fault injection"""
+
+    def __init__(self, issuer, client_id='pb-lti-mock', deployment_id='1', tool_jwks_url=None,
+                 key_file=None, token_ttl=3600, jwks_max_age=3600, score_maximum=100, seed=None):
+        self.issuer = issuer.rstrip('/')
+        self.client_id = client_id
+        self.deployment_id = deployment_id
+        self.tool_jwks_url = tool_jwks_url
+        self.token_ttl = token_ttl
+        self.jwks_max_age = jwks_max_age
+        self.score_maximum = score_maximum
+
+        self.private_key = self._load_key(key_file)
+        self.public_jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        # Derived from the key so a persisted key keeps its kid (and the tool's JWKS cache stays warm)
+        self.kid = 'mock-' + hashlib.sha256(self.public_jwk['n'].encode()).hexdigest()[:16]
+        self.public_jwk.update({'kid': self.kid, 'alg': 'RS256', 'use': 'sig'})
+
+        self.random = random.Random(seed)
+        self.faults = {}
+        self.recorder = LatencyRecorder()
+        self.tokens = {}      # access_token => (expires_at, scopes)
+        self.lineitems = {}   # (context_id, lineitem_id) => lineitem
+        self.scores = []      # Received scores, newest last
+        self._tool_keys = None
+
+    @property
+    def auth_login_url(self):
+        return self.issuer + '/mod/lti/auth.php'
+
+    @property
+    def key_set_url(self):
+        return self.issuer + '/mod/lti/certs.php'
+
+    @property
+    def token_url(self):
+        return self.issuer + '/mod/lti/token.php'
+
+    def lineitem_url(self, context_id, lineitem_id):
+        return f"{self.issuer}/mod/lti/services.php/{context_id}/lineitems/{lineitem_id}/lineitem?type_id=1"
+
+    def set_fault(self, endpoint, fault):
+        """Inject delay/errors into one endpoint (None clears it)"""
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{endpoint}' (expected one of {', '.join(ENDPOINTS)})")
+        if fault is None:
+            self.faults.pop(endpoint, None)
+        else:
+            self.faults[endpoint] = fault
+
+    def reset(self):
+        """Forget stats, scores and issued tokens (faults and lineitems stay)"""
+        self.recorder.reset()
+        self.scores.clear()
+        self.tokens.clear()
+
+    # ------------------------------------------------------------------
+    # Launch helpers
+    # ------------------------------------------------------------------
+
+    def login_initiation(self, target_link_uri, user_id, role='student', context_id='1',
+                         resource_link_id=None, lineitem_id=None):
+        """Parameters for the tool's OIDC login initiation (see login_initiation_params)"""
+        params = login_initiation_params(
+            self.issuer, self.client_id, self.deployment_id, target_link_uri, user_id,
+            role=role, context_id=context_id, resource_link_id=resource_link_id, lineitem_id=lineitem_id
+        )
+        if lineitem_id is not None:
+            hint = b64url_json_decode(params['lti_message_hint'])
+            self.ensure_lineitem(context_id, lineitem_id, hint['rl'])
+        return params
+
+    def id_token(self, nonce, user_id, target_link_uri, role='student', context_id='1',
+                 resource_link_id='rl-1', lineitem_id=None, lifetime=300):
+        """Signed LtiResourceLinkRequest id_token"""
+        now = int(time.time())
+        user_id = str(user_id)
+        claims = {
+            'iss': self.issuer,
+            'aud': self.client_id,
+            'azp': self.client_id,
+            'sub': user_id,
+            'nonce': nonce,
+            'iat': now,
+            'exp': now + lifetime,
+            'given_name': 'Load',
+            'family_name': f"{role.title()} {user_id}",
+            'name': f"Load {role.title()} {user_id}",
+            'email': f"{role}{user_id}@mock-lms.test",
+            'preferred_username': f"{role}{user_id}",
+            LTI_CLAIM + 'message_type': 'LtiResourceLinkRequest',
+            LTI_CLAIM + 'version': '1.3.0',
+            LTI_CLAIM + 'deployment_id': self.deployment_id,
+            LTI_CLAIM + 'target_link_uri': target_link_uri,
+            LTI_CLAIM + 'roles': ROLES.get(role, ROLES['student']),
+            LTI_CLAIM + 'resource_link': {'id': resource_link_id, 'title': f"Resource {resource_link_id}"},
+            LTI_CLAIM + 'context': {
+                'id': str(context_id),
+                'label': f"MOCK{context_id}",
+                'title': f"Mock course {context_id}",
+                'type': ['http://purl.imsglobal.org/vocab/lis/v2/course#CourseOffering'],
+            },
+        }
+
+        if lineitem_id is not None:
+            claims[AGS_CLAIM] = {
+                'scope': [SCOPE_LINEITEM, SCOPE_LINEITEM_READONLY, SCOPE_SCORE],
+                'lineitems': f"{self.issuer}/mod/lti/services.php/{context_id}/lineitems?type_id=1",
+                'lineitem': self.lineitem_url(context_id, lineitem_id),
+            }
+
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': self.kid})
+
+    def ensure_lineitem(self, context_id, lineitem_id, resource_link_id=''):
+        key = (str(context_id), str(lineitem_id))
+        if key not in self.lineitems:
+            self.lineitems[key] = {
+                'id': self.lineitem_url(context_id, lineitem_id),
+                'label': f"Mock lineitem {lineitem_id}",
+                'scoreMaximum': self.score_maximum,
+                'resourceLinkId': resource_link_id,
+                'tag': '',
+            }
+        return self.lineitems[key]
+
+    # ------------------------------------------------------------------
+    # HTTP application
+    # ------------------------------------------------------------------
+
+    def app(self):
+        app = web.Application(middlewares=[self._instrument])
+        app.add_routes([
+            web.route('*', '/mod/lti/auth.php', self.handle_auth, name='auth'),
+            web.get('/mod/lti/certs.php', self.handle_jwks, name='jwks'),
+            web.post('/mod/lti/token.php', self.handle_token, name='token'),
+            web.get('/mod/lti/services.php/{context}/lineitems/{item}/lineitem', self.handle_lineitem, name='lineitem'),
+            web.post('/mod/lti/services.php/{context}/lineitems/{item}/lineitem/scores', self.handle_scores, name='scores'),
+            web.get('/_mock/stats', self.handle_stats),
+            web.get('/_mock/scores', self.handle_list_scores),
+            web.post('/_mock/reset', self.handle_reset),
+            web.put('/_mock/faults/{endpoint}', self.handle_set_fault),
+        ])
+        return app
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """Serve in the current event loop; returns the runner (await runner.cleanup() to stop)"""
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+    @web.middleware
+    async def _instrument(self, request, handler):
+        endpoint = request.match_info.route.name
+        if endpoint not in ENDPOINTS:
+            return await handler(request)
+
+        started = time.perf_counter()
+        error = None
+        try:
+            fault = self.faults.get(endpoint)
+            if fault:
+                pause = fault.delay + (self.random.uniform(0, fault.jitter) if fault.jitter else 0)
+                if pause:
+                    await asyncio.sleep(pause)
+                if fault.error_rate and self.random.random() < fault.error_rate:
+                    error = fault.status
+                    return web.json_response({'error': 'injected_fault'}, status=fault.status)
+
+            response = await handler(request)
+            if response.status >= 400:
+                error = response.status
+            return response
+        except web.HTTPException as e:
+            if e.status >= 400:
+                error = e.status
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.recorder.record(endpoint, time.perf_counter() - started, error)
+
+    async def handle_auth(self, request):
+        """OIDC authorization: trust login_hint and answer with a form_post launch"""
+        params = dict(request.query)
+        if request.method == 'POST':
+            params.update(await request.post())
+
+        if params.get('client_id') != self.client_id:
+            return web.Response(status=400, text='Unknown client_id')
+        if params.get('response_type') != 'id_token' or params.get('response_mode') != 'form_post':
+            return web.Response(status=400, text='Unsupported response_type/response_mode')
+        for required in ('redirect_uri', 'login_hint', 'nonce', 'state'):
+            if not params.get(required):
+                return web.Response(status=400, text=f"Missing {required}")
+
+        try:
+            hint = b64url_json_decode(params.get('lti_message_hint', ''))
+        except ValueError:
+            return web.Response(status=400, text='Invalid lti_message_hint')
+
+        id_token = self.id_token(
+            params['nonce'],
+            params['login_hint'],
+            hint.get('target', params['redirect_uri']),
+            role=hint.get('role', 'student'),
+            context_id=hint.get('context', '1'),
+            resource_link_id=hint.get('rl', 'rl-1'),
+            lineitem_id=hint.get('li'),
+        )
+
+        return web.Response(content_type='text/html', text=(
+            '<!DOCTYPE html><html><body onload="document.forms[0].submit()">'
+            f'<form method="post" action="{escape(params["redirect_uri"])}">'
+            f'<input type="hidden" name="id_token" value="{escape(id_token)}">'
+            f'<input type="hidden" name="state" value="{escape(params["state"])}">'
+            '</form></body></html>'
+        ))
+
+    async def handle_jwks(self, request):
+        return web.json_response(
+            {'keys': [self.public_jwk]},
+            headers={'Cache-Control': f"max-age={self.jwks_max_age}"}
+        )
+
+    async def handle_token(self, request):
+        """Client-credentials grant with a JWT client assertion"""
+        form = await request.post()
+
+        if form.get('grant_type') != 'client_credentials':
+            return self._oauth_error('unsupported_grant_type')
+        if form.get('client_assertion_type') != 'urn:ietf:params:oauth:client-assertion-type:jwt-bearer':
+            return self._oauth_error('invalid_request', 'client_assertion_type must be jwt-bearer')
+
+        try:
+            assertion = await self._decode_assertion(form.get('client_assertion', ''))
+        except (jwt.InvalidTokenError, ValueError) as e:
+            return self._oauth_error('invalid_client', str(e), status=401)
+
+        if assertion.get('iss') != self.client_id or assertion.get('sub') != self.client_id:
+            return self._oauth_error('invalid_client', 'iss/sub must be the client_id', status=401)
+        audience = assertion.get('aud')
+        if self.token_url not in (audience if isinstance(audience, list) else [audience]):
+            return self._oauth_error('invalid_client', 'aud must be the token endpoint', status=401)
+
+        requested = form.get('scope', '').split()
+        granted = [scope for scope in requested if scope in AGS_SCOPES] or [SCOPE_SCORE]
+
+        token = secrets.token_urlsafe(24)
+        self.tokens[token] = (time.time() + self.token_ttl, set(granted))
+
+        return web.json_response({
+            'access_token': token,
+            'token_type': 'Bearer',
+            'expires_in': self.token_ttl,
+            'scope': ' '.join(granted),
+        })
+
+    async def handle_lineitem(self, request):
+        denied = self._authorize(request, SCOPE_LINEITEM_READONLY, SCOPE_LINEITEM)
+        if denied:
+            return denied
+
+        lineitem = self.ensure_lineitem(request.match_info['context'], request.match_info['item'])
+        return web.json_response(lineitem, content_type='application/vnd.ims.lis.v2.lineitem+json')
+
+    async def handle_scores(self, request):
+        denied = self._authorize(request, SCOPE_SCORE)
+        if denied:
+            return denied
+
+        try:
+            score = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'Invalid JSON'}, status=400)
+
+        missing = [field for field in ('userId', 'activityProgress', 'gradingProgress', 'timestamp') if field not in score]
+        if missing:
+            return web.json_response({'error': 'Missing ' + ', '.join(missing)}, status=400)
+        if 'scoreGiven' in score:
+            try:
+                in_range = 0 <= float(score['scoreGiven']) <= float(score['scoreMaximum'])
+            except (KeyError, TypeError, ValueError):
+                in_range = False
+            if not in_range:
+                return web.json_response({'error': 'scoreGiven must be within 0..scoreMaximum'}, status=400)
+
+        self.ensure_lineitem(request.match_info['context'], request.match_info['item'])
+        score['lineitem'] = self.lineitem_url(request.match_info['context'], request.match_info['item'])
+        score['received_at'] = time.time()
+        self.scores.append(score)
+
+        return web.Response(status=200)
+
+    async def handle_stats(self, request):
+        return web.json_response({
+            'endpoints': self.recorder.summary(),
+            'scores_received': len(self.scores),
+            'tokens_issued': len(self.tokens),
+            'faults': {name: asdict(fault) for name, fault in self.faults.items()},
+        })
+
+    async def handle_list_scores(self, request):
+        lineitem = request.query.get('lineitem')
+        scores = [s for s in self.scores if lineitem is None or s['lineitem'] == lineitem]
+        return web.json_response({'scores': scores})
+
+    async def handle_reset(self, request):
+        self.reset()
+        return web.json_response({'reset': True})
+
+    async def handle_set_fault(self, request):
+        body = await request.json() if request.can_read_body else {}
+        try:
+            self.set_fault(request.match_info['endpoint'], Fault(**body) if body else None)
+        except (TypeError, ValueError) as e:
+            return web.json_response({'error': str(e)}, status=400)
+        return web.json_response({name: asdict(fault) for name, fault in self.faults.items()})
+
+    # ------------------------------------------------------------------
+
+    def _authorize(self, request, *scopes):
+        header = request.headers.get('Authorization', '')
+        token = header[7:] if header.startswith('Bearer ') else None
+        entry = self.tokens.get(token) if token else None
+        if not entry or entry[0] < time.time():
+            return web.json_response({'error': 'invalid_token'}, status=401)
+        if not entry[1].intersection(scopes):
+            return web.json_response({'error': 'insufficient_scope'}, status=403)
+        return None
+
+    async def _decode_assertion(self, assertion):
+        """Verify against the tool's JWKS when configured; otherwise only parse it"""
+        if not self.tool_jwks_url:
+            return jwt.decode(assertion, options={'verify_signature': False})
+
+        if self._tool_keys is None:
+            async with ClientSession(timeout=ClientTimeout(total=10)) as session:
+                async with session.get(self.tool_jwks_url) as response:
+                    self._tool_keys = jwt.PyJWKSet.from_dict(await response.json(content_type=None))
+
+        kid = jwt.get_unverified_header(assertion).get('kid')
+        keys = [k for k in self._tool_keys.keys if kid is None or k.key_id == kid]
+        if not keys:
+            self._tool_keys = None  # Tool may have rotated; refetch next time
+            raise ValueError(f"Unknown tool key '{kid}'")
+
+        return jwt.decode(assertion, keys[0].key, algorithms=['RS256'], audience=self.token_url)
+
+    @staticmethod
+    def _oauth_error(code, description=None, status=400):
+        body = {'error': code}
+        if description:
+            body['error_description'] = description
+        return web.json_response(body, status=status)
+
+    @staticmethod
+    def _load_key(key_file):
+        if key_file and os.path.exists(key_file):
+            with open(key_file, 'rb') as handle:
+                return serialization.load_pem_private_key(handle.read(), password=None)
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        if key_file:
+            with open(key_file, 'wb') as handle:
+                handle.write(key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption()
+                ))
+        return key
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Mock LTI 1.3 platform for offline load testing')
+    parser.add_argument('--host', default=os.getenv('MOCK_LMS_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_LMS_PORT', '8765')))
+    parser.add_argument('--issuer', default=os.getenv('MOCK_LMS_ISSUER'),
+                        help='Public base URL (default http://<host>:<port>); must match the registered issuer')
+    parser.add_argument('--client-id', default=os.getenv('MOCK_LMS_CLIENT_ID', 'pb-lti-mock'))
+    parser.add_argument('--deployment-id', default=os.getenv('MOCK_LMS_DEPLOYMENT_ID', '1'))
+    parser.add_argument('--tool-jwks-url', default=os.getenv('MOCK_LMS_TOOL_JWKS_URL'),
+                        help='Tool keyset (e.g. https://pb.local/wp-json/pb-lti/v1/keyset) to verify client assertions')
+    parser.add_argument('--key-file', default=os.getenv('MOCK_LMS_KEY_FILE'),
+                        help='PEM private key; created on first run so the kid stays stable')
+    parser.add_argument('--token-ttl', type=int, default=3600)
+    parser.add_argument('--seed', type=int, default=None, help='Seed for jitter and error injection')
+    parser.add_argument('--fault', action='append', default=[], metavar='ENDPOINT=SPEC',
+                        help="e.g. token=delay=0.2 or scores=error_rate=0.05,status=503 (repeatable)")
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    issuer = args.issuer or f"http://{args.host}:{args.port}"
+    platform = MockPlatform(
+        issuer,
+        client_id=args.client_id,
+        deployment_id=args.deployment_id,
+        tool_jwks_url=args.tool_jwks_url,
+        key_file=args.key_file,
+        token_ttl=args.token_ttl,
+        seed=args.seed,
+    )
+    for spec in args.fault:
+        endpoint, _, settings = spec.partition('=')
+        platform.set_fault(endpoint, Fault.parse(settings))
+
+    runner = await platform.start(args.host, args.port)
+
+    print(f"Mock LMS listening on {args.host}:{args.port} as {platform.issuer}")
+    print("Register it in Pressbooks with:")
+    print(f"  php scripts/pressbooks-register-platform.php {platform.issuer} {platform.client_id} {platform.deployment_id}")
+    if platform.faults:
+        print("Faults: " + ', '.join(f"{name} {asdict(fault)}" for name, fault in platform.faults.items()))
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        summary = platform.recorder.summary()
+        if summary:
+            print("\n" + format_summary(summary))
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
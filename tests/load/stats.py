@@ -0,0 +1,72 @@
+"""
+Latency recording shared by the mock platform and the load generator
+"""
+import math
+import threading
+from collections import defaultdict
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class LatencyRecorder:
+    """Collects per-step durations (seconds) and error counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)
+        self._errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, step, seconds, error=None):
+        """Record one sample; error is a short label (status code, exception name) or None"""
+        with self._lock:
+            self._samples[step].append(seconds)
+            if error is not None:
+                self._errors[step][str(error)] += 1
+
+    def reset(self):
+        """Drop all samples"""
+        with self._lock:
+            self._samples.clear()
+            self._errors.clear()
+
+    def summary(self):
+        """Per-step count, error rate and p50/p95/p99/max in milliseconds"""
+        with self._lock:
+            samples = {step: sorted(values) for step, values in self._samples.items()}
+            errors = {step: dict(counts) for step, counts in self._errors.items()}
+
+        result = {}
+        for step, values in samples.items():
+            failed = sum(errors.get(step, {}).values())
+            result[step] = {
+                'count': len(values),
+                'errors': failed,
+                'error_rate': round(failed / len(values), 4),
+                'error_kinds': errors.get(step, {}),
+                'p50_ms': _ms(percentile(values, 50)),
+                'p95_ms': _ms(percentile(values, 95)),
+                'p99_ms': _ms(percentile(values, 99)),
+                'max_ms': _ms(values[-1]),
+            }
+        return result
+
+
+def format_summary(summary):
+    """Render a summary() dict as a fixed-width table"""
+    lines = [f"{'step':<16}{'count':>8}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for step, row in summary.items():
+        lines.append(
+            f"{step:<16}{row['count']:>8}{row['error_rate'] * 100:>7.2f}%"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
@@ -0,0 +1,157 @@
+"""
+Test the launch client and load generator against the mock platform and a minimal fake tool
+"""
+import asyncio
+import secrets
+import socket
+from urllib.parse import urlencode
+
+import jwt
+from aiohttp import ClientSession, web
+
+from launch_load import parse_args, parse_form, parse_h5p_integration, run_load
+from mock_platform import LTI_CLAIM
+
+CHAPTER_HTML = """<html><head><script>
+H5PIntegration = {"ajax": {"setFinished": "\\/wp-admin\\/admin-ajax.php?token=t&action=h5p_setFinished"},
+                  "contents": {"cid-5": {"library": "H5P.MultiChoice 1.16"}}};
+</script></head><body>Chapter</body></html>"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fake_tool(issuer, client_id):
+    """Just enough of /pb-lti/v1/login, /launch and H5P's setFinished to exercise the client"""
+    states = {}
+    saved = []
+    keys = {}
+
+    async def login(request):
+        form = await request.post()
+        state, nonce = secrets.token_hex(8), secrets.token_hex(8)
+        states[state] = nonce
+        query = urlencode({
+            'scope': 'openid', 'response_type': 'id_token', 'response_mode': 'form_post',
+            'client_id': client_id, 'redirect_uri': str(request.url.with_path('/wp-json/pb-lti/v1/launch')),
+            'login_hint': form['login_hint'], 'lti_message_hint': form['lti_message_hint'],
+            'state': state, 'nonce': nonce, 'prompt': 'none',
+        })
+        response = web.HTTPFound(f"{issuer}/mod/lti/auth.php?{query}")
+        response.set_cookie('pb_lti_state_bind', state)
+        raise response
+
+    async def launch(request):
+        form = await request.post()
+        if request.cookies.get('pb_lti_state_bind') != form['state']:
+            return web.Response(status=401, text='State cookie mismatch')
+
+        if 'jwks' not in keys:
+            async with request.app['session'].get(f"{issuer}/mod/lti/certs.php") as response:
+                keys['jwks'] = jwt.PyJWKSet.from_dict(await response.json())
+        claims = jwt.decode(form['id_token'], keys['jwks'].keys[0].key, algorithms=['RS256'], audience=client_id)
+        if claims['nonce'] != states.pop(form['state'], None):
+            return web.Response(status=401, text='Nonce mismatch')
+
+        response = web.HTTPFound(claims[LTI_CLAIM + 'target_link_uri'] + '?lti_launch=1')
+        response.set_cookie('wordpress_logged_in', claims['sub'])
+        raise response
+
+    async def chapter(request):
+        if 'wordpress_logged_in' not in request.cookies:
+            return web.Response(status=403)
+        return web.Response(text=CHAPTER_HTML, content_type='text/html')
+
+    async def set_finished(request):
+        form = await request.post()
+        saved.append((request.cookies.get('wordpress_logged_in'), form['contentId'], form['score']))
+        return web.json_response({'success': True})
+
+    async def on_startup(app):
+        app['session'] = ClientSession()
+
+    async def on_cleanup(app):
+        await app['session'].close()
+
+    app = web.Application()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.add_routes([
+        web.post('/wp-json/pb-lti/v1/login', login),
+        web.post('/wp-json/pb-lti/v1/launch', launch),
+        web.get('/book/chapter/one/', chapter),
+        web.post('/wp-admin/admin-ajax.php', set_finished),
+    ])
+    return app, saved
+
+
+def run_against_fake_tool(extra_args):
+    platform_port, tool_port = free_port(), free_port()
+    issuer = f"http://127.0.0.1:{platform_port}"
+    tool_url = f"http://127.0.0.1:{tool_port}"
+
+    async def main():
+        app, saved = fake_tool(issuer, 'pb-lti-mock')
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', tool_port).start()
+        try:
+            results = await run_load(parse_args([
+                '--tool-url', tool_url,
+                '--target', f"{tool_url}/book/chapter/one/",
+                '--platform-port', str(platform_port),
+                '--user-pool', '5',
+                '--seed', '1',
+            ] + extra_args))
+        finally:
+            await runner.cleanup()
+        return results, saved
+
+    return asyncio.run(main())
+
+
+def test_ramp_runs_full_flow():
+    results, saved = run_against_fake_tool(['--ramp', '1,4', '--stage-seconds', '0.3'])
+
+    assert [stage['concurrency'] for stage in results['stages']] == [1, 4]
+    for stage in results['stages']:
+        assert stage['completed'] > 0
+        assert stage['error_rate'] == 0
+        assert set(stage['steps']) == {'login', 'authorize', 'launch', 'chapter', 'h5p_save', 'total'}
+        assert stage['steps']['launch']['p99_ms'] is not None
+
+    completed = sum(stage['completed'] for stage in results['stages'])
+    assert len(saved) == completed
+    assert {content_id for _, content_id, _ in saved} == {'5'}
+    assert {user for user, _, _ in saved} <= {str(100000 + i) for i in range(5)}
+
+
+def test_ramp_stops_over_error_budget():
+    results, _ = run_against_fake_tool([
+        '--ramp', '2,4', '--stage-seconds', '0.2', '--skip-h5p', '--max-error-rate', '0',
+        '--target', 'http://127.0.0.1:9/unreachable/chapter/',
+    ])
+
+    stage = results['stages'][0]
+    assert len(results['stages']) == 1
+    assert stage['error_rate'] > 0
+    assert 'error rate' in stage['stopped']
+    assert 'h5p_save' not in stage['steps']
+
+
+def test_parse_form_and_h5p_settings():
+    action, fields = parse_form(
+        '<form method="post" action="https://pb.test/launch">'
+        '<input type="hidden" name="id_token" value="abc"><input type="hidden" name="state" value="s">'
+        '</form>'
+    )
+    assert action == 'https://pb.test/launch'
+    assert fields == {'id_token': 'abc', 'state': 's'}
+
+    url, content_ids = parse_h5p_integration(CHAPTER_HTML)
+    assert url == '/wp-admin/admin-ajax.php?token=t&action=h5p_setFinished'
+    assert content_ids == ['5']
+    assert parse_h5p_integration('<html></html>') == (None, [])
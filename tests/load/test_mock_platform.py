@@ -0,0 +1,157 @@
+"""
+Test the mock LTI platform end to end over HTTP
+"""
+import asyncio
+import re
+import time
+
+import jwt
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from mock_platform import AGS_CLAIM, LTI_CLAIM, SCOPE_SCORE, Fault, MockPlatform
+
+ISSUER = 'http://mock-lms.test'
+TARGET = 'https://pressbooks.test/book/chapter/one/'
+
+
+@pytest.fixture(scope='module')
+def platform():
+    return MockPlatform(ISSUER, client_id='tool-client', deployment_id='7', seed=42)
+
+
+def run(platform, scenario):
+    """Run an async scenario against the platform app on an ephemeral port"""
+    async def main():
+        async with TestClient(TestServer(platform.app())) as client:
+            return await scenario(client)
+    return asyncio.run(main())
+
+
+def client_assertion(platform, aud=None):
+    now = int(time.time())
+    return jwt.encode(
+        {'iss': platform.client_id, 'sub': platform.client_id, 'aud': aud or platform.token_url,
+         'iat': now, 'exp': now + 60, 'jti': 'test'},
+        'unused-when-unverified',
+        algorithm='HS256'
+    )
+
+
+def test_auth_returns_signed_launch(platform):
+    """The form_post id_token verifies against the JWKS and carries the launch claims"""
+    login = platform.login_initiation(TARGET, 42, role='instructor', context_id='3', lineitem_id=9)
+
+    async def scenario(client):
+        jwks = await (await client.get('/mod/lti/certs.php')).json()
+        response = await client.get('/mod/lti/auth.php', params={
+            'client_id': platform.client_id,
+            'response_type': 'id_token',
+            'response_mode': 'form_post',
+            'redirect_uri': 'https://pressbooks.test/wp-json/pb-lti/v1/launch',
+            'login_hint': login['login_hint'],
+            'lti_message_hint': login['lti_message_hint'],
+            'nonce': 'n-1',
+            'state': 's-1',
+        })
+        return jwks, response.status, await response.text()
+
+    jwks, status, html = run(platform, scenario)
+    assert status == 200
+    assert 'name="state" value="s-1"' in html
+
+    id_token = re.search(r'name="id_token" value="([^"]+)"', html).group(1)
+    key = jwt.PyJWKSet.from_dict(jwks).keys[0]
+    assert key.key_id == jwt.get_unverified_header(id_token)['kid']
+
+    claims = jwt.decode(id_token, key.key, algorithms=['RS256'], audience='tool-client')
+    assert claims['sub'] == '42'
+    assert claims['nonce'] == 'n-1'
+    assert claims[LTI_CLAIM + 'deployment_id'] == '7'
+    assert claims[LTI_CLAIM + 'target_link_uri'] == TARGET
+    assert claims[LTI_CLAIM + 'roles'][0].endswith('#Instructor')
+    assert claims[AGS_CLAIM]['lineitem'] == platform.lineitem_url('3', '9')
+
+
+def test_token_and_ags_round_trip(platform):
+    """A client-credentials token lets the tool read the lineitem and post a score"""
+    lineitem = platform.lineitem_url('3', '9')
+    scores_path = '/mod/lti/services.php/3/lineitems/9/lineitem/scores?type_id=1'
+
+    async def scenario(client):
+        unauthorized = await client.post(scores_path, json={})
+
+        token = await (await client.post('/mod/lti/token.php', data={
+            'grant_type': 'client_credentials',
+            'client_assertion_type': 'urn:ietf:params:oauth:client-assertion-type:jwt-bearer',
+            'client_assertion': client_assertion(platform),
+            'scope': SCOPE_SCORE + ' https://purl.imsglobal.org/spec/lti-ags/scope/lineitem.readonly',
+        })).json()
+        headers = {'Authorization': 'Bearer ' + token['access_token']}
+
+        item = await client.get('/mod/lti/services.php/3/lineitems/9/lineitem?type_id=1', headers=headers)
+        posted = await client.post(scores_path, headers=headers, json={
+            'userId': '42', 'scoreGiven': 8, 'scoreMaximum': 10,
+            'activityProgress': 'Completed', 'gradingProgress': 'FullyGraded',
+            'timestamp': '2026-01-01T00:00:00+00:00',
+        })
+        invalid = await client.post(scores_path, headers=headers, json={
+            'userId': '42', 'scoreGiven': 11, 'scoreMaximum': 10,
+            'activityProgress': 'Completed', 'gradingProgress': 'FullyGraded',
+            'timestamp': '2026-01-01T00:00:00+00:00',
+        })
+        return unauthorized.status, await item.json(content_type=None), posted.status, invalid.status
+
+    unauthorized, item, posted, invalid = run(platform, scenario)
+    assert unauthorized == 401
+    assert item['id'] == lineitem
+    assert item['scoreMaximum'] == 100
+    assert posted == 200
+    assert invalid == 400
+    assert platform.scores[-1]['lineitem'] == lineitem
+    assert platform.scores[-1]['scoreGiven'] == 8
+
+
+def test_token_rejects_wrong_audience(platform):
+    async def scenario(client):
+        response = await client.post('/mod/lti/token.php', data={
+            'grant_type': 'client_credentials',
+            'client_assertion_type': 'urn:ietf:params:oauth:client-assertion-type:jwt-bearer',
+            'client_assertion': client_assertion(platform, aud='https://elsewhere.test/token'),
+        })
+        return response.status, await response.json()
+
+    status, body = run(platform, scenario)
+    assert status == 401
+    assert body['error'] == 'invalid_client'
+
+
+def test_injected_faults_are_recorded(platform):
+    """Error injection answers with the configured status and shows up in the latency stats"""
+    platform.reset()
+    platform.set_fault('jwks', Fault(delay=0.01, error_rate=1.0, status=502))
+
+    async def scenario(client):
+        statuses = [(await client.get('/mod/lti/certs.php')).status for _ in range(3)]
+        stats = await (await client.get('/_mock/stats')).json()
+        return statuses, stats
+
+    try:
+        statuses, stats = run(platform, scenario)
+    finally:
+        platform.set_fault('jwks', None)
+
+    assert statuses == [502, 502, 502]
+    jwks = stats['endpoints']['jwks']
+    assert jwks['count'] == 3
+    assert jwks['error_rate'] == 1.0
+    assert jwks['error_kinds'] == {'502': 3}
+    assert jwks['p50_ms'] >= 10
+
+
+def test_fault_spec_parsing():
+    fault = Fault.parse('delay=0.2,error_rate=0.05,status=500')
+    assert (fault.delay, fault.jitter, fault.error_rate, fault.status) == (0.2, 0.0, 0.05, 500)
+
+    with pytest.raises(ValueError):
+        Fault.parse('latency=1')
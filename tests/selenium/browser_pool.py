@@ -0,0 +1,221 @@
+"""
+Browser reuse and login-state caching for the Selenium suite
+
+BrowserPool keeps warm WebDriver sessions for one pytest process (each
+pytest-xdist worker has its own pool; sessions are never shared across
+processes). Browsers are reset between tests: cookies and web storage for
+every test origin are cleared, extra windows closed and frames/alerts
+dropped, so a reused browser looks like a fresh one.
+
+LoginCookieCache stores the cookies of a logged-in session per (site, user)
+as JSON in a directory shared by all xdist workers, so the login form is
+submitted once per user for the whole run. Writers take an fcntl lock, so
+two workers needing the same login don't both replay it.
+"""
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+from selenium.common.exceptions import (
+    InvalidCookieDomainException,
+    NoAlertPresentException,
+    WebDriverException,
+)
+
+STORAGE_TYPES = 'cookies,local_storage,session_storage,indexeddb,cache_storage,service_workers'
+
+
+class BrowserPool:
+    """Warm WebDriver sessions handed out one test at a time"""
+
+    def __init__(self, factory, origins, max_uses=50):
+        self.factory = factory
+        self.origins = [origin.rstrip('/') for origin in origins]
+        self.max_uses = max_uses
+        self._idle = []
+        self._uses = {}
+
+    def acquire(self):
+        """Idle browser if one is alive, otherwise a new one"""
+        while self._idle:
+            driver = self._idle.pop()
+            if self._alive(driver):
+                return driver
+            self._discard(driver)
+
+        driver = self.factory()
+        self._uses[id(driver)] = 0
+        return driver
+
+    def release(self, driver):
+        """Reset a browser and return it to the pool (or quit it if it can't be reused)"""
+        self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        if self._uses[id(driver)] >= self.max_uses:
+            self._discard(driver)
+            return
+
+        try:
+            self.reset(driver)
+        except WebDriverException:
+            self._discard(driver)
+            return
+
+        self._idle.append(driver)
+
+    def reset(self, driver):
+        """Clear cookies and storage for every test origin and return to a blank page"""
+        try:
+            driver.switch_to.alert.dismiss()
+        except NoAlertPresentException:
+            pass
+
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.switch_to.default_content()
+
+        if hasattr(driver, 'execute_cdp_cmd'):
+            # Chromium: clears every domain without navigating
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            for origin in self.origins:
+                driver.execute_cdp_cmd('Storage.clearDataForOrigin', {
+                    'origin': origin,
+                    'storageTypes': STORAGE_TYPES,
+                })
+        else:
+            # WebDriver can only clear the current document's cookies and storage
+            for origin in self.origins:
+                driver.get(origin + '/robots.txt')
+                driver.delete_all_cookies()
+                driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+
+        driver.get('about:blank')
+
+    def close(self):
+        """Quit every idle browser"""
+        while self._idle:
+            self._discard(self._idle.pop())
+
+    def _discard(self, driver):
+        self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    @staticmethod
+    def _alive(driver):
+        try:
+            driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+
+class LoginCookieCache:
+    """Authenticated cookies per (site, user), shared between xdist workers through files"""
+
+    def __init__(self, directory, ttl=1800):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    def get(self, site, username):
+        """Cached cookies, or None if missing or older than the TTL"""
+        path = self._path(site, username)
+        try:
+            entry = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        if entry.get('saved_at', 0) + self.ttl < time.time():
+            return None
+        return entry['cookies']
+
+    def set(self, site, username, cookies):
+        path = self._path(site, username)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({'saved_at': time.time(), 'cookies': cookies}))
+        tmp.replace(path)
+
+    @contextmanager
+    def lock(self, site, username):
+        """Exclusive lock so only one worker replays a given login"""
+        with open(self._path(site, username).with_suffix('.lock'), 'w') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def login(self, driver, site, username, base_url, login_form, is_logged_in):
+        """
+        Log the driver in, injecting cached cookies when possible
+
+        login_form(driver) replays the real login; is_logged_in(driver) checks
+        the session after cookies are injected. A stale entry (server-side
+        logout, expired session) falls back to the form and is replaced.
+        """
+        if self._inject(driver, base_url, self.get(site, username)) and is_logged_in(driver):
+            return False
+
+        with self.lock(site, username):
+            # Another worker may have logged in while we waited
+            if self._inject(driver, base_url, self.get(site, username)) and is_logged_in(driver):
+                return False
+
+            driver.delete_all_cookies()
+            login_form(driver)
+            self.set(site, username, self._capture(driver, base_url))
+        return True
+
+    @staticmethod
+    def _capture(driver, base_url):
+        """Every cookie for the site, including ones scoped to other paths (e.g. WordPress' /wp-admin)"""
+        host = urlparse(base_url).hostname
+        if not hasattr(driver, 'execute_cdp_cmd'):
+            return driver.get_cookies()
+
+        cookies = []
+        for raw in driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']:
+            if not _domain_matches(host, raw['domain']):
+                continue
+            cookie = {key: raw[key] for key in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly')}
+            if not raw.get('session') and raw.get('expires', -1) > 0:
+                cookie['expiry'] = int(raw['expires'])
+            if raw.get('sameSite'):
+                cookie['sameSite'] = raw['sameSite']
+            cookies.append(cookie)
+        return cookies
+
+    @staticmethod
+    def _inject(driver, base_url, cookies):
+        if not cookies:
+            return False
+
+        # Cookies can only be added for the current document's domain
+        driver.get(base_url.rstrip('/') + '/robots.txt')
+        host = urlparse(base_url).hostname
+        for cookie in cookies:
+            if cookie.get('domain') and not _domain_matches(host, cookie['domain']):
+                continue
+            try:
+                driver.add_cookie(cookie)
+            except InvalidCookieDomainException:
+                # Host-only cookies are rejected by some drivers when a domain is given
+                driver.add_cookie({k: v for k, v in cookie.items() if k != 'domain'})
+        return True
+
+    def _path(self, site, username):
+        safe = ''.join(c if c.isalnum() else '_' for c in f"{site}_{username}")
+        return self.directory / f"{safe}.json"
+
+
+def _domain_matches(host, domain):
+    domain = domain.lstrip('.')
+    return host == domain or host.endswith('.' + domain)
@@ -8,9 +8,15 @@ from pathlib import Path
 from dotenv import load_dotenv
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
+from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
+from browser_pool import BrowserPool, LoginCookieCache
+from page_objects.base_page import enable_performance_capture
+from performance_log import PerformanceLog
+
 # Load environment variables
 load_dotenv()
 
@@ -21,6 +27,25 @@ SELENIUM_TIMEOUT = int(os.getenv('SELENIUM_TIMEOUT', '30'))
 SELENIUM_HEADLESS = os.getenv('SELENIUM_HEADLESS', 'true').lower() == 'true'
 SELENIUM_BROWSER = os.getenv('SELENIUM_BROWSER', 'chrome')
 SCREENSHOT_DIR = os.getenv('SCREENSHOT_DIR', './screenshots')
+SELENIUM_REUSE_BROWSER = os.getenv('SELENIUM_REUSE_BROWSER', 'true').lower() == 'true'
+SELENIUM_BROWSER_MAX_USES = int(os.getenv('SELENIUM_BROWSER_MAX_USES', '50'))
+SELENIUM_LOGIN_CACHE = os.getenv('SELENIUM_LOGIN_CACHE', 'true').lower() == 'true'
+SELENIUM_LOGIN_CACHE_TTL = int(os.getenv('SELENIUM_LOGIN_CACHE_TTL', '1800'))
+PERF_BUDGETS_FILE = os.getenv('PERF_BUDGETS_FILE', str(Path(__file__).parent / 'perf_budgets.json'))
+PERF_BUDGET_SCALE = float(os.getenv('PERF_BUDGET_SCALE', '1.0'))
+PERF_ENFORCE_BUDGETS = os.getenv('PERF_ENFORCE_BUDGETS', 'true').lower() == 'true'
+# Default: performance.json next to the HTML report
+PERF_REPORT_FILE = os.getenv('PERF_REPORT_FILE')
+
+PERF_LOG_KEY = pytest.StashKey[PerformanceLog]()
+
+# Role name => (site, test_config account key) for login_as()
+ROLE_ACCOUNTS = {
+    'student': ('moodle', 'moodle_student'),
+    'instructor': ('moodle', 'moodle_instructor'),
+    'admin': ('moodle', 'moodle_admin'),
+    'pressbooks_admin': ('pressbooks', 'pressbooks_admin'),
+}
 
 # Create screenshot directory
 Path(SCREENSHOT_DIR).mkdir(parents=True, exist_ok=True)
@@ -52,9 +77,8 @@ def test_config():
     }
 
 
-@pytest.fixture(scope="function")
-def driver(request):
-    """WebDriver fixture - creates and tears down browser instance"""
+def create_driver():
+    """Start a new browser with the suite's options"""
 
     # Configure browser options
     if SELENIUM_BROWSER == 'chrome':
@@ -86,19 +110,52 @@ def driver(request):
     driver_instance.implicitly_wait(int(os.getenv('SELENIUM_IMPLICIT_WAIT', '10')))
     driver_instance.set_page_load_timeout(SELENIUM_TIMEOUT)
 
+    # H5P ready observer and DevTools performance metrics (Chromium only)
+    enable_performance_capture(driver_instance)
+
+    return driver_instance
+
+
+@pytest.fixture(scope="session")
+def browser_pool():
+    """Warm browsers reused across tests in this process (one pool per xdist worker)"""
+    pool = BrowserPool(create_driver, [MOODLE_URL, PRESSBOOKS_URL], max_uses=SELENIUM_BROWSER_MAX_USES)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture(scope="session")
+def login_cache(tmp_path_factory):
+    """Authenticated cookies per user, shared by all xdist workers in this run"""
+    base = tmp_path_factory.getbasetemp()
+    # Under xdist each worker gets basetemp/popen-gwN; the parent is common to the run
+    shared = base.parent if os.getenv('PYTEST_XDIST_WORKER') else base
+    return LoginCookieCache(shared / 'login-cookies', ttl=SELENIUM_LOGIN_CACHE_TTL)
+
+
+@pytest.fixture(scope="function")
+def driver(request, browser_pool):
+    """WebDriver fixture - a pooled browser with no cookies or storage from earlier tests"""
+
+    driver_instance = browser_pool.acquire() if SELENIUM_REUSE_BROWSER else create_driver()
+
     # Yield driver to test
     yield driver_instance
 
     # Teardown: Take screenshot on failure
-    if request.node.rep_call.failed and os.getenv('SCREENSHOT_ON_FAILURE', 'true').lower() == 'true':
+    rep_call = getattr(request.node, 'rep_call', None)
+    if rep_call and rep_call.failed and os.getenv('SCREENSHOT_ON_FAILURE', 'true').lower() == 'true':
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         screenshot_name = f"{request.node.name}_{timestamp}.png"
         screenshot_path = os.path.join(SCREENSHOT_DIR, screenshot_name)
         driver_instance.save_screenshot(screenshot_path)
         print(f"Screenshot saved: {screenshot_path}")
 
-    # Quit browser
-    driver_instance.quit()
+    # Reset and return to the pool (or quit when reuse is off)
+    if SELENIUM_REUSE_BROWSER:
+        browser_pool.release(driver_instance)
+    else:
+        driver_instance.quit()
 
 
 @pytest.hookimpl(hookwrapper=True)
@@ -109,6 +166,62 @@ def pytest_runtest_makereport(item, call):
     setattr(item, f"rep_{rep.when}", rep)
 
 
+def pytest_configure(config):
+    """Performance log for this process, with budgets loaded once"""
+    config.stash[PERF_LOG_KEY] = PerformanceLog.from_file(PERF_BUDGETS_FILE, scale=PERF_BUDGET_SCALE)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """xdist controller: collect the performance records of a finished worker"""
+    records = getattr(node, 'workeroutput', {}).get('perf_records')
+    if records:
+        node.config.stash[PERF_LOG_KEY].records.extend(records)
+
+
+def pytest_sessionfinish(session):
+    """Write performance records next to the HTML report (workers hand theirs to the controller)"""
+    config = session.config
+    log = config.stash[PERF_LOG_KEY]
+
+    if hasattr(config, 'workeroutput'):
+        config.workeroutput['perf_records'] = log.records
+        return
+
+    if not log.records:
+        return
+
+    html_path = config.getoption('htmlpath', None) or 'reports/report.html'
+    path = PERF_REPORT_FILE or os.path.join(os.path.dirname(html_path), 'performance.json')
+    log.write(
+        path,
+        browser=SELENIUM_BROWSER,
+        headless=SELENIUM_HEADLESS,
+        moodle_url=MOODLE_URL,
+        pressbooks_url=PRESSBOOKS_URL,
+    )
+    print(f"\nPerformance report: {path}")
+
+
+@pytest.fixture(scope="function")
+def perf(request):
+    """Record a performance capture for this test; fails the test if it is over budget"""
+    log = request.config.stash[PERF_LOG_KEY]
+
+    def _record(name, metrics):
+        violations = log.record(request.node.nodeid, name, metrics)
+        timings = ', '.join(f"{key}={value}" for key, value in metrics.get('timings', {}).items())
+        print(f"Performance ({name}): {timings}")
+
+        if violations and PERF_ENFORCE_BUDGETS:
+            pytest.fail(f"Performance budget exceeded for '{name}': " + '; '.join(violations))
+        for violation in violations:
+            print(f"⚠️ Over budget ({name}): {violation}")
+        return metrics
+
+    return _record
+
+
 @pytest.fixture(scope="function")
 def wait(driver):
     """WebDriverWait fixture"""
@@ -116,29 +229,37 @@ def wait(driver):
 
 
 @pytest.fixture(scope="function")
-def moodle_login(driver, test_config):
-    """Login to Moodle as specified user"""
+def moodle_login(driver, test_config, login_cache):
+    """Login to Moodle as specified user (cached session cookies are reused when still valid)"""
+    moodle_url = test_config['moodle_url']
+
+    def _is_logged_in(driver):
+        driver.get(f"{moodle_url}/my/")
+        return '/login/' not in driver.current_url
+
     def _login(username, password):
-        driver.get(f"{test_config['moodle_url']}/login/index.php")
+        def submit_form(driver):
+            driver.get(f"{moodle_url}/login/index.php")
 
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.support import expected_conditions as EC
-        from selenium.webdriver.support.ui import WebDriverWait
+            wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
 
-        wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
+            # Wait for login form
+            username_field = wait.until(
+                EC.presence_of_element_located((By.ID, "username"))
+            )
 
-        # Wait for login form
-        username_field = wait.until(
-            EC.presence_of_element_located((By.ID, "username"))
-        )
+            # Enter credentials
+            username_field.send_keys(username)
+            driver.find_element(By.ID, "password").send_keys(password)
+            driver.find_element(By.ID, "loginbtn").click()
 
-        # Enter credentials
-        username_field.send_keys(username)
-        driver.find_element(By.ID, "password").send_keys(password)
-        driver.find_element(By.ID, "loginbtn").click()
+            # Wait for dashboard or redirect
+            wait.until(EC.url_contains(moodle_url))
 
-        # Wait for dashboard or redirect
-        wait.until(EC.url_contains(test_config['moodle_url']))
+        if SELENIUM_LOGIN_CACHE:
+            login_cache.login(driver, 'moodle', username, moodle_url, submit_form, _is_logged_in)
+        else:
+            submit_form(driver)
 
         return driver
 
@@ -146,30 +267,50 @@ def moodle_login(driver, test_config):
 
 
 @pytest.fixture(scope="function")
-def pressbooks_login(driver, test_config):
-    """Login to Pressbooks as admin"""
+def pressbooks_login(driver, test_config, login_cache):
+    """Login to Pressbooks as admin (cached session cookies are reused when still valid)"""
+    pressbooks_url = test_config['pressbooks_url']
+
+    def _is_logged_in(driver):
+        driver.get(f"{pressbooks_url}/wp-admin/")
+        return 'wp-login.php' not in driver.current_url
+
     def _login(username, password):
-        driver.get(f"{test_config['pressbooks_url']}/wp-login.php")
+        def submit_form(driver):
+            driver.get(f"{pressbooks_url}/wp-login.php")
 
-        from selenium.webdriver.common.by import By
-        from selenium.webdriver.support import expected_conditions as EC
-        from selenium.webdriver.support.ui import WebDriverWait
+            wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
 
-        wait = WebDriverWait(driver, SELENIUM_TIMEOUT)
+            # Wait for login form
+            username_field = wait.until(
+                EC.presence_of_element_located((By.ID, "user_login"))
+            )
 
-        # Wait for login form
-        username_field = wait.until(
-            EC.presence_of_element_located((By.ID, "user_login"))
-        )
+            # Enter credentials
+            username_field.send_keys(username)
+            driver.find_element(By.ID, "user_pass").send_keys(password)
+            driver.find_element(By.ID, "wp-submit").click()
 
-        # Enter credentials
-        username_field.send_keys(username)
-        driver.find_element(By.ID, "user_pass").send_keys(password)
-        driver.find_element(By.ID, "wp-submit").click()
+            # Wait for dashboard
+            wait.until(EC.url_contains("wp-admin"))
 
-        # Wait for dashboard
-        wait.until(EC.url_contains("wp-admin"))
+        if SELENIUM_LOGIN_CACHE:
+            login_cache.login(driver, 'pressbooks', username, pressbooks_url, submit_form, _is_logged_in)
+        else:
+            submit_form(driver)
 
         return driver
 
     return _login
+
+
+@pytest.fixture(scope="function")
+def login_as(test_config, moodle_login, pressbooks_login):
+    """Login by role: student, instructor, admin (Moodle) or pressbooks_admin"""
+    def _login(role):
+        site, account = ROLE_ACCOUNTS[role]
+        credentials = test_config[account]
+        login = moodle_login if site == 'moodle' else pressbooks_login
+        return login(credentials['username'], credentials['password'])
+
+    return _login
@@ -1,9 +1,136 @@
 """
 Base Page Object - Common functionality for all pages
 """
+import re
+import time
+
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+# Resource Timing entries of a window, shifted onto the top document's timeline
+RESOURCE_ENTRIES_JS = """
+function pbLtiResources(perf, offset) {
+    return perf.getEntriesByType('resource').map(function (e) {
+        return {name: e.name, type: e.initiatorType, start: e.startTime + offset, duration: e.duration,
+                transfer_size: e.transferSize || 0, decoded_size: e.decodedBodySize || 0};
+    });
+}
+"""
+
+# Runs in every new top-level document (Chromium, via CDP): notes when each
+# H5P iframe's content is initialised, so the time isn't limited by polling
+PERFORMANCE_OBSERVER_JS = """
+(function () {
+    if (window.top !== window || window.__pbLtiPerf) { return; }
+    var state = window.__pbLtiPerf = {h5pReady: {}};
+    if (performance.setResourceTimingBufferSize) { performance.setResourceTimingBufferSize(1000); }
+    (function poll() {
+        var frames = document.querySelectorAll('iframe.h5p-iframe'), pending = 0;
+        for (var i = 0; i < frames.length; i++) {
+            var key = frames[i].id || String(i), doc = frames[i].contentDocument;
+            if (key in state.h5pReady) { continue; }
+            if (doc && doc.querySelector('.h5p-content.h5p-initialized')) {
+                state.h5pReady[key] = performance.now();
+            } else {
+                pending++;
+            }
+        }
+        var settled = document.readyState === 'complete' && frames.length && !pending;
+        if (!settled && performance.now() < 120000) { setTimeout(poll, 20); }
+    })();
+})();
+"""
+
+LAUNCH_TIMING_JS = RESOURCE_ENTRIES_JS + """
+var nav = performance.getEntriesByType('navigation')[0], paint = {};
+performance.getEntriesByType('paint').forEach(function (p) { paint[p.name] = p.startTime; });
+return {
+    url: window.location.href,
+    time_origin: performance.timeOrigin,
+    navigation: nav ? nav.toJSON() : null,
+    paint: paint,
+    resources: pbLtiResources(performance, 0)
+};
+"""
+
+# null until every H5P iframe on the page has initialised content
+H5P_READY_JS = RESOURCE_ENTRIES_JS + """
+var state = window.__pbLtiPerf, frames = document.querySelectorAll('iframe.h5p-iframe'), result = [];
+if (!frames.length) { return null; }
+for (var i = 0; i < frames.length; i++) {
+    var key = frames[i].id || String(i), win = frames[i].contentWindow, doc = frames[i].contentDocument;
+    if (!doc || !doc.querySelector('.h5p-content.h5p-initialized')) { return null; }
+    if (state && !(key in state.h5pReady)) { return null; }
+    result.push({
+        id: key,
+        ready: state ? state.h5pReady[key] : performance.now(),
+        resources: pbLtiResources(win.performance, win.performance.timeOrigin - performance.timeOrigin)
+    });
+}
+return {frames: result, precise: !!state, time_origin: performance.timeOrigin};
+"""
+
+# Chrome DevTools Performance.getMetrics name => capture key (durations are seconds)
+CDP_METRICS = {
+    'TaskDuration': 'task_ms',
+    'ScriptDuration': 'script_ms',
+    'LayoutDuration': 'layout_ms',
+    'RecalcStyleDuration': 'recalc_style_ms',
+    'LayoutCount': 'layout_count',
+    'RecalcStyleCount': 'recalc_style_count',
+    'JSHeapUsedSize': 'js_heap_used_bytes',
+    'Nodes': 'dom_nodes',
+    'Frames': 'frames',
+}
+
+# Navigation Timing marks reported relative to the chapter's navigation start
+NAVIGATION_MARKS = {
+    'ttfb_ms': 'responseStart',
+    'dom_interactive_ms': 'domInteractive',
+    'dom_content_loaded_ms': 'domContentLoadedEventEnd',
+    'load_ms': 'loadEventEnd',
+}
+
+
+def enable_performance_capture(driver):
+    """
+    Prepare a new browser for performance captures (Chromium only)
+
+    Registers the H5P ready observer for every document and starts the
+    DevTools Performance domain so its durations cover the whole session.
+    Other browsers fall back to polling, so H5P ready times are upper bounds.
+    """
+    if not hasattr(driver, 'execute_cdp_cmd'):
+        return False
+    driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': PERFORMANCE_OBSERVER_JS})
+    driver.execute_cdp_cmd('Performance.enable', {})
+    return True
+
+
+def summarize_resources(entries, slowest=5):
+    """Count, bytes and slowest requests from Resource Timing entries"""
+    by_type = {}
+    for entry in entries:
+        totals = by_type.setdefault(entry['type'], {'count': 0, 'transfer_bytes': 0})
+        totals['count'] += 1
+        totals['transfer_bytes'] += entry['transfer_size']
+
+    ranked = sorted(entries, key=lambda entry: entry['duration'], reverse=True)
+    return {
+        'count': len(entries),
+        'transfer_bytes': sum(entry['transfer_size'] for entry in entries),
+        'end_ms': _ms(max((entry['start'] + entry['duration'] for entry in entries), default=None)),
+        'by_type': by_type,
+        'slowest': [
+            {'name': entry['name'], 'type': entry['type'], 'duration_ms': _ms(entry['duration'])}
+            for entry in ranked[:slowest]
+        ],
+    }
+
+
+def _ms(value):
+    return round(value, 1) if value is not None else None
 
 
 class BasePage:
@@ -81,3 +208,182 @@ class BasePage:
         """Get severe console errors"""
         logs = self.get_console_logs()
         return [log for log in logs if log['level'] == 'SEVERE']
+
+    def wait_for_ajax_idle(self, timeout=None):
+        """Wait until the current document (or H5P iframe) has no jQuery requests in flight"""
+        WebDriverWait(self.driver, timeout or self.timeout).until(lambda d: d.execute_script(
+            "var $ = (window.H5P && H5P.jQuery) || window.jQuery;"
+            "return !$ || $.active === 0;"
+        ))
+
+    def current_post_id(self):
+        """WordPress post ID of the current page (postid-N body class)"""
+        self.driver.switch_to.default_content()
+        classes = self.driver.execute_script("return document.body.className;")
+        match = re.search(r'\bpostid-(\d+)\b', classes or '')
+        return int(match.group(1)) if match else None
+
+    def grade_sync_status(self, post_id=None, user_id=None):
+        """
+        Latest grade sync log entry for a chapter (None if never synced)
+
+        Calls the plugin's pb_lti_grade_sync_status endpoint from the page, so
+        the browser's login is used. Defaults to the current chapter and the
+        logged-in user. Leaves the driver in the top-level document.
+        """
+        post_id = post_id or self.current_post_id()
+        if not post_id:
+            raise ValueError("No post ID given and none found on the current page")
+
+        self.driver.switch_to.default_content()
+        response = self.driver.execute_async_script("""
+            var postId = arguments[0], userId = arguments[1], done = arguments[arguments.length - 1];
+            var api = document.querySelector('link[rel="https://api.w.org/"]');
+            var base = api ? api.href.replace(/wp-json\\/?$/, '') : window.location.origin + '/';
+            var params = new URLSearchParams({action: 'pb_lti_grade_sync_status', post_id: postId});
+            if (userId) { params.set('user_id', userId); }
+            fetch(base + 'wp-admin/admin-ajax.php?' + params.toString(), {credentials: 'same-origin'})
+                .then(function (r) { return r.json(); })
+                .then(done)
+                .catch(function (e) { done({success: false, data: {message: String(e)}}); });
+        """, post_id, user_id)
+
+        if not response or not response.get('success'):
+            message = (response or {}).get('data', {}).get('message', 'no response')
+            raise RuntimeError(f"Grade sync status request failed: {message}")
+        return response['data']['entry']
+
+    def wait_for_grade_sync(self, post_id=None, status='success', after_id=0, user_id=None,
+                            timeout=60, initial_delay=0.5, max_delay=5.0, backoff=1.5):
+        """
+        Poll the grade sync log until an entry newer than after_id reaches `status`
+
+        Pass the id of the entry seen before the activity was completed as
+        after_id so an earlier sync doesn't count. Returns the entry; fails
+        fast if the new entry has a different final status (e.g. 'failed').
+        """
+        post_id = post_id or self.current_post_id()
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        entry = None
+
+        while True:
+            entry = self.grade_sync_status(post_id, user_id)
+            if entry and entry['id'] > after_id:
+                if entry['status'] == status:
+                    return entry
+                raise AssertionError(
+                    f"Grade sync for post {post_id} ended with status '{entry['status']}'"
+                    f" (expected '{status}'): {entry.get('error_message')}"
+                )
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutException(
+                    f"No '{status}' grade sync for post {post_id} within {timeout}s (last entry: {entry})"
+                )
+            time.sleep(min(delay, remaining))
+            delay = min(delay * backoff, max_delay)
+
+    def launch_clock(self):
+        """Browser clock (epoch ms) to take just before clicking an LTI activity"""
+        return self.driver.execute_script("return performance.timeOrigin + performance.now();")
+
+    def capture_launch_performance(self, launched_at=None, paint_timeout=5):
+        """
+        Navigation, paint and resource timing of the page an LTI launch landed on
+
+        Timings are ms from the chapter's navigation start. With launched_at
+        (launch_clock() taken before the Moodle click), handshake_ms covers
+        the OIDC login/launch redirects up to that navigation, and the
+        launch_to_* timings run from the click. Waits for the load event.
+        """
+        self.driver.switch_to.default_content()
+        self.wait.until(lambda d: d.execute_script("return document.readyState;") == 'complete')
+        try:
+            WebDriverWait(self.driver, paint_timeout, poll_frequency=0.1).until(
+                lambda d: d.execute_script("return performance.getEntriesByType('paint').length > 0;")
+            )
+        except TimeoutException:
+            pass  # Nothing painted yet; paint timings stay None
+
+        raw = self.driver.execute_script(LAUNCH_TIMING_JS)
+        nav = raw['navigation'] or {}
+
+        timings = {key: _ms(nav.get(mark) or None) for key, mark in NAVIGATION_MARKS.items()}
+        timings['server_ms'] = _ms(nav['responseStart'] - nav['requestStart']) if nav else None
+        timings['redirect_ms'] = _ms(nav['redirectEnd'] - nav['redirectStart']) if nav else None
+        timings['first_paint_ms'] = _ms(raw['paint'].get('first-paint'))
+        timings['first_contentful_paint_ms'] = _ms(raw['paint'].get('first-contentful-paint'))
+
+        if launched_at is not None:
+            handshake = raw['time_origin'] - launched_at
+            timings['handshake_ms'] = _ms(handshake)
+            for key in ('first_paint_ms', 'first_contentful_paint_ms', 'dom_content_loaded_ms', 'load_ms'):
+                value = timings[key]
+                timings[f"launch_to_{key}"] = _ms(handshake + value) if value is not None else None
+
+        return {
+            'url': raw['url'],
+            'timings': timings,
+            'navigation': {
+                'type': nav.get('type'),
+                'redirect_count': nav.get('redirectCount'),
+                'transfer_size': nav.get('transferSize'),
+                'decoded_body_size': nav.get('decodedBodySize'),
+                'protocol': nav.get('nextHopProtocol'),
+            },
+            'resources': summarize_resources(raw['resources']),
+            'cdp': self.cdp_metrics(),
+        }
+
+    def capture_h5p_performance(self, launched_at=None, timeout=None):
+        """
+        Time until every H5P iframe on the page has initialised content
+
+        h5p_ready_ms is from the chapter's navigation start (launch_to_h5p_ready_ms
+        from the Moodle click when launched_at is given). Resource totals cover
+        what the iframes loaded themselves (H5P libraries and media). Leaves
+        the driver in the top-level document.
+        """
+        self.driver.switch_to.default_content()
+        raw = WebDriverWait(self.driver, timeout or self.timeout, poll_frequency=0.05).until(
+            lambda d: d.execute_script(H5P_READY_JS)
+        )
+
+        ready = [frame['ready'] for frame in raw['frames']]
+        resources = [entry for frame in raw['frames'] for entry in frame['resources']]
+        timings = {
+            'first_h5p_ready_ms': _ms(min(ready)),
+            'h5p_ready_ms': _ms(max(ready)),
+        }
+        if launched_at is not None:
+            timings['launch_to_h5p_ready_ms'] = _ms(raw['time_origin'] - launched_at + max(ready))
+
+        return {
+            'url': self.driver.current_url,
+            'timings': timings,
+            'iframes': len(raw['frames']),
+            # False when the observer isn't installed: ready times are when polling noticed
+            'precise': raw['precise'],
+            'resources': summarize_resources(resources),
+            'cdp': self.cdp_metrics(),
+        }
+
+    def cdp_metrics(self):
+        """Chrome DevTools Performance.getMetrics for the tab ({} on browsers without CDP)"""
+        if not hasattr(self.driver, 'execute_cdp_cmd'):
+            return {}
+        try:
+            raw = self.driver.execute_cdp_cmd('Performance.getMetrics', {})
+        except WebDriverException:
+            # Browser started without enable_performance_capture()
+            self.driver.execute_cdp_cmd('Performance.enable', {})
+            raw = self.driver.execute_cdp_cmd('Performance.getMetrics', {})
+
+        values = {metric['name']: metric['value'] for metric in raw['metrics']}
+        return {
+            key: _ms(values[name] * 1000) if key.endswith('_ms') else values[name]
+            for name, key in CDP_METRICS.items()
+            if name in values
+        }
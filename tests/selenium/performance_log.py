@@ -0,0 +1,101 @@
+"""
+Performance records and regression budgets for the Selenium suite
+
+Tests hand BasePage captures (see capture_launch_performance and
+capture_h5p_performance) to the `perf` fixture, which records them here and
+checks their `timings` against the budgets for that capture name. At the end
+of the run the records are written as JSON next to the HTML report; under
+pytest-xdist each worker sends its records to the controller, which writes
+the single file.
+
+Budgets are a JSON object of capture name => {timing key: max ms}, e.g.
+{"launch": {"launch_to_first_paint_ms": 5000}}.
+"""
+import json
+import math
+import os
+from datetime import datetime
+from pathlib import Path
+
+
+class PerformanceLog:
+    """Performance captures for one pytest process, checked against budgets"""
+
+    def __init__(self, budgets=None, scale=1.0):
+        self.budgets = budgets or {}
+        self.scale = scale
+        self.records = []
+
+    @classmethod
+    def from_file(cls, path, scale=1.0):
+        """Budgets from a JSON file (no budgets if the file doesn't exist)"""
+        try:
+            budgets = json.loads(Path(path).read_text())
+        except FileNotFoundError:
+            budgets = {}
+        return cls(budgets, scale)
+
+    def check(self, name, metrics):
+        """Budget violations for a capture, as readable strings"""
+        timings = metrics.get('timings', {})
+        violations = []
+        for key, budget in self.budgets.get(name, {}).items():
+            value = timings.get(key)
+            limit = budget * self.scale
+            if value is not None and value > limit:
+                violations.append(f"{key} {value:.0f}ms > {limit:.0f}ms")
+        return violations
+
+    def record(self, test, name, metrics):
+        """Store a capture for a test and return its budget violations"""
+        violations = self.check(name, metrics)
+        self.records.append({
+            'test': test,
+            'name': name,
+            'worker': os.getenv('PYTEST_XDIST_WORKER', 'master'),
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+            'metrics': metrics,
+            'violations': violations,
+        })
+        return violations
+
+    def summary(self):
+        """p50/p95/max of every timing, per capture name"""
+        values = {}
+        for record in self.records:
+            for key, value in record['metrics'].get('timings', {}).items():
+                if value is not None:
+                    values.setdefault(record['name'], {}).setdefault(key, []).append(value)
+
+        return {
+            name: {
+                key: {
+                    'count': len(samples),
+                    'p50_ms': _percentile(samples, 50),
+                    'p95_ms': _percentile(samples, 95),
+                    'max_ms': max(samples),
+                }
+                for key, samples in timings.items()
+            }
+            for name, timings in values.items()
+        }
+
+    def write(self, path, **context):
+        """Write every record, the budgets and a summary as JSON"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            **context,
+            'budgets': self.budgets,
+            'budget_scale': self.scale,
+            'summary': self.summary(),
+            'records': self.records,
+        }, indent=2))
+        return path
+
+
+def _percentile(samples, percent):
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
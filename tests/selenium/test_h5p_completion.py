@@ -1,18 +1,27 @@
 """
 Test H5P Activity Completion and Grade Sync
 """
+import os
 import pytest
 import time
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 
+from page_objects.base_page import BasePage
+
+# How long the grade may take to reach the LMS (outbox worker + AGS round trip)
+GRADE_SYNC_TIMEOUT = int(os.getenv('GRADE_SYNC_TIMEOUT', '120'))
+
+# Deliberate idle time for the session persistence test (simulates a student working)
+SESSION_IDLE_SECONDS = int(os.getenv('H5P_SESSION_IDLE_SECONDS', '10'))
+
 
 class TestH5PCompletion:
     """Test H5P activity completion and grade synchronization"""
 
     @pytest.mark.smoke
     @pytest.mark.h5p
-    def test_h5p_completion_no_errors(self, driver, wait, moodle_login, test_config):
+    def test_h5p_completion_no_errors(self, driver, wait, moodle_login, test_config, perf):
         """Test that H5P completion does NOT show 'no user logged in' error"""
 
         # Step 1: Launch from Moodle as student
@@ -26,9 +35,13 @@ class TestH5PCompletion:
         lti_activity = wait.until(
             EC.element_to_be_clickable((By.CSS_SELECTOR, "a[href*='mod/lti/view.php']"))
         )
+        chapter_page = BasePage(driver)
+        launched_at = chapter_page.launch_clock()
         lti_activity.click()
 
         wait.until(EC.url_contains(test_config['pressbooks_url']))
+        wait.until(EC.url_contains('lti_launch=1'))
+        perf('launch', chapter_page.capture_launch_performance(launched_at))
 
         # Step 2: Find H5P activity iframe
         try:
@@ -37,6 +50,9 @@ class TestH5PCompletion:
             )
             print("✅ H5P activity found")
 
+            # Launch to H5P ready timing (before switching into the iframe)
+            perf('h5p', chapter_page.capture_h5p_performance(launched_at))
+
             # Switch to H5P iframe
             driver.switch_to.frame(h5p_iframe)
 
@@ -53,13 +69,17 @@ class TestH5PCompletion:
             try:
                 answer_option = driver.find_element(By.CSS_SELECTOR, ".h5p-joubelui-button")
                 answer_option.click()
-                time.sleep(1)
 
-                # Click check/submit button
-                submit_button = driver.find_element(By.CSS_SELECTOR, ".h5p-question-check-answer")
+                # Click check/submit button once it is enabled
+                submit_button = wait.until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, ".h5p-question-check-answer"))
+                )
                 submit_button.click()
                 print("✅ H5P activity completed")
 
+                # Wait for the result save request to finish
+                chapter_page.wait_for_ajax_idle()
+
             except Exception as e:
                 print(f"ℹ️ Could not interact with specific H5P type: {e}")
                 # Different H5P types have different interactions
@@ -68,9 +88,6 @@ class TestH5PCompletion:
             # Step 5: Switch back to main content
             driver.switch_to.default_content()
 
-            # Step 6: Wait a bit for AJAX save to complete
-            time.sleep(3)
-
             # Step 7: Check for "no user logged in" error
             page_source = driver.page_source.lower()
 
@@ -127,7 +144,13 @@ class TestH5PCompletion:
 
         wait.until(EC.url_contains(test_config['pressbooks_url']))
 
+        # Note the last sync for this chapter so an earlier one doesn't count
+        chapter_page = BasePage(driver)
+        post_id = chapter_page.current_post_id()
+        previous_sync = chapter_page.grade_sync_status(post_id) if post_id else None
+
         # Try to complete H5P if present
+        completed = False
         try:
             h5p_iframe = wait.until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, "iframe.h5p-iframe"))
@@ -138,10 +161,12 @@ class TestH5PCompletion:
             try:
                 answer = driver.find_element(By.CSS_SELECTOR, ".h5p-joubelui-button")
                 answer.click()
-                time.sleep(1)
 
-                submit = driver.find_element(By.CSS_SELECTOR, ".h5p-question-check-answer")
+                submit = wait.until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, ".h5p-question-check-answer"))
+                )
                 submit.click()
+                completed = True
                 print("✅ H5P activity completed")
 
             except:
@@ -149,13 +174,19 @@ class TestH5PCompletion:
 
             driver.switch_to.default_content()
 
-            # Wait for grade sync (AGS is async)
-            time.sleep(5)
-
         except:
             print("ℹ️ No H5P activity to complete")
             pytest.skip("No H5P activity found")
 
+        # Wait for grade sync (AGS is async) - returns as soon as the score lands
+        if completed and post_id:
+            entry = chapter_page.wait_for_grade_sync(
+                post_id,
+                after_id=previous_sync['id'] if previous_sync else 0,
+                timeout=GRADE_SYNC_TIMEOUT
+            )
+            print(f"✅ Grade synced to LMS: {entry['score_sent']}/{entry['max_score']}")
+
         # Step 2: Navigate to Moodle gradebook
         driver.get(f"{test_config['moodle_url']}/grade/report/user/index.php?id={course_id}")
 
@@ -216,7 +247,7 @@ class TestH5PCompletion:
         print(f"✅ Initial launch URL: {initial_url}")
 
         # Step 2: Wait for simulated activity time (user working on H5P)
-        time.sleep(10)
+        time.sleep(SESSION_IDLE_SECONDS)
 
         # Step 3: Verify still logged in - reload page
         driver.refresh()
@@ -5,13 +5,15 @@ import pytest
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 
+from page_objects.base_page import BasePage
+
 
 class TestLTILaunch:
     """Test LTI launch flow from Moodle to Pressbooks"""
 
     @pytest.mark.smoke
     @pytest.mark.lti_launch
-    def test_student_launch_to_chapter(self, driver, wait, moodle_login, test_config):
+    def test_student_launch_to_chapter(self, driver, wait, moodle_login, test_config, perf):
         """Test student launching a chapter from Moodle"""
 
         # Step 1: Login to Moodle as student
@@ -31,11 +33,17 @@ class TestLTILaunch:
 
         activity_name = lti_activity.text
         print(f"Clicking LTI activity: {activity_name}")
+        page = BasePage(driver)
+        launched_at = page.launch_clock()
         lti_activity.click()
 
         # Step 4: Wait for LTI launch to complete
         # Should redirect to Pressbooks
         wait.until(EC.url_contains(test_config['pressbooks_url']))
+        wait.until(EC.url_contains('lti_launch=1'))
+
+        # Launch timing (Moodle click -> chapter paint), checked against the budgets
+        perf('launch', page.capture_launch_performance(launched_at))
 
         # Step 5: Verify we're on Pressbooks
         assert test_config['pressbooks_url'] in driver.current_url
@@ -66,7 +74,7 @@ class TestLTILaunch:
         print("✅ No critical JavaScript errors")
 
 
-    def test_instructor_launch_to_chapter(self, driver, wait, moodle_login, test_config):
+    def test_instructor_launch_to_chapter(self, driver, wait, moodle_login, test_config, perf):
         """Test instructor launching a chapter from Moodle"""
 
         # Step 1: Login to Moodle as instructor
@@ -82,10 +90,14 @@ class TestLTILaunch:
         lti_activity = wait.until(
             EC.element_to_be_clickable((By.CSS_SELECTOR, "a[href*='mod/lti/view.php']"))
         )
+        page = BasePage(driver)
+        launched_at = page.launch_clock()
         lti_activity.click()
 
         # Step 4: Wait for Pressbooks
         wait.until(EC.url_contains(test_config['pressbooks_url']))
+        wait.until(EC.url_contains('lti_launch=1'))
+        perf('launch', page.capture_launch_performance(launched_at))
 
         # Step 5: Verify launch
         assert test_config['pressbooks_url'] in driver.current_url